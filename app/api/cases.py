@@ -8,6 +8,7 @@ from pydantic import BaseModel
 from app.models.database import Case, User
 from app.db.session import get_async_db
 from app.api.auth import get_current_user
+from app.services.case_store import get_case_store
 
 router = APIRouter(prefix="/api/cases", tags=["病例管理"])
 
@@ -187,6 +188,9 @@ async def update_case(
     await db.commit()
     await db.refresh(case)
 
+    # 病例内容变化，使对话缓存失效
+    get_case_store().invalidate(case_id)
+
     return case
 
 
@@ -210,6 +214,8 @@ async def delete_case(
     await db.delete(case)
     await db.commit()
 
+    get_case_store().invalidate(case_id)
+
     return None
 
 
@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Dict, Any, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from app.models.schemas import ChatRequest, ChatResponse, DiagnosisSubmit, DiagnosisFeedback
 from app.core.chat_engine import get_chat_engine
+from app.core.response_cache import get_response_cache
+from app.core.incremental_scoring import IncrementalScorer
 from app.services.session_service import SessionService
-from app.services.scoring_service import ScoringService
+from app.services.scoring_rules import get_scoring_rule_registry
+from app.services.scoring_jobs import (
+    get_scoring_job_queue, build_score_report, job_to_dict, ScoringJobConflictError
+)
+from app.services.case_store import get_case_store, default_case_data
 from app.db.session import get_async_db
-from app.models.database import Case, SessionStatus, ImprovementSuggestion, User
+from app.models.database import User, ScoringJobStatus, SessionScore
 from app.api.auth import get_current_user, get_current_user_optional
 
 router = APIRouter(prefix="/api/chat", tags=["对话"])
@@ -59,7 +64,8 @@ async def start_chat_session(
         session_id=session.session_id,
         role="patient",
         content=session_info["opening_message"],
-        metadata={"type": "opening"}
+        metadata={"type": "opening"},
+        case_data=case_data
     )
 
     await db.commit()
@@ -101,21 +107,25 @@ async def send_message(
             detail=f"会话已{session.status.value}，无法继续对话"
         )
 
-    # 保存学生消息
+    # 获取病例数据
+    case_data = await _get_case_data(db, session.case.case_id)
+
+    # 保存学生消息（同时更新增量评分状态）
     await session_service.add_message(
         session_id=request.session_id,
         role="student",
-        content=request.message
+        content=request.message,
+        case_data=case_data
     )
 
-    # 获取病例数据
-    case_data = await _get_case_data(db, session.case.case_id)
-
-    # 获取对话历史
-    conversation_history = await session_service.get_conversation_history(request.session_id)
+    # 获取对话历史：只加载对话引擎上下文摘要之后的消息（首次为完整历史）
+    engine = get_chat_engine()
+    conversation_history = await session_service.get_conversation_history(
+        request.session_id,
+        after_id=engine.context_cursor(request.session_id)
+    )
 
     # 调用对话引擎
-    engine = get_chat_engine()
     response = await engine.chat(
         session_id=request.session_id,
         user_message=request.message,
@@ -129,7 +139,8 @@ async def send_message(
         session_id=request.session_id,
         role="patient",
         content=response.response,
-        metadata=response.metadata
+        metadata=response.metadata,
+        case_data=case_data
     )
 
     await db.commit()
@@ -137,7 +148,7 @@ async def send_message(
     return response
 
 
-@router.post("/end", response_model=Dict[str, Any])
+@router.post("/end", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
 async def end_session(
     submit: DiagnosisSubmit,
     db: AsyncSession = Depends(get_async_db)
@@ -145,12 +156,17 @@ async def end_session(
     """
     结束问诊会话并提交诊断
 
+    评分（含大模型评估）在后台任务队列中执行，接口立即返回任务ID。
+    客户端轮询 `GET /api/chat/score-jobs/{job_id}`，或在 WebSocket 连接上
+    接收 `score_ready` 推送获取评分报告。
+
+    首次提交的诊断为准：相同内容重复提交返回原任务，提交不同的诊断或推理返回409。
+
     - **session_id**: 会话ID
     - **diagnosis**: 学生的诊断结果
     - **reasoning**: 诊断推理过程（可选）
     """
     session_service = SessionService(db)
-    scoring_service = ScoringService(db)
 
     # 获取会话
     session = await session_service.get_session_by_id(submit.session_id)
@@ -166,114 +182,60 @@ async def end_session(
         diagnosis=submit.diagnosis
     )
 
-    # 获取病例数据
-    case_data = await _get_case_data(db, session.case.case_id)
-
-    # 获取对话历史
-    conversation_history = await session_service.get_conversation_history(submit.session_id)
-
-    # 使用新的评分引擎进行评分
-    from app.models.database import ChatSession
-
-    # 获取会话的数据库ID
-    session_result = await db.execute(
-        select(ChatSession).where(ChatSession.session_id == submit.session_id)
-    )
-    session_db = session_result.scalar_one()
+    # 提交评分任务（重复提交相同内容返回原任务，改交不同诊断返回409）
+    try:
+        job = await get_scoring_job_queue().enqueue(
+            db,
+            session_id=session.id,
+            user_id=session.user_id,
+            student_diagnosis=submit.diagnosis,
+            reasoning=submit.reasoning
+        )
+    except ScoringJobConflictError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "该会话已提交诊断，不能修改", "job_id": e.job.job_id}
+        )
 
-    # 使用评分服务进行完整评分并保存
-    session_score = await scoring_service.score_session(
-        session_id=session_db.id,
-        conversation_history=conversation_history,
-        student_diagnosis=submit.diagnosis,
-        case_data=case_data
-    )
+    return {
+        "session_id": submit.session_id,
+        "job_id": job.job_id,
+        "status": job.status
+    }
 
-    # 创建学习记录
-    await scoring_service.create_learning_record(
-        user_id=session.user_id,
-        session_id=session_db.id,
-        case_id=session.case.id,
-        score=session_score.final_score,
-        time_spent=0,  # 可以后续计算
-        knowledge_tested=[],
-        knowledge_mastered=[] if not session_score.passed else [case_data.get("category")],
-        knowledge_weak=[case_data.get("category")] if not session_score.passed else []
-    )
 
-    # 更新知识点掌握度
-    await scoring_service.update_knowledge_mastery(
-        user_id=session.user_id,
-        case_data=case_data,
-        score=session_score.final_score,
-        passed=session_score.passed
-    )
+@router.get("/score-jobs/{job_id}", response_model=Dict[str, Any])
+async def get_score_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    查询评分任务状态（本人、教师和管理员可见）
 
-    # 更新chat_sessions表的评分（快速查询用）
-    await session_service.save_scores(
-        session_id=submit.session_id,
-        inquiry_score=session_score.inquiry_total_score,
-        diagnosis_score=session_score.diagnosis_total_score,
-        communication_score=session_score.communication_total_score,
-        total_score=session_score.final_score
-    )
+    任务完成后 `result` 为评分报告（结构与原同步 /end 接口的返回一致）。
+    """
+    job = await get_scoring_job_queue().get_job(db, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="评分任务不存在"
+        )
 
-    # 更新会话状态为完成
-    await session_service.update_session_status(
-        session_id=submit.session_id,
-        status=SessionStatus.COMPLETED
-    )
+    if job.session.user_id != current_user.id and current_user.role.upper() not in ["ADMIN", "TEACHER"]:
+        raise HTTPException(status_code=403, detail="没有权限查看该评分任务")
 
-    await db.commit()
+    data = job_to_dict(job)
+    data["result"] = None
 
-    # 获取改进建议
-    suggestions_result = await db.execute(
-        select(ImprovementSuggestion)
-        .where(ImprovementSuggestion.session_score_id == session_score.id)
-    )
-    suggestions = suggestions_result.scalars().all()
+    if job.status == ScoringJobStatus.COMPLETED.value and job.session_score_id:
+        # 每次按评分记录重新生成，包含大模型评估迟到后补写的结果
+        session_score = await db.get(SessionScore, job.session_score_id)
+        if session_score:
+            data["result"] = await build_score_report(db, job.session.session_id, session_score)
 
-    # 构建返回数据
-    return {
-        "session_id": submit.session_id,
-        "completed_at": session_score.created_at.isoformat() if session_score.created_at else None,
-        "scores": {
-            "inquiry": {
-                "total": session_score.inquiry_total_score,
-                "symptom_inquiry": session_score.symptom_inquiry_score,
-                "inquiry_logic": session_score.inquiry_logic_score,
-                "medical_etiquette": session_score.medical_etiquette_score,
-                "coverage_rate": session_score.key_question_coverage_rate,
-                "covered": session_score.covered_questions,
-                "missed": session_score.missed_questions
-            },
-            "diagnosis": {
-                "total": session_score.diagnosis_total_score,
-                "accuracy": session_score.diagnosis_accuracy,
-                "differential_count": session_score.differential_considered,
-                "reasoning": session_score.diagnosis_reasoning_score
-            },
-            "communication": {
-                "total": session_score.communication_total_score,
-                "turn_count": session_score.turn_count,
-                "polite_rate": session_score.polite_expression_rate,
-                "empathy": session_score.empathy_score
-            },
-            "total": session_score.final_score
-        },
-        "grade": session_score.grade,
-        "passed": session_score.passed,
-        "ai_comments": session_score.ai_comments,
-        "suggestions": [
-            {
-                "type": s.suggestion_type,
-                "priority": s.priority,
-                "title": s.title,
-                "description": s.description
-            }
-            for s in suggestions
-        ]
-    }
+    return data
 
 
 @router.get("/session/{session_id}", response_model=Dict[str, Any])
@@ -318,6 +280,58 @@ async def get_session(
     }
 
 
+@router.get("/session/{session_id}/live-score", response_model=Dict[str, Any])
+async def get_live_score(
+    session_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    会话进行中的实时规则评分（本人、教师和管理员可见）
+
+    由增量评分状态直接计算，不读取对话历史、不调用大模型；
+    最终成绩以会话结束后的评分报告为准。
+    """
+    session_service = SessionService(db)
+    session = await session_service.get_session_by_id(session_id)
+
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="会话不存在"
+        )
+
+    if session.user_id != current_user.id and current_user.role.upper() not in ["ADMIN", "TEACHER"]:
+        raise HTTPException(status_code=403, detail="没有权限查看该会话的评分")
+
+    case_data = await _get_case_data(db, session.case.case_id)
+    scorer = IncrementalScorer.from_state(session.scoring_state, case_data)
+    if scorer is None:
+        # 没有增量评分状态的旧会话：由对话历史重建
+        scorer = IncrementalScorer(case_data)
+        for msg in await session_service.get_conversation_history(session_id):
+            scorer.add_message(msg["role"], msg["content"])
+
+    engine, _ = await get_scoring_rule_registry().get_engine(db)
+    result = engine.score_features(scorer.features(session.student_diagnosis or ""), case_data)
+
+    return {
+        "session_id": session.session_id,
+        "status": session.status.value,
+        "turn_count": result.turn_count,
+        "scores": {
+            "inquiry": round(result.inquiry_total_score, 2),
+            "diagnosis": round(result.diagnosis_total_score, 2),
+            "communication": round(result.communication_total_score, 2),
+            "total": result.final_score
+        },
+        "grade": result.grade,
+        "coverage_rate": result.coverage_rate,
+        "covered": result.covered_questions,
+        "missed": result.missed_questions
+    }
+
+
 @router.get("/sessions", response_model=List[Dict[str, Any]])
 async def list_sessions(
     status: str = None,
@@ -360,40 +374,18 @@ async def list_sessions(
     ]
 
 
+@router.get("/response-cache/stats", response_model=Dict[str, Any])
+async def get_response_cache_stats():
+    """患者回复缓存统计（条目数、命中率等）"""
+    return get_response_cache().stats()
+
+
 async def _get_case_data(db: AsyncSession, case_id: str) -> Dict[str, Any]:
-    """从数据库获取病例数据"""
-    result = await db.execute(
-        select(Case).where(Case.case_id == case_id)
-    )
-    case = result.scalar_one_or_none()
+    """获取病例数据（经由病例缓存）"""
+    case_data = await get_case_store().get_case(db, case_id)
 
-    if not case:
+    if not case_data:
         # 如果数据库中没有，返回默认病例（兜底）
-        return {
-            "case_id": case_id,
-            "title": "默认病例",
-            "description": "病例未找到",
-            "difficulty": "medium",
-            "category": "内科",
-            "patient_info": {},
-            "chief_complaint": {"text": "我不舒服"},
-            "symptoms": {},
-            "standard_diagnosis": "待诊断",
-            "differential_diagnosis": [],
-            "key_questions": []
-        }
+        return default_case_data(case_id)
 
-    # 返回病例数据（合并所有字段）
-    return {
-        "case_id": case.case_id,
-        "title": case.title,
-        "description": case.description,
-        "difficulty": case.difficulty,
-        "category": case.category,
-        "patient_info": case.patient_info or {},
-        "chief_complaint": case.chief_complaint or {},
-        "symptoms": case.symptoms or {},
-        "standard_diagnosis": case.standard_diagnosis,
-        "differential_diagnosis": case.differential_diagnosis or [],
-        "key_questions": case.key_questions or []
-    }
+    return case_data
@@ -1,13 +1,15 @@
 from fastapi import WebSocket, WebSocketDisconnect, APIRouter, Depends, Query
 from fastapi.security.utils import get_authorization_scheme_param
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Dict, Optional
+from typing import Dict, Any, Optional
 import json
 import asyncio
 from app.core.chat_engine import get_chat_engine
 from app.services.session_service import SessionService
+from app.services.case_store import get_case_store, default_case_data
 from app.db.session import AsyncSessionLocal
 from app.models.database import User
+from app.models.schemas import ChatResponse
 from app.utils.auth import decode_token
 
 router = APIRouter()
@@ -44,6 +46,15 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+async def push_score_job(session_id: str, payload: dict):
+    """评分任务完成/失败时推送到该会话的WebSocket连接（未连接时忽略）"""
+    await manager.send_message(session_id, {
+        "type": "score_ready",
+        "session_id": session_id,
+        **payload
+    })
+
+
 async def get_db():
     """获取数据库会话（用于WebSocket）"""
     async with AsyncSessionLocal() as session:
@@ -100,9 +111,14 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str):
         "type": "message|start|end",
         "case_id": "case_001",
         "content": "学生的问题",
+        "stream": true,  // type=message时可选，开启逐字流式回复
         "diagnosis": "诊断结果"  // type=end时使用
     }
     ```
+
+    流式回复依次推送若干 `patient_delta` 帧（字段 `delta` 为增量文本），
+    最后推送一个 `patient_done` 帧，其 `message` 为校验后的完整回复
+    （回复中途违规被中止时为兜底话术，客户端应以它替换已显示的内容）。
     """
     # 验证用户
     user = await get_websocket_user(websocket)
@@ -123,7 +139,7 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str):
 
                 if msg_type == "start":
                     # 开始新会话
-                    await handle_start_session(websocket, session_id, message, db)
+                    await handle_start_session(websocket, session_id, message, db, user)
 
                 elif msg_type == "message":
                     # 处理对话消息
@@ -176,7 +192,13 @@ async def handle_start_session(
         return
 
     # 获取病例数据
-    case_data = await _get_case_data(case_id)
+    case_data = await _get_case_data(db, case_id)
+    if not case_data:
+        await websocket.send_json({
+            "type": "error",
+            "message": f"病例不存在: {case_id}"
+        })
+        return
 
     # 创建数据库会话记录
     db_session = await session_service.create_session(
@@ -197,7 +219,8 @@ async def handle_start_session(
         session_id=db_session.session_id,
         role="patient",
         content=session_info["opening_message"],
-        metadata={"type": "opening"}
+        metadata={"type": "opening"},
+        case_data=case_data
     )
 
     await db.commit()
@@ -240,11 +263,15 @@ async def handle_chat_message(
 
     user_message = message.get("content", "")
 
-    # 保存学生问题
+    # 获取病例数据（病例已被删除时使用默认病例兜底，与REST接口一致）
+    case_data = await _get_case_data(db, session.case.case_id) or default_case_data(session.case.case_id)
+
+    # 保存学生问题（同时更新增量评分状态）
     await session_service.add_message(
         session_id=session_id,
         role="student",
-        content=user_message
+        content=user_message,
+        case_data=case_data
     )
 
     # 发送"正在思考"状态
@@ -253,14 +280,44 @@ async def handle_chat_message(
         "message": "病人正在思考..."
     })
 
-    # 获取病例数据
-    case_data = await _get_case_data(session.case_id)
+    # 获取对话历史：只加载对话引擎上下文摘要之后的消息（首次为完整历史）
+    engine = get_chat_engine()
+    conversation_history = await session_service.get_conversation_history(
+        session_id,
+        after_id=engine.context_cursor(session_id)
+    )
 
-    # 获取对话历史
-    conversation_history = await session_service.get_conversation_history(session_id)
+    if message.get("stream"):
+        # 流式推送患者回复
+        response = None
+        async for event in engine.chat_stream(
+            session_id=session_id,
+            user_message=user_message,
+            case_data=case_data,
+            conversation_history=conversation_history,
+            turn_count=session.turn_count or 0
+        ):
+            if event["type"] == "delta":
+                await websocket.send_json({
+                    "type": "patient_delta",
+                    "session_id": session_id,
+                    "delta": event["content"]
+                })
+            elif event["type"] == "done":
+                response = event["response"]
+
+        await _save_patient_reply(session_service, db, session_id, response, case_data)
+
+        await websocket.send_json({
+            "type": "patient_done",
+            "session_id": session_id,
+            "message": response.response,
+            "metadata": response.metadata,
+            "turn_count": response.turn_count
+        })
+        return
 
     # 调用对话引擎
-    engine = get_chat_engine()
     response = await engine.chat(
         session_id=session_id,
         user_message=user_message,
@@ -269,15 +326,7 @@ async def handle_chat_message(
         turn_count=session.turn_count or 0
     )
 
-    # 保存患者回复
-    await session_service.add_message(
-        session_id=session_id,
-        role="patient",
-        content=response.response,
-        metadata=response.metadata
-    )
-
-    await db.commit()
+    await _save_patient_reply(session_service, db, session_id, response, case_data)
 
     # 发送回复
     await websocket.send_json({
@@ -289,6 +338,25 @@ async def handle_chat_message(
     })
 
 
+async def _save_patient_reply(
+    session_service: SessionService,
+    db: AsyncSession,
+    session_id: str,
+    response: ChatResponse,
+    case_data: Dict[str, Any]
+):
+    """保存患者回复（同时更新增量评分状态）并提交"""
+    await session_service.add_message(
+        session_id=session_id,
+        role="patient",
+        content=response.response,
+        metadata=response.metadata,
+        case_data=case_data
+    )
+
+    await db.commit()
+
+
 async def handle_end_session(
     websocket: WebSocket,
     session_id: str,
@@ -316,8 +384,8 @@ async def handle_end_session(
         diagnosis=student_diagnosis
     )
 
-    # 获取病例数据
-    case_data = await _get_case_data(session.case_id)
+    # 获取病例数据（病例已被删除时使用默认病例兜底，与REST接口一致）
+    case_data = await _get_case_data(db, session.case.case_id) or default_case_data(session.case.case_id)
 
     # 获取对话历史
     conversation_history = await session_service.get_conversation_history(session_id)
@@ -366,50 +434,9 @@ async def handle_end_session(
     })
 
 
-async def _get_case_data(case_id: str) -> dict:
-    """获取病例数据"""
-    cases = {
-        "case_001": {
-            "case_id": "case_001",
-            "title": "胸痛待查",
-            "description": "58岁男性建筑工人，突发胸痛3小时",
-            "difficulty": "medium",
-            "category": "内科",
-            "patient_info": {
-                "age": 58,
-                "gender": "男",
-                "occupation": "建筑工人",
-                "education": "初中",
-                "personality": "内向、焦虑、表达简单",
-                "speech_style": "简单直接，略显紧张"
-            },
-            "chief_complaint": {
-                "text": "胸痛3小时"
-            },
-            "symptoms": {
-                "onset": "3小时前劳动时突然出现",
-                "location": "胸骨后",
-                "nature": "压榨性疼痛",
-                "severity": "7/10分",
-                "duration": "持续5-10分钟",
-                "radiation": "向左肩放射",
-                "aggravating_factors": ["体力劳动", "情绪激动", "寒冷刺激"],
-                "relieving_factors": ["休息", "含服硝酸甘油"],
-                "associated_symptoms": ["轻度气短", "出汗"]
-            },
-            "standard_diagnosis": "不稳定性心绞痛",
-            "differential_diagnosis": ["急性心肌梗死", "主动脉夹层", "肺栓塞"],
-            "key_questions": [
-                "疼痛的性质和部位",
-                "疼痛的诱发和缓解因素",
-                "既往心脏病史",
-                "高血压病史",
-                "吸烟饮酒史"
-            ]
-        }
-    }
-
-    return cases.get(case_id, cases["case_001"])
+async def _get_case_data(db: AsyncSession, case_id: str) -> Optional[dict]:
+    """获取病例数据（经由病例缓存），病例不存在时返回None"""
+    return await get_case_store().get_case(db, case_id)
 
 
 def _check_diagnosis(student_diagnosis: str, correct_diagnosis: str) -> bool:
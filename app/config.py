@@ -40,10 +40,85 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24小时
 
     # 对话配置
-    MAX_CONVERSATION_HISTORY: int = 20
+    MAX_CONVERSATION_HISTORY: int = 20  # 上下文窗口内保留原文的最大消息条数
+    CONTEXT_HISTORY_TOKEN_BUDGET: int = 1500  # 上下文窗口内原文历史的token预算
+    CONTEXT_SUMMARY_TOKEN_BUDGET: int = 400  # 早期对话摘要的token上限
+    CONTEXT_SUMMARY_CACHE_SIZE: int = 1024  # 缓存摘要的会话数上限
     DEFAULT_TEMPERATURE: float = 0.7
     MAX_TOKENS: int = 500
-    TIMEOUT: int = 30
+    TIMEOUT: int = 30  # 单次LLM上游调用超时（秒，不含限流排队时间）
+
+    # LLM调用重试与熔断
+    LLM_MAX_ATTEMPTS: int = 3  # 含首次，仅对超时、连接错误、429、5xx重试
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 4.0
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5  # 连续失败多少次后熔断
+    LLM_BREAKER_RECOVERY_SECONDS: float = 30.0
+
+    # LLM HTTP连接池（智谱AI异步客户端）
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_HTTP_CONNECT_TIMEOUT: float = 5.0
+    LLM_HTTP2: bool = True
+
+    # 合并同时在途的相同LLM请求
+    LLM_SINGLE_FLIGHT_ENABLED: bool = True
+
+    # 上游LLM限流（每分钟请求数 / 每分钟token数 / 并发数，0为不限）
+    ZHIPU_RPM_LIMIT: int = 600
+    ZHIPU_TPM_LIMIT: int = 600000
+    ZHIPU_MAX_CONCURRENCY: int = 50
+    BAICHUAN_RPM_LIMIT: int = 120
+    BAICHUAN_TPM_LIMIT: int = 120000
+    BAICHUAN_MAX_CONCURRENCY: int = 20
+    LLM_QUEUE_TIMEOUT: float = 15.0  # 最长排队时间（秒），超时按调用失败处理
+
+    # LLM服务路由（按顺序为没有统计数据时的优先级，未配置API Key的服务自动跳过）
+    LLM_ROUTER_PROVIDERS: List[str] = ["zhipu", "baichuan"]
+    LLM_ROUTER_EWMA_ALPHA: float = 0.2
+    LLM_ROUTER_ERROR_THRESHOLD: float = 0.5  # 错误率EWMA超过该值视为不健康
+    LLM_ROUTER_COOLDOWN_SECONDS: float = 30.0  # 不健康的服务多久后重新试探
+    LLM_HEDGE_ENABLED: bool = False  # 首选服务超过p95延迟未返回时向备选服务发对冲请求
+    LLM_HEDGE_DELAY: float = 3.0  # 延迟样本不足时的对冲等待时间（秒）
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+
+    # 病例缓存
+    CASE_CACHE_TTL_SECONDS: int = 300
+
+    # 编译提示词缓存容量（按病例版本）
+    PROMPT_CACHE_SIZE: int = 256
+
+    # 病例关键问题索引缓存容量（按关键问题列表）
+    CASE_INDEX_CACHE_SIZE: int = 256
+
+    # 关键词分词：max_match（医学词典双向最大匹配）/ whitespace（按空白切分）
+    KEYWORD_SEGMENTER: str = "max_match"
+    SEGMENTER_LEXICON_PATH: str = ""  # 为空时使用 data/lexicon/medical_lexicon.txt
+    SEGMENT_CACHE_SIZE: int = 10000
+
+    # 患者回复缓存（同一病例、同一对话状态下的相同/相似问题复用回复）
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_SIZE: int = 5000
+    RESPONSE_CACHE_SIMILARITY: float = 0.0  # 字符bigram相似匹配阈值（如0.8），<=0 只做精确匹配
+    RESPONSE_CACHE_EXCLUDED_CASES: List[str] = []  # 不使用回复缓存的病例ID
+
+    # 评分：等待百川评估的截止时间（秒），超时先返回规则评分、稍后补写融合结果；<=0 表示一直等待
+    SCORING_LLM_DEADLINE: float = 20.0
+    # 评分规则列表刷新间隔（秒），规则修改后最迟在该时间后生效
+    SCORING_RULE_CACHE_TTL_SECONDS: int = 60
+    # 评分词表（礼貌/共情/症状维度模式）JSON路径，为空时使用内置词表；文件修改后按检查间隔（秒）自动重新加载
+    SCORING_LEXICON_PATH: str = ""
+    SCORING_LEXICON_RELOAD_SECONDS: int = 30
+    # 评分结果缓存：相同输入（病例版本、评分规则、对话、诊断、提示词版本）复用已保存的评分，不再调用百川
+    SCORING_CACHE_ENABLED: bool = True
+    SCORING_CACHE_SIZE: int = 1000  # 内存LRU容量，其余结果从数据库表读取
+
+    # 异步评分任务队列（/api/chat/end）
+    SCORING_JOB_WORKERS: int = 4
+    SCORING_JOB_LEASE_SECONDS: int = 300
+    SCORING_JOB_POLL_INTERVAL: float = 2.0
+    SCORING_JOB_MAX_ATTEMPTS: int = 3
 
     # 日志
     LOG_LEVEL: str = "INFO"
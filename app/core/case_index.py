@@ -0,0 +1,117 @@
+"""
+病例关键问题索引 - 关键问题覆盖检查的预编译索引
+
+每个关键问题的关键词只提取一次，全部关键词编译成一个多模式匹配器
+（PatternSet，类别为关键问题序号）。检查覆盖时把学生的所有提问拼接后扫描
+一遍即可得到已覆盖的关键问题，不再对 关键问题 x 提问 x 关键词 逐一做
+子串查找。
+
+索引按关键问题列表缓存：病例版本变化时关键问题列表随之变化，自然得到新
+索引。ScoringEngine 和 ChatEngine 共用同一份索引。
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+import re
+import threading
+
+from app.config import settings
+from app.core.pattern_matcher import PatternSet
+from app.core.segmenter import segment
+
+# 关键词停用词（虚词和问诊中的泛用词）
+# 泛用词不再算作关键词，修改此表会改变关键问题覆盖率（及历史评分的可比性）
+STOP_WORDS = {
+    "的", "了", "是", "在", "有", "和", "与", "或",
+    "什么", "怎么", "怎样", "有没有", "是否", "有无",
+    "情况", "关系", "变化", "问题", "方面"
+}
+
+
+def extract_keywords(question: str) -> List[str]:
+    """从关键问题中提取关键词"""
+    # 移除标点符号
+    question = re.sub(r'[^\w\s]', '', question)
+
+    # 分词（中文按医学词典切分），过滤掉常用词
+    return [w for w in segment(question) if w not in STOP_WORDS and len(w) > 1]
+
+
+class CaseKeywordIndex:
+    """单个病例的关键问题索引"""
+
+    def __init__(self, key_questions: List[str]):
+        """
+        编译索引
+
+        Args:
+            key_questions: 关键问题列表
+        """
+        self.key_questions = list(key_questions)
+        self.keywords = [extract_keywords(q) for q in self.key_questions]
+
+        # 关键问题序号 -> 关键词模式（没有关键词的问题永远不会被覆盖）
+        patterns = {
+            i: [re.escape(kw.lower()) for kw in keywords]
+            for i, keywords in enumerate(self.keywords) if keywords
+        }
+        self._matcher: Optional[PatternSet] = PatternSet(patterns) if patterns else None
+
+    def covered_ids(self, questions: List[str]) -> Set[int]:
+        """
+        一次扫描得到已覆盖的关键问题序号
+
+        关键词不含换行，按换行拼接后关键词不会跨越两条提问。
+
+        Args:
+            questions: 学生提问列表
+        """
+        if self._matcher is None or not questions:
+            return set()
+        return self._matcher.categories_in("\n".join(questions).lower())
+
+    def match(self, questions: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        关键问题覆盖检查
+
+        Args:
+            questions: 学生提问列表
+
+        Returns:
+            (已覆盖, 未覆盖) 的关键问题，保持原顺序
+        """
+        hits = self.covered_ids(questions)
+        covered = [q for i, q in enumerate(self.key_questions) if i in hits]
+        missed = [q for i, q in enumerate(self.key_questions) if i not in hits]
+        return covered, missed
+
+
+# 关键问题列表 -> 索引（LRU）；评分在线程池中执行，需加锁
+_indexes: "OrderedDict[Tuple[str, ...], CaseKeywordIndex]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_case_index(key_questions: List[str]) -> CaseKeywordIndex:
+    """
+    获取（必要时编译）关键问题索引
+
+    Args:
+        key_questions: 病例的关键问题列表
+
+    Returns:
+        CaseKeywordIndex对象
+    """
+    key = tuple(key_questions)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = CaseKeywordIndex(key_questions)
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > settings.CASE_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
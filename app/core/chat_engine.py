@@ -1,18 +1,40 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 import uuid
 from datetime import datetime
 from app.services.llm_service import get_llm_service
 from app.core.prompt_manager import PromptManager
-from app.core.safety_filter import SafetyFilter
+from app.core.context_window import get_context_builder, ContextWindow
+from app.core.response_cache import (
+    ResponseCache, get_response_cache, is_cache_enabled, state_fingerprint
+)
+from app.core.case_index import get_case_index
+from app.core.safety_filter import SafetyFilter, StreamingResponseFilter
 from app.models.schemas import ChatResponse
 
 
 class ChatEngine:
     """AI对话引擎 - 核心业务逻辑"""
 
+    # LLM出错或回复被安全过滤替换时的兜底话术，不进入回复缓存
+    UNCACHEABLE_REPLIES = frozenset([
+        "病人正在思考，请稍等...",
+        SafetyFilter.ROLE_FALLBACK,
+        *SafetyFilter.RESPONSE_VIOLATION_REPLIES.values()
+    ])
+
     def __init__(self):
         self.llm_service = get_llm_service()
         self.safety_filter = SafetyFilter()
+        self.context_builder = get_context_builder()
+        self.response_cache = get_response_cache()
+
+    def context_cursor(self, session_id: str) -> Optional[int]:
+        """
+        会话上下文已折叠到的消息ID
+
+        调用方只需加载该ID之后的对话历史；返回None时需加载完整历史。
+        """
+        return self.context_builder.cursor(session_id)
 
     async def start_session(
         self,
@@ -83,104 +105,251 @@ class ChatEngine:
         Returns:
             ChatResponse对象
         """
-        # 1. 安全检查学生输入
-        is_safe, danger_type, _ = self.safety_filter.check_student_input(user_message)
-        if not is_safe:
-            # 发现危险信号，返回警告
-            return ChatResponse(
-                session_id=session_id,
-                response=self._get_danger_warning(danger_type),
-                metadata={"danger_detected": True, "type": danger_type},
-                turn_count=turn_count + 1
+        # 1-2. 安全检查学生输入、判断是否拒答
+        precheck = self._precheck_input(session_id, user_message, turn_count)
+        if precheck is not None:
+            return precheck
+
+        # 3. 获取编译好的提示词（按病例版本缓存）
+        patient_info = case_data.get("patient_info", {})
+        compiled = PromptManager.get_compiled_prompt(case_data)
+        symptom_info = compiled.symptom_info
+
+        # 4. 调用LLM生成回复
+        try:
+            context = self._build_messages(
+                session_id, compiled.system_prompt, conversation_history, user_message
             )
 
-        # 2. 检查是否需要拒答
-        should_refuse, refusal_response = self.safety_filter.should_refuse_answer(user_message)
-        if should_refuse:
+            # 同一病例、同一对话状态下问过的问题直接复用回复
+            cache_key = self._response_cache_key(case_data, context)
+            cached = self.response_cache.get(*cache_key, user_message) if cache_key else None
+            if cached is not None:
+                chat_response = self._build_chat_response(
+                    session_id, cached, symptom_info, turn_count
+                )
+                chat_response.metadata["cached"] = True
+                return chat_response
+
+            # 生成回复
+            response = await self.llm_service.generate_response(context.messages)
+
+            # 5-7. 验证回复并构建元数据
+            chat_response = self._finalize_response(
+                session_id, response, patient_info, symptom_info, turn_count
+            )
+            chat_response.metadata["prompt_tokens"] = context.prompt_tokens
+
+            if cache_key and self._is_cacheable(chat_response.response):
+                self.response_cache.put(*cache_key, user_message, chat_response.response)
+            return chat_response
+
+        except Exception as e:
+            # 错误处理
             return ChatResponse(
                 session_id=session_id,
-                response=refusal_response,
-                metadata={"refusal": True},
+                response="病人正在思考，请稍等...",
+                metadata={"error": str(e)},
                 turn_count=turn_count + 1
             )
 
-        # 3. 构建提示词
-        patient_info = case_data.get("patient_info", {})
-        symptoms = case_data.get("symptoms", {})
-
-        symptom_info = {
-            "chief_complaint": case_data.get("chief_complaint", {}).get("text", "胸痛"),
-            "mood": "焦虑",
-            "pain_level": symptoms.get("severity", "7/10分").split("/")[0],
-            "behavior": "眉头紧锁，手捂胸口",
-            "location": symptoms.get("location", "胸骨后"),
-            "nature": symptoms.get("nature", "压榨性疼痛"),
-            "duration": symptoms.get("duration", "持续5-10分钟"),
-            "aggravating_factors": symptoms.get("aggravating_factors", []),
-            "relieving_factors": symptoms.get("relieving_factors", []),
-            "associated_symptoms": symptoms.get("associated_symptoms", []),
-        }
+    async def chat_stream(
+        self,
+        session_id: str,
+        user_message: str,
+        case_data: Dict[str, Any],
+        conversation_history: List[Dict[str, str]],
+        turn_count: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理学生问诊对话
 
-        system_prompt = PromptManager.build_chat_prompt(
-            patient_info=patient_info,
-            symptom_info=symptom_info,
-            conversation_history=conversation_history
-        )
+        依次产出 {"type": "delta", "content": 片段} 事件，最后产出一个
+        {"type": "done", "response": ChatResponse} 事件。done 中的回复是
+        经过安全校验后的最终文本，客户端应以它为准；若回复中途违规被中止
+        （metadata.stream_aborted 为 True），已下发的片段应替换为该兜底话术。
+
+        Args:
+            session_id: 会话ID
+            user_message: 学生的问题
+            case_data: 病例数据
+            conversation_history: 对话历史
+            turn_count: 当前对话轮次
+
+        Yields:
+            流式事件字典
+        """
+        precheck = self._precheck_input(session_id, user_message, turn_count)
+        if precheck is not None:
+            yield {"type": "delta", "content": precheck.response}
+            yield {"type": "done", "response": precheck}
+            return
+
+        patient_info = case_data.get("patient_info", {})
+        compiled = PromptManager.get_compiled_prompt(case_data)
+        symptom_info = compiled.symptom_info
 
-        # 4. 调用LLM生成回复
         try:
-            # 构建完整的消息列表
-            messages = [{"role": "system", "content": system_prompt}]
+            context = self._build_messages(
+                session_id, compiled.system_prompt, conversation_history, user_message
+            )
 
-            # 添加对话历史（最近N轮）
-            recent_history = conversation_history[-10:] if conversation_history else []
-            for msg in recent_history:
-                role = "user" if msg.get("role") == "student" else "assistant"
-                messages.append({
-                    "role": role,
-                    "content": msg.get("content", "")
-                })
+            cache_key = self._response_cache_key(case_data, context)
+            cached = self.response_cache.get(*cache_key, user_message) if cache_key else None
+            if cached is not None:
+                response = self._build_chat_response(
+                    session_id, cached, symptom_info, turn_count
+                )
+                response.metadata["cached"] = True
+                yield {"type": "delta", "content": cached}
+                yield {"type": "done", "response": response}
+                return
+
+            # 增量安全过滤：安全文本立即下发，违规时中止上游生成
+            stream_filter = StreamingResponseFilter()
+            stream = self.llm_service.generate_response_stream(context.messages)
+            try:
+                async for delta in stream:
+                    safe_text = stream_filter.feed(delta)
+                    if safe_text:
+                        yield {"type": "delta", "content": safe_text}
+                    if stream_filter.aborted:
+                        break
+            finally:
+                await stream.aclose()
+
+            tail = stream_filter.finish()
+            if tail:
+                yield {"type": "delta", "content": tail}
+
+            response = self._build_chat_response(
+                session_id, stream_filter.text, symptom_info, turn_count
+            )
+            response.metadata["prompt_tokens"] = context.prompt_tokens
+            if stream_filter.aborted:
+                response.metadata["stream_aborted"] = True
+            elif cache_key and self._is_cacheable(response.response):
+                self.response_cache.put(*cache_key, user_message, response.response)
 
-            # 添加当前问题
-            messages.append({"role": "user", "content": user_message})
+            yield {"type": "done", "response": response}
 
-            # 生成回复
-            response = await self.llm_service.generate_response(messages)
-
-            # 5. 验证回复质量
-            is_valid, validated_response = self.safety_filter.check_patient_response(response)
-
-            # 6. 检查角色一致性
-            if not self.safety_filter.check_role_consistency(
-                validated_response,
-                patient_info.get("age", 50)
-            ):
-                validated_response = "我...我现在不太舒服，能...能再说一遍吗？"
-
-            # 7. 构建元数据
-            metadata = {
-                "turn_count": turn_count + 1,
-                "pain_level": symptom_info.get("pain_level"),
-                "emotion": self._infer_emotion(validated_response),
-                "timestamp": datetime.now().isoformat()
+        except Exception as e:
+            yield {
+                "type": "done",
+                "response": ChatResponse(
+                    session_id=session_id,
+                    response="病人正在思考，请稍等...",
+                    metadata={"error": str(e)},
+                    turn_count=turn_count + 1
+                )
             }
 
+    def _precheck_input(
+        self,
+        session_id: str,
+        user_message: str,
+        turn_count: int
+    ) -> Optional[ChatResponse]:
+        """检查学生输入，命中危险信号或拒答规则时直接返回回复"""
+        # 安全检查学生输入
+        is_safe, danger_type, _ = self.safety_filter.check_student_input(user_message)
+        if not is_safe:
+            # 发现危险信号，返回警告
             return ChatResponse(
                 session_id=session_id,
-                response=validated_response,
-                metadata=metadata,
+                response=self._get_danger_warning(danger_type),
+                metadata={"danger_detected": True, "type": danger_type},
                 turn_count=turn_count + 1
             )
 
-        except Exception as e:
-            # 错误处理
+        # 检查是否需要拒答
+        should_refuse, refusal_response = self.safety_filter.should_refuse_answer(user_message)
+        if should_refuse:
             return ChatResponse(
                 session_id=session_id,
-                response="病人正在思考，请稍等...",
-                metadata={"error": str(e)},
+                response=refusal_response,
+                metadata={"refusal": True},
                 turn_count=turn_count + 1
             )
 
+        return None
+
+    def _build_messages(
+        self,
+        session_id: str,
+        system_prompt: str,
+        conversation_history: List[Dict[str, Any]],
+        user_message: str
+    ) -> ContextWindow:
+        """构建发送给LLM的完整消息列表（token预算窗口 + 早期对话摘要）"""
+        return self.context_builder.build(
+            session_id, system_prompt, conversation_history, user_message
+        )
+
+    def _response_cache_key(
+        self,
+        case_data: Dict[str, Any],
+        context: ContextWindow
+    ) -> Optional[Tuple[Tuple[str, str, str], str]]:
+        """回复缓存的 (病例键, 对话状态指纹)，病例未启用缓存时返回None"""
+        if not is_cache_enabled(case_data):
+            return None
+        case_key = ResponseCache.case_key(case_data, PromptManager.PROMPT_VERSION)
+        if case_key is None:
+            return None
+        # 指纹覆盖系统提示词之后、当前问题之前的全部上下文（含早期对话摘要）
+        return case_key, state_fingerprint(context.messages[1:-1])
+
+    def _is_cacheable(self, response: str) -> bool:
+        """回复是否可以缓存"""
+        return bool(response and response.strip()) and response not in self.UNCACHEABLE_REPLIES
+
+    def _finalize_response(
+        self,
+        session_id: str,
+        response: str,
+        patient_info: Dict[str, Any],
+        symptom_info: Dict[str, Any],
+        turn_count: int
+    ) -> ChatResponse:
+        """校验LLM回复并组装ChatResponse"""
+        # 验证回复质量
+        is_valid, validated_response = self.safety_filter.check_patient_response(response)
+
+        # 检查角色一致性
+        if not self.safety_filter.check_role_consistency(
+            validated_response,
+            patient_info.get("age", 50)
+        ):
+            validated_response = SafetyFilter.ROLE_FALLBACK
+
+        return self._build_chat_response(
+            session_id, validated_response, symptom_info, turn_count
+        )
+
+    def _build_chat_response(
+        self,
+        session_id: str,
+        response: str,
+        symptom_info: Dict[str, Any],
+        turn_count: int
+    ) -> ChatResponse:
+        """为已通过校验的回复组装ChatResponse"""
+        # 构建元数据
+        metadata = {
+            "turn_count": turn_count + 1,
+            "pain_level": symptom_info.get("pain_level"),
+            "emotion": self._infer_emotion(response),
+            "timestamp": datetime.now().isoformat()
+        }
+
+        return ChatResponse(
+            session_id=session_id,
+            response=response,
+            metadata=metadata,
+            turn_count=turn_count + 1
+        )
+
     def _get_danger_warning(self, danger_type: str) -> str:
         """获取危险警告消息"""
         warnings = {
@@ -235,6 +404,9 @@ class ChatEngine:
             case_data
         )
 
+        # 会话结束，释放上下文摘要
+        self.context_builder.reset(session_id)
+
         # 生成反馈
         feedback = {
             "session_id": session_id,
@@ -261,21 +433,8 @@ class ChatEngine:
             if msg.get("role") == "student"
         ]
 
-        # 检查关键问题是否覆盖
-        covered = []
-        missed = []
-
-        for question in key_questions:
-            found = False
-            for student_q in student_questions:
-                if any(keyword in student_q for keyword in question.split()):
-                    found = True
-                    break
-
-            if found:
-                covered.append(question)
-            else:
-                missed.append(question)
+        # 检查关键问题是否覆盖（与评分引擎共用预编译索引）
+        covered, missed = get_case_index(key_questions).match(student_questions)
 
         return {
             "total_key_questions": len(key_questions),
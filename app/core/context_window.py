@@ -0,0 +1,267 @@
+"""
+对话上下文窗口 - 按token预算选取最近的对话，并把移出窗口的早期对话
+折叠进滚动摘要
+
+摘要只记录患者已经说过的事实（医生问了什么、患者怎么答的），按消息ID
+增量折叠：每轮只处理新移出窗口的消息，不调用LLM，每轮的提示词长度和
+构建耗时与会话长度无关。
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+import math
+import re
+
+from app.config import settings
+
+# 中日韩文字及全角标点，按每字1个token估算
+_CJK_PATTERN = re.compile(r"[　-〿一-鿿＀-￯]")
+
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_HEADER = "【此前对话要点】以下是你之前已经告诉医生的情况，后续回答必须与之保持一致：\n"
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数
+
+    中文按每字1个token，其余字符按每4个字符1个token，结果偏保守。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def message_tokens(content: str) -> int:
+    """单条消息（含格式开销）的token数"""
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _clip(text: str, limit: int) -> str:
+    """截断过长文本"""
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+@dataclass
+class RollingSummary:
+    """单个会话的滚动摘要"""
+    # 已折叠的最后一条消息ID
+    upto_id: int = 0
+    # 每条为 (医生问题, 患者回答)，问题可能为空
+    facts: List[Tuple[str, str]] = field(default_factory=list)
+    # 已折叠但尚未等到患者回答的问题
+    pending_question: str = ""
+    text: str = ""
+
+    def fold(self, message: Dict[str, Any]):
+        """折叠一条移出窗口的消息"""
+        content = message.get("content", "")
+        if message.get("role") == "student":
+            self.pending_question = _clip(content, 40)
+        else:
+            self.facts.append((self.pending_question, _clip(content, 80)))
+            self.pending_question = ""
+        self.upto_id = message.get("id") or self.upto_id
+
+    def render(self, max_tokens: int) -> str:
+        """生成摘要文本，超出预算时先省略最早的问题，再丢弃最早的要点"""
+        facts = list(self.facts)
+        current = [
+            f"- 医生问：{q}；我答：{a}" if q else f"- 我说过：{a}"
+            for q, a in facts
+        ]
+        total = estimate_tokens(SUMMARY_HEADER) + sum(estimate_tokens(line) for line in current)
+
+        i = 0
+        while total > max_tokens and i < len(facts):
+            if facts[i][0]:
+                facts[i] = ("", facts[i][1])
+                total -= estimate_tokens(current[i])
+                current[i] = f"- 我说过：{facts[i][1]}"
+                total += estimate_tokens(current[i])
+            i += 1
+
+        while total > max_tokens and facts:
+            total -= estimate_tokens(current.pop(0))
+            facts.pop(0)
+
+        # 压缩结果写回，后续轮次不再重复压缩
+        self.facts = facts
+        self.text = SUMMARY_HEADER + "\n".join(current) if current else ""
+        return self.text
+
+
+class SummaryCache:
+    """有界LRU缓存 - session_id -> 滚动摘要"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, RollingSummary]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[RollingSummary]:
+        summary = self._data.get(session_id)
+        if summary is not None:
+            self._data.move_to_end(session_id)
+        return summary
+
+    def put(self, session_id: str, summary: RollingSummary):
+        self._data[session_id] = summary
+        self._data.move_to_end(session_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, session_id: str):
+        self._data.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass
+class ContextWindow:
+    """一轮对话的LLM上下文"""
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    # 窗口内保留原文的历史消息数
+    window_size: int
+    # 累计折叠进摘要的要点数
+    summarized: int
+
+
+class ContextBuilder:
+    """上下文构建器 - token预算窗口 + 滚动摘要"""
+
+    def __init__(
+        self,
+        history_token_budget: int = 1500,
+        summary_token_budget: int = 400,
+        max_window_messages: int = 20,
+        cache_size: int = 1024
+    ):
+        """
+        初始化上下文构建器
+
+        Args:
+            history_token_budget: 原文保留的历史消息token预算
+            summary_token_budget: 摘要token上限
+            max_window_messages: 原文保留的最大消息条数
+            cache_size: 摘要缓存的会话数上限
+        """
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_window_messages = max_window_messages
+        self._summaries = SummaryCache(maxsize=cache_size)
+
+    def cursor(self, session_id: str) -> Optional[int]:
+        """
+        已折叠进摘要的最后一条消息ID
+
+        调用方只需加载该ID之后的消息；返回None表示本进程没有该会话的
+        摘要（首次对话或缓存淘汰），需要传入完整历史重建一次。
+        """
+        summary = self._summaries.get(session_id)
+        return summary.upto_id if summary is not None else None
+
+    def reset(self, session_id: str):
+        """丢弃会话摘要（会话结束时调用）"""
+        self._summaries.pop(session_id)
+
+    def build(
+        self,
+        session_id: str,
+        system_prompt: str,
+        conversation_history: List[Dict[str, Any]],
+        user_message: str
+    ) -> ContextWindow:
+        """
+        构建发送给LLM的消息列表
+
+        Args:
+            session_id: 会话ID
+            system_prompt: 系统提示词
+            conversation_history: cursor() 之后的对话历史（可带 id 字段）
+            user_message: 当前学生问题
+
+        Returns:
+            ContextWindow对象
+        """
+        summary = self._summaries.get(session_id) or RollingSummary()
+
+        history = [
+            msg for msg in (conversation_history or [])
+            if not msg.get("id") or msg["id"] > summary.upto_id
+        ]
+        # 当前问题已先写入历史时去掉，避免重复
+        if history and history[-1].get("role") == "student" and history[-1].get("content") == user_message:
+            history = history[:-1]
+
+        # 1. 从最新的消息往前，按token预算和条数选取原文窗口
+        used = 0
+        start = len(history)
+        while start > 0 and len(history) - start < self.max_window_messages:
+            cost = message_tokens(history[start - 1].get("content", ""))
+            if used + cost > self.history_token_budget:
+                break
+            used += cost
+            start -= 1
+
+        # 2. 移出窗口的消息折叠进摘要
+        if start > 0:
+            for msg in history[:start]:
+                summary.fold(msg)
+            summary.render(self.summary_token_budget)
+
+        # 只有带消息ID的历史才能增量折叠，否则下一轮会重复折叠
+        if session_id and all(msg.get("id") for msg in history[:start]):
+            self._summaries.put(session_id, summary)
+
+        # 3. 组装消息
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary.text:
+            messages.append({"role": "system", "content": summary.text})
+
+        for msg in history[start:]:
+            messages.append({
+                "role": "user" if msg.get("role") == "student" else "assistant",
+                "content": msg.get("content", "")
+            })
+        messages.append({"role": "user", "content": user_message})
+
+        prompt_tokens = sum(message_tokens(m["content"]) for m in messages)
+        return ContextWindow(
+            messages=messages,
+            prompt_tokens=prompt_tokens,
+            window_size=len(history) - start,
+            summarized=len(summary.facts)
+        )
+
+
+# 全局单例
+_context_builder: Optional[ContextBuilder] = None
+
+
+def get_context_builder() -> ContextBuilder:
+    """获取上下文构建器单例"""
+    global _context_builder
+    if _context_builder is None:
+        _context_builder = ContextBuilder(
+            history_token_budget=settings.CONTEXT_HISTORY_TOKEN_BUDGET,
+            summary_token_budget=settings.CONTEXT_SUMMARY_TOKEN_BUDGET,
+            max_window_messages=settings.MAX_CONVERSATION_HISTORY,
+            cache_size=settings.CONTEXT_SUMMARY_CACHE_SIZE
+        )
+    return _context_builder
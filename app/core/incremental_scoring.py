@@ -0,0 +1,272 @@
+"""
+增量评分 - 随对话逐条累积规则评分特征
+
+每条消息写入时更新关键问题覆盖、症状维度、重复提问、礼貌/共情计数等，
+状态以固定大小的JSON快照保存在会话上（chat_sessions.scoring_state）。会话结束
+时直接由快照得到规则特征，评分只做组合与百川融合，不再重新扫描整段对话；
+会话进行中也可以随时由快照计算实时分数。
+
+快照记录病例指纹（关键问题与鉴别诊断）、评分词表版本和已累积的消息数，
+与实际不符时（病例在会话中途被修改、词表重新加载、有消息未经增量评分写入）
+调用方应退回全量评分。
+
+重复提问用固定位数的布隆过滤器判断，快照大小不随对话长度增长；极少数情况下
+（100个不同问题时约万分之一）会把新问题误判为重复。
+"""
+
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+import hashlib
+import json
+
+from app.core.case_index import get_case_index
+from app.core.scoring_engine import ScoringEngine
+
+# 快照格式版本
+STATE_VERSION = 2
+
+# 已提问题布隆过滤器的位数与哈希个数
+SEEN_BITS = 4096
+SEEN_HASHES = 4
+
+# 评分规则辅助方法与评分标准无关，所有会话共用一个引擎（词表取全局当前版本）
+_shared_engine = ScoringEngine()
+
+
+def case_fingerprint(case_data: Dict[str, Any]) -> str:
+    """病例中影响规则特征的字段的指纹"""
+    payload = json.dumps(
+        [case_data.get("key_questions", []), case_data.get("differential_diagnosis", [])],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _question_bits(normalized: str) -> int:
+    """问题在布隆过滤器中对应的位"""
+    digest = hashlib.sha1(normalized.encode("utf-8")).digest()
+    bits = 0
+    for i in range(SEEN_HASHES):
+        bits |= 1 << (int.from_bytes(digest[4 * i:4 * i + 4], "big") % SEEN_BITS)
+    return bits
+
+
+class IncrementalScorer:
+    """单个会话的增量规则评分状态"""
+
+    def __init__(self, case_data: Dict[str, Any], engine: Optional[ScoringEngine] = None):
+        """
+        Args:
+            case_data: 病例数据
+            engine: 提供评分规则辅助方法的评分引擎（特征与评分标准无关，默认共用引擎）
+        """
+        self.case_data = case_data
+        self.engine = engine or _shared_engine
+        self.key_questions: List[str] = case_data.get("key_questions", [])
+        self.differentials: List[str] = case_data.get("differential_diagnosis", [])
+        self.fingerprint = case_fingerprint(case_data)
+        # 会话内固定使用同一版本的词表，词表热加载不影响已累积的计数
+        self.lexicon = self.engine.lexicon
+
+        self.messages = 0
+        self.covered: set = set()
+        self.dimensions: set = set()
+        self.questions = 0
+        self.duplicates = 0
+        self.seen = 0
+        self.etiquette = 0
+        self.polite = 0
+        self.empathy = 0
+        self.length = 0
+        self.differentials_seen: set = set()
+
+    def add_message(self, role: str, content: str):
+        """
+        累积一条消息
+
+        Args:
+            role: 角色（student/patient/system）
+            content: 消息内容
+        """
+        self.messages += 1
+        content = content or ""
+
+        # 鉴别诊断在整段对话（含患者回复）中查找
+        lowered = content.lower()
+        for i, diff in enumerate(self.differentials):
+            if diff.lower() in lowered:
+                self.differentials_seen.add(i)
+
+        if role != "student":
+            return
+
+        lexicon = self.lexicon
+        self.questions += 1
+        self.length += len(content)
+        self.covered |= get_case_index(self.key_questions).covered_ids([content])
+        self.dimensions |= lexicon.symptom_hits([content])
+
+        normalized = lexicon.normalize_question(content)
+        bits = _question_bits(normalized)
+        if self.seen & bits == bits and len(normalized) > 5:
+            self.duplicates += 1
+        self.seen |= bits
+
+        self.etiquette += lexicon.matches("etiquette", content)
+        self.polite += lexicon.matches("polite", content)
+        self.empathy += lexicon.matches("empathy", content)
+
+    def features(self, student_diagnosis: str = "") -> Dict[str, Any]:
+        """
+        当前的规则特征（格式同 ScoringEngine.rule_features）
+
+        Args:
+            student_diagnosis: 学生诊断（会话进行中为空）
+        """
+        engine = self.engine
+        covered = [q for i, q in enumerate(self.key_questions) if i in self.covered]
+        missed = [q for i, q in enumerate(self.key_questions) if i not in self.covered]
+        coverage_rate = len(covered) / len(self.key_questions) if self.key_questions else 0
+
+        accuracy, _ = engine._check_diagnosis_accuracy(
+            student_diagnosis,
+            self.case_data.get("standard_diagnosis", "")
+        )
+        diagnosis_lower = student_diagnosis.lower()
+        differentials = self.differentials_seen | {
+            i for i, diff in enumerate(self.differentials) if diff.lower() in diagnosis_lower
+        }
+
+        questions = self.questions
+        return {
+            "covered": covered,
+            "missed": missed,
+            "coverage_rate": coverage_rate,
+            "symptom_dimensions": len(self.dimensions),
+            "question_count": questions,
+            "duplicates": self.duplicates,
+            "etiquette_rate": self.etiquette / questions if questions else 0,
+            "accuracy": accuracy,
+            "differential_count": len(differentials),
+            "reasoning_score": engine._reasoning_from_coverage(coverage_rate) if self.key_questions else 0,
+            "turn_count": questions,
+            "avg_length": self.length / questions if questions else 0,
+            "polite_rate": self.polite / questions if questions else 0,
+            "empathy_score": min(self.empathy, 5)
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        """导出快照（每次返回新对象，便于JSON列检测到变更）"""
+        return {
+            "v": STATE_VERSION,
+            "case": self.fingerprint,
+            "lexicon": self.lexicon.version,
+            "messages": self.messages,
+            "covered": sorted(self.covered),
+            "dimensions": sorted(self.dimensions),
+            "questions": self.questions,
+            "duplicates": self.duplicates,
+            "seen": format(self.seen, "x"),
+            "etiquette": self.etiquette,
+            "polite": self.polite,
+            "empathy": self.empathy,
+            "length": self.length,
+            "differentials": sorted(self.differentials_seen)
+        }
+
+    @classmethod
+    def from_state(
+        cls,
+        state: Optional[Dict[str, Any]],
+        case_data: Dict[str, Any],
+        engine: Optional[ScoringEngine] = None
+    ) -> Optional["IncrementalScorer"]:
+        """
+        从快照恢复
+
+        Returns:
+            IncrementalScorer对象；快照不存在、版本不符、病例或词表已变化时返回None
+        """
+        scorer = cls(case_data, engine)
+        if (
+            not state
+            or state.get("v") != STATE_VERSION
+            or state.get("case") != scorer.fingerprint
+            or state.get("lexicon") != scorer.lexicon.version
+        ):
+            return None
+
+        scorer.messages = state["messages"]
+        scorer.covered = set(state["covered"])
+        scorer.dimensions = set(state["dimensions"])
+        scorer.questions = state["questions"]
+        scorer.duplicates = state["duplicates"]
+        scorer.seen = int(state["seen"], 16)
+        scorer.etiquette = state["etiquette"]
+        scorer.polite = state["polite"]
+        scorer.empathy = state["empathy"]
+        scorer.length = state["length"]
+        scorer.differentials_seen = set(state["differentials"])
+        return scorer
+
+
+class IncrementalScorerCache:
+    """
+    按会话缓存增量评分器
+
+    对话进行中每条消息都要更新快照，缓存命中时直接在内存中的评分器上累积，
+    不必每次由快照重建。缓存的评分器只有在导出的快照与数据库中的一致时才复用
+    （事务回滚、多实例部署时由数据库快照为准重建）。
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[int, IncrementalScorer]" = OrderedDict()
+
+    def get(
+        self,
+        session_id: int,
+        state: Optional[Dict[str, Any]],
+        case_data: Dict[str, Any]
+    ) -> IncrementalScorer:
+        """
+        获取会话的增量评分器
+
+        Args:
+            session_id: 会话ID
+            state: 数据库中的快照
+            case_data: 病例数据
+
+        Returns:
+            IncrementalScorer对象；快照不可用时返回从头累积的新评分器
+        """
+        scorer = self._data.get(session_id)
+        if (
+            scorer is None
+            or scorer.fingerprint != case_fingerprint(case_data)
+            or scorer.lexicon.version != scorer.engine.lexicon.version
+            or scorer.to_state() != state
+        ):
+            scorer = IncrementalScorer.from_state(state, case_data) or IncrementalScorer(case_data)
+
+        scorer.case_data = case_data
+        self._data[session_id] = scorer
+        self._data.move_to_end(session_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return scorer
+
+    def clear(self):
+        self._data.clear()
+
+
+# 全局单例
+_scorer_cache: Optional[IncrementalScorerCache] = None
+
+
+def get_incremental_scorer_cache() -> IncrementalScorerCache:
+    """获取增量评分器缓存单例"""
+    global _scorer_cache
+    if _scorer_cache is None:
+        _scorer_cache = IncrementalScorerCache()
+    return _scorer_cache
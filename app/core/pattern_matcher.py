@@ -0,0 +1,85 @@
+"""
+多模式匹配器 - 单次扫描文本即可得到所有命中的模式类别
+
+字面量词条与正则模式（如 "一次.*粒"）统一编译成一个组合正则，各模式
+以非捕获分组 (?:...) 拼接；模式自身的捕获组（如 "(你是|你得了|可能是)"）
+原样保留，组合正则只取命中位置、不使用分组，因此不受影响（但模式中不能
+使用反向引用或命名分组，拼接后组号会错位、组名可能重复）。扫描在 re 引擎的
+C层完成，并保留其字面量前缀/字符集优化。
+"""
+
+from typing import Dict, List, Optional, Set, FrozenSet
+import re
+
+class PatternSet:
+    """按类别组织的模式集合，一次扫描返回所有命中类别"""
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        """
+        编译模式集合
+
+        Args:
+            categories: {类别: [正则模式, ...]}，类别顺序即优先级
+        """
+        self.order: List[str] = list(categories)
+        self._patterns: Dict[str, List[re.Pattern]] = {
+            category: [re.compile(pattern) for pattern in patterns]
+            for category, patterns in categories.items()
+        }
+        self._sources = categories
+        # 待检测类别子集 -> 组合正则，按需编译
+        self._alternations: Dict[FrozenSet[str], re.Pattern] = {}
+        self._all = frozenset(self.order)
+        self._alternation(self._all)
+
+    def _alternation(self, categories: FrozenSet[str]) -> re.Pattern:
+        """获取（必要时编译）指定类别子集的组合正则"""
+        compiled = self._alternations.get(categories)
+        if compiled is None:
+            # 使用非捕获分组，保留 re 引擎的前缀/字符集优化
+            compiled = re.compile("|".join(
+                f"(?:{pattern})"
+                for category in self.order if category in categories
+                for pattern in self._sources[category]
+            ))
+            self._alternations[categories] = compiled
+        return compiled
+
+    def categories_in(self, text: str) -> Set[str]:
+        """
+        返回文本命中的所有类别
+
+        组合正则找到最左命中位置后，只在该位置逐类别确认，然后从下一个
+        位置继续查找剩余类别；无命中的文本只需一次扫描。
+
+        Args:
+            text: 待检测文本
+
+        Returns:
+            命中类别集合
+        """
+        hits: Set[str] = set()
+        remaining = self._all
+        pos = 0
+        while remaining:
+            match = self._alternation(remaining).search(text, pos)
+            if match is None:
+                break
+            start = match.start()
+            matched = {
+                category for category in remaining
+                if any(p.match(text, start) for p in self._patterns[category])
+            }
+            hits |= matched
+            remaining = remaining - matched
+            pos = start + 1
+
+        return hits
+
+    def first_category(self, text: str) -> Optional[str]:
+        """返回命中的最高优先级类别（按声明顺序）"""
+        hits = self.categories_in(text)
+        for category in self.order:
+            if category in hits:
+                return category
+        return None
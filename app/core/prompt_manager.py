@@ -1,4 +1,7 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from app.config import settings
 
 # LangChain 导入 (兼容新旧版本)
 try:
@@ -7,9 +10,53 @@ except ImportError:
     from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """编译后的病例提示词（整个病例内固定不变）"""
+    system_prompt: str
+    symptom_info: Dict[str, Any]
+
+
+class PromptCache:
+    """有界LRU缓存 - 缓存按病例编译好的系统提示词"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, str, str], CompiledPrompt]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[CompiledPrompt]:
+        compiled = self._data.get(key)
+        if compiled is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return compiled
+
+    def put(self, key: Tuple[str, str, str], compiled: CompiledPrompt):
+        self._data[key] = compiled
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
 class PromptManager:
     """提示词管理器 - 管理AI标准化病人的提示词模板"""
 
+    # 提示词版本，修改模板内容时递增以使已编译的缓存失效
+    PROMPT_VERSION = "1"
+
+    # 已编译提示词缓存，键为 (case_id, 病例版本, 提示词版本)
+    _cache = PromptCache(maxsize=settings.PROMPT_CACHE_SIZE)
+
     # 系统核心指令（固定）
     SYSTEM_INSTRUCTION = """你是AI标准化病人模拟器，用于医学教育。
 
@@ -77,22 +124,46 @@ class PromptManager:
     ]
 
     @classmethod
-    def build_chat_prompt(
+    def build_symptom_info(cls, case_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        从病例数据提取提示词所需的症状信息
+
+        Args:
+            case_data: 病例数据
+
+        Returns:
+            症状信息字典
+        """
+        symptoms = case_data.get("symptoms", {})
+
+        return {
+            "chief_complaint": case_data.get("chief_complaint", {}).get("text", "胸痛"),
+            "mood": "焦虑",
+            "pain_level": symptoms.get("severity", "7/10分").split("/")[0],
+            "behavior": "眉头紧锁，手捂胸口",
+            "location": symptoms.get("location", "胸骨后"),
+            "nature": symptoms.get("nature", "压榨性疼痛"),
+            "duration": symptoms.get("duration", "持续5-10分钟"),
+            "aggravating_factors": symptoms.get("aggravating_factors", []),
+            "relieving_factors": symptoms.get("relieving_factors", []),
+            "associated_symptoms": symptoms.get("associated_symptoms", []),
+        }
+
+    @classmethod
+    def render_system_prompt(
         cls,
         patient_info: Dict[str, Any],
-        symptom_info: Dict[str, Any],
-        conversation_history: List[Dict[str, str]] = None
-    ) -> ChatPromptTemplate:
+        symptom_info: Dict[str, Any]
+    ) -> str:
         """
-        构建完整的对话提示词模板
+        渲染系统提示词字符串（核心指令 + 患者角色设定）
 
         Args:
             patient_info: 患者信息
             symptom_info: 症状信息
-            conversation_history: 对话历史
 
         Returns:
-            ChatPromptTemplate对象
+            系统提示词
         """
         # 构建角色设定字符串
         persona_str = cls.PERSONA_TEMPLATE.format(
@@ -114,9 +185,65 @@ class PromptManager:
             speech_style=patient_info.get("speech_style", "简单直接，表达清晰")
         )
 
+        return cls.SYSTEM_INSTRUCTION + "\n\n" + persona_str
+
+    @classmethod
+    def get_compiled_prompt(cls, case_data: Dict[str, Any]) -> CompiledPrompt:
+        """
+        获取病例的编译提示词，同一病例版本只渲染一次
+
+        Args:
+            case_data: 病例数据（需包含 case_id，version 可选）
+
+        Returns:
+            CompiledPrompt对象
+        """
+        case_id = case_data.get("case_id")
+        key = (case_id, str(case_data.get("version", "0")), cls.PROMPT_VERSION)
+
+        if case_id:
+            compiled = cls._cache.get(key)
+            if compiled is not None:
+                return compiled
+
+        symptom_info = cls.build_symptom_info(case_data)
+        compiled = CompiledPrompt(
+            system_prompt=cls.render_system_prompt(
+                case_data.get("patient_info", {}),
+                symptom_info
+            ),
+            symptom_info=symptom_info
+        )
+
+        # 没有病例ID的临时数据不进入缓存
+        if case_id:
+            cls._cache.put(key, compiled)
+
+        return compiled
+
+    @classmethod
+    def build_chat_prompt(
+        cls,
+        patient_info: Dict[str, Any],
+        symptom_info: Dict[str, Any],
+        conversation_history: List[Dict[str, str]] = None
+    ) -> ChatPromptTemplate:
+        """
+        构建完整的对话提示词模板
+
+        Args:
+            patient_info: 患者信息
+            symptom_info: 症状信息
+            conversation_history: 对话历史
+
+        Returns:
+            ChatPromptTemplate对象
+        """
+        system_prompt = cls.render_system_prompt(patient_info, symptom_info)
+
         # 构建提示词模板
         prompt_template = ChatPromptTemplate.from_messages([
-            ("system", cls.SYSTEM_INSTRUCTION + "\n\n" + persona_str),
+            ("system", system_prompt),
             MessagesPlaceholder(variable_name="history", optional=True),
             ("human", "{question}")
         ])
@@ -0,0 +1,232 @@
+"""
+患者回复缓存 - 按病例缓存学生常见问题的回复
+
+同一病例下大量学生会问几乎相同的问题（"哪里不舒服"、"疼了多久"）。
+缓存键为 (病例, 病例版本, 提示词版本, 对话状态指纹, 规范化问题)：
+对话状态指纹覆盖当前问题之前发送给LLM的全部上下文，只有上下文一致时
+才会命中，回复不会与之前的对话矛盾。
+
+两级查找：
+1. 精确匹配：规范化后的问题完全一致
+2. 相似匹配（可选，默认关闭）：同一状态下字符 n-gram 的 Jaccard 相似度超过阈值，
+   且方位、亲属、否定等关键字完全一致（"父亲/母亲"、"左/右"、"有/没有"
+   只差一个字，n-gram 相似度很高，回复却完全不同）
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, FrozenSet
+from collections import OrderedDict
+import hashlib
+import re
+
+from app.config import settings
+
+# 规范化时去掉的标点、空白和语气词
+_PUNCT_PATTERN = re.compile(r"[\s\.,!?;:'\"，。！？；：、“”‘’（）()…~～]+")
+_FILLER_PATTERN = re.compile(r"^(医生|大夫)?(你好)?(请问|我想问一下|我想问)?(你)?|(呢|吗|啊|呀|吧)+$")
+
+# 只差一个字就改变问题含义的关键字（方位、亲属、性别、否定）
+_DISCRIMINATING_CHARS = frozenset("左右上下前后内外父母爸妈爷奶姥公婆兄弟姐妹哥儿女夫妻男没不无未否非别")
+
+# 状态桶内参与相似匹配的最大问题数
+MAX_BUCKET_SIZE = 64
+
+# 同一状态桶的键: (病例键, 状态指纹)
+BucketKey = Tuple[Tuple[str, str, str], str]
+
+
+def normalize_question(text: str) -> str:
+    """
+    规范化学生问题：去标点空白、统一"您/你"、去掉开头寒暄称呼和结尾语气词
+
+    Args:
+        text: 学生问题
+
+    Returns:
+        规范化后的问题
+    """
+    text = _PUNCT_PATTERN.sub("", text or "").lower().replace("您", "你")
+    stripped = _FILLER_PATTERN.sub("", text)
+    return stripped or text
+
+
+def char_ngrams(text: str, n: int = 2) -> FrozenSet[str]:
+    """字符 n-gram 集合（文本短于 n 时返回文本本身）"""
+    if len(text) < n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def discriminators(text: str) -> str:
+    """问题中的关键字（有序），相似匹配要求两者一致"""
+    return "".join(ch for ch in text if ch in _DISCRIMINATING_CHARS)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Jaccard 相似度"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def state_fingerprint(messages: List[Dict[str, str]]) -> str:
+    """
+    对话状态指纹
+
+    Args:
+        messages: 当前问题之前发送给LLM的上下文消息（不含系统提示词）
+
+    Returns:
+        指纹（sha1）
+    """
+    digest = hashlib.sha1()
+    for msg in messages:
+        digest.update(msg.get("role", "").encode("utf-8"))
+        digest.update(b"\x1f")
+        digest.update(msg.get("content", "").encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """有界LRU回复缓存（精确匹配 + 可选 n-gram 相似匹配）"""
+
+    def __init__(self, maxsize: int = 5000, similarity_threshold: float = 0.0):
+        """
+        初始化回复缓存
+
+        Args:
+            maxsize: 最大缓存条目数
+            similarity_threshold: 相似匹配阈值，<=0 时只做精确匹配（默认）
+        """
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+
+        # (桶键, 规范化问题) -> 回复
+        self._data: "OrderedDict[Tuple[BucketKey, str], str]" = OrderedDict()
+        # 桶键 -> {规范化问题: n-gram}，用于相似匹配
+        self._buckets: Dict[BucketKey, Dict[str, FrozenSet[str]]] = {}
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def case_key(case_data: Dict[str, Any], prompt_version: str) -> Optional[Tuple[str, str, str]]:
+        """病例键，没有 case_id 时返回None（不缓存）"""
+        case_id = case_data.get("case_id")
+        if not case_id:
+            return None
+        return (case_id, str(case_data.get("version", "0")), prompt_version)
+
+    def get(self, case_key: Tuple[str, str, str], fingerprint: str, question: str) -> Optional[str]:
+        """
+        查找缓存的回复
+
+        Args:
+            case_key: 病例键
+            fingerprint: 对话状态指纹
+            question: 学生问题（原文）
+
+        Returns:
+            缓存的回复，未命中返回None
+        """
+        bucket_key = (case_key, fingerprint)
+        normalized = normalize_question(question)
+
+        # 1. 精确匹配
+        key = (bucket_key, normalized)
+        reply = self._data.get(key)
+        if reply is not None:
+            self._data.move_to_end(key)
+            self.exact_hits += 1
+            return reply
+
+        # 2. 相似匹配
+        if self.similarity_threshold > 0:
+            bucket = self._buckets.get(bucket_key)
+            if bucket:
+                grams = char_ngrams(normalized)
+                keys = discriminators(normalized)
+                best, best_score = None, 0.0
+                for candidate, candidate_grams in bucket.items():
+                    if discriminators(candidate) != keys:
+                        continue
+                    score = jaccard(grams, candidate_grams)
+                    if score > best_score:
+                        best, best_score = candidate, score
+                if best is not None and best_score >= self.similarity_threshold:
+                    key = (bucket_key, best)
+                    self._data.move_to_end(key)
+                    self.similar_hits += 1
+                    return self._data[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, case_key: Tuple[str, str, str], fingerprint: str, question: str, reply: str):
+        """缓存回复"""
+        bucket_key = (case_key, fingerprint)
+        normalized = normalize_question(question)
+        key = (bucket_key, normalized)
+
+        self._data[key] = reply
+        self._data.move_to_end(key)
+
+        bucket = self._buckets.setdefault(bucket_key, {})
+        if normalized not in bucket and len(bucket) < MAX_BUCKET_SIZE:
+            bucket[normalized] = char_ngrams(normalized)
+
+        while len(self._data) > self.maxsize:
+            (old_bucket_key, old_question), _ = self._data.popitem(last=False)
+            self.evictions += 1
+            old_bucket = self._buckets.get(old_bucket_key)
+            if old_bucket is not None:
+                old_bucket.pop(old_question, None)
+                if not old_bucket:
+                    del self._buckets[old_bucket_key]
+
+    def clear(self):
+        self._data.clear()
+        self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        hits = self.exact_hits + self.similar_hits
+        total = hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def is_cache_enabled(case_data: Dict[str, Any]) -> bool:
+    """病例是否启用回复缓存（全局开关 + 病例级关闭）"""
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return False
+    if case_data.get("response_cache") is False:
+        return False
+    return case_data.get("case_id") not in settings.RESPONSE_CACHE_EXCLUDED_CASES
+
+
+# 全局单例
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """获取回复缓存单例"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            maxsize=settings.RESPONSE_CACHE_SIZE,
+            similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY
+        )
+    return _response_cache
@@ -1,5 +1,6 @@
 import re
 from typing import List, Tuple, Optional
+from app.core.pattern_matcher import PatternSet
 
 
 class SafetyFilter:
@@ -55,6 +56,50 @@ class SafetyFilter:
         ]
     }
 
+    # 患者回复中需要口语化替换的医学术语
+    MEDICAL_TERMS = [
+        "心绞痛", "心肌梗死", "冠脉",
+        "心电图", "CT", "MRI", "超声",
+        "抗生素", "消炎药", "降压药"
+    ]
+
+    # 患者回复违规模式（按优先级）
+    RESPONSE_VIOLATION_PATTERNS = {
+        "diagnosis": [r"(你是|你得了|可能是).*炎|症|病"],
+        "treatment": [r"(你应该|可以|建议).*吃|用|治"],
+    }
+
+    # 违规回复替换话术
+    RESPONSE_VIOLATION_REPLIES = {
+        "diagnosis": "我也不太清楚具体是什么病，就是特别难受。",
+        "treatment": "我不懂这些，您是医生，您说怎么办就怎么样。"
+    }
+
+    # 患者不应使用的病历书写用语
+    PROFESSIONAL_TERMS = ["主诉", "现病史", "既往史", "家族史"]
+
+    # 回复不符合患者角色时的兜底话术
+    ROLE_FALLBACK = "我...我现在不太舒服，能...能再说一遍吗？"
+
+    # 症状关键词（按类别）
+    SYMPTOM_KEYWORDS = [
+        ["疼", "痛", "不适"],  # 疼痛相关
+        ["咳", "喘", "气短"],  # 呼吸相关
+        ["吐", "泻", "恶心"],  # 消化相关
+        ["晕", "乏力"],        # 全身症状
+        ["发烧", "发热"],      # 体温
+    ]
+
+    # 编译后的匹配器：每条消息只扫描一次，即可得到所有命中类别
+    _danger_matcher = PatternSet(DANGER_SIGNALS)
+    _forbidden_matcher = PatternSet(FORBIDDEN_PATTERNS)
+    _violation_matcher = PatternSet(RESPONSE_VIOLATION_PATTERNS)
+    _medical_term_regex = re.compile("|".join(map(re.escape, MEDICAL_TERMS)))
+    _symptom_regex = re.compile("|".join(
+        re.escape(term) for group in SYMPTOM_KEYWORDS for term in group
+    ))
+    _symptom_group = {term: i for i, group in enumerate(SYMPTOM_KEYWORDS) for term in group}
+
     @classmethod
     def check_student_input(cls, message: str) -> Tuple[bool, Optional[str], Optional[str]]:
         """
@@ -67,10 +112,9 @@ class SafetyFilter:
             (是否安全, 警告类型, 处理后的消息)
         """
         # 检查危险信号
-        for signal_type, patterns in cls.DANGER_SIGNALS.items():
-            for pattern in patterns:
-                if re.search(pattern, message):
-                    return False, signal_type, message
+        signal_type = cls._danger_matcher.first_category(message)
+        if signal_type:
+            return False, signal_type, message
 
         return True, None, message
 
@@ -85,25 +129,13 @@ class SafetyFilter:
         Returns:
             (是否合规, 处理后的回复)
         """
-        # 检查是否包含医学术语
-        medical_terms = [
-            r"心绞痛", r"心肌梗死", r"冠脉",
-            r"心电图", r"CT", r"MRI", r"超声",
-            r"抗生素", r"消炎药", r"降压药"
-        ]
-
-        for term in medical_terms:
-            if term in response:
-                # 发现医学术语，替换为口语化表达
-                response = cls._replace_medical_term(response, term)
-
-        # 检查是否给出了诊断
-        if re.search(r"(你是|你得了|可能是).*炎|症|病", response):
-            return False, "我也不太清楚具体是什么病，就是特别难受。"
+        # 检查是否包含医学术语，发现后替换为口语化表达
+        response = cls.replace_medical_terms(response)
 
-        # 检查是否给出了治疗建议
-        if re.search(r"(你应该|可以|建议).*吃|用|治", response):
-            return False, "我不懂这些，您是医生，您说怎么办就怎么样。"
+        # 检查是否给出了诊断或治疗建议
+        violation = cls._violation_matcher.first_category(response)
+        if violation:
+            return False, cls.RESPONSE_VIOLATION_REPLIES[violation]
 
         return True, response
 
@@ -118,13 +150,21 @@ class SafetyFilter:
         Returns:
             (是否拒答, 拒答话术)
         """
-        for category, patterns in cls.FORBIDDEN_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, question):
-                    return True, cls.DENIAL_RESPONSES[category]
+        category = cls._forbidden_matcher.first_category(question)
+        if category:
+            return True, cls.DENIAL_RESPONSES[category]
 
         return False, None
 
+    @classmethod
+    def replace_medical_terms(cls, text: str) -> str:
+        """将文本中的所有医学术语替换为口语化表达"""
+        if cls._medical_term_regex.search(text):
+            for term in cls.MEDICAL_TERMS:
+                if term in text:
+                    text = cls._replace_medical_term(text, term)
+        return text
+
     @classmethod
     def _replace_medical_term(cls, text: str, term: str) -> str:
         """将医学术语替换为口语化表达"""
@@ -152,8 +192,7 @@ class SafetyFilter:
             是否符合角色设定
         """
         # 检查是否使用了过于专业的词汇
-        professional_terms = ["主诉", "现病史", "既往史", "家族史"]
-        for term in professional_terms:
+        for term in cls.PROFESSIONAL_TERMS:
             if term in response:
                 return False
 
@@ -174,17 +213,115 @@ class SafetyFilter:
         Returns:
             症状关键词列表
         """
-        symptom_keywords = [
-            r"疼|痛|不适",  # 疼痛相关
-            r"咳|喘|气短",  # 呼吸相关
-            r"吐|泻|恶心",  # 消化相关
-            r"晕|乏力",     # 全身症状
-            r"发烧|发热",   # 体温
-        ]
-
-        found = []
-        for pattern in symptom_keywords:
-            if re.search(pattern, message):
-                found.extend(re.findall(pattern, message))
+        # 按类别顺序、类别内按出现位置输出
+        hits = sorted(
+            (cls._symptom_group[match.group()], match.start(), match.group())
+            for match in cls._symptom_regex.finditer(message)
+        )
+        found = [term for _, _, term in hits]
 
         return found
+
+
+class StreamingResponseFilter:
+    """
+    增量患者回复过滤器 - 对流式输出逐块执行 check_patient_response 与角色一致性检查
+
+    只扣留可能拼成医学术语的最短后缀，其余文本替换术语后立即放行；
+    一旦已放行文本加上新片段出现诊断/治疗/角色违规，立即中止并给出兜底话术。
+    未中止时，放行文本之和与对完整回复调用 check_patient_response 的结果一致。
+    """
+
+    # 医学术语的所有真前缀，用于判断需要扣留的尾部
+    _term_prefixes = {
+        term[:i] for term in SafetyFilter.MEDICAL_TERMS for i in range(1, len(term))
+    }
+    _max_hold = max(len(term) for term in SafetyFilter.MEDICAL_TERMS) - 1
+
+    # 角色检查需要先拿到开头两个字（"建议"/"应该"）
+    _role_prefix_len = 2
+
+    def __init__(self, check_role: bool = True):
+        """
+        Args:
+            check_role: 是否同时执行角色一致性检查
+        """
+        self.check_role = check_role
+        self.aborted = False
+        self.fallback: Optional[str] = None
+        self._pending = ""
+        self._emitted = ""
+
+    @property
+    def text(self) -> str:
+        """当前的最终回复文本（中止时为兜底话术）"""
+        return self.fallback if self.aborted else self._emitted
+
+    def feed(self, chunk: str) -> str:
+        """
+        输入一段增量文本
+
+        Args:
+            chunk: LLM输出的增量片段
+
+        Returns:
+            可以立即发送的安全文本（可能为空）
+        """
+        if self.aborted:
+            return ""
+
+        buffer = self._pending + chunk
+        return self._release(buffer, self._safe_cut(buffer), final=False)
+
+    def finish(self) -> str:
+        """
+        输入结束，放行剩余文本
+
+        Returns:
+            剩余的安全文本（可能为空）
+        """
+        if self.aborted:
+            return ""
+
+        return self._release(self._pending, len(self._pending), final=True)
+
+    def _safe_cut(self, buffer: str) -> int:
+        """计算可以放行的原始文本长度"""
+        hold = 0
+        for size in range(min(self._max_hold, len(buffer)), 0, -1):
+            if buffer[-size:] in self._term_prefixes:
+                hold = size
+                break
+
+        cut = len(buffer) - hold
+        # 不在完整术语中间切断
+        for match in SafetyFilter._medical_term_regex.finditer(buffer):
+            if match.start() < cut < match.end():
+                cut = match.end()
+        return cut
+
+    def _release(self, buffer: str, cut: int, final: bool) -> str:
+        segment = SafetyFilter.replace_medical_terms(buffer[:cut])
+        candidate = self._emitted + segment
+
+        violation = SafetyFilter._violation_matcher.first_category(candidate)
+        if violation:
+            return self._abort(SafetyFilter.RESPONSE_VIOLATION_REPLIES[violation])
+
+        if self.check_role:
+            if not final and len(candidate) < self._role_prefix_len:
+                # 开头不足两个字，暂不放行
+                self._pending = buffer
+                return ""
+            if not SafetyFilter.check_role_consistency(candidate, 0):
+                return self._abort(SafetyFilter.ROLE_FALLBACK)
+
+        self._pending = buffer[cut:]
+        self._emitted = candidate
+        return segment
+
+    def _abort(self, fallback: str) -> str:
+        self.aborted = True
+        self.fallback = fallback
+        self._pending = ""
+        return ""
@@ -9,10 +9,21 @@
 
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import asyncio
+import logging
 import re
+import time
+from app.config import settings
+from app.core.case_index import extract_keywords, get_case_index
+from app.core.scoring_lexicon import ScoringLexicon, get_scoring_lexicon
 from app.services.baichuan_service import get_baichuan_service
 
+logger = logging.getLogger(__name__)
+
+# 诊断文本分词（部分匹配判断）
+_WORD = re.compile(r'[\w]+')
+
 
 @dataclass
 class ScoringResult:
@@ -54,6 +65,15 @@ class ScoringResult:
     # 元数据
     ai_comments: str
 
+    # 百川评估原始分数（批量重算时复用，无需再次调用大模型）
+    llm_scores: Dict[str, float] = field(default_factory=dict)
+
+    # 百川评估超过截止时间时为True，此时分数仅来自规则评分
+    llm_pending: bool = False
+
+    # 百川评估返回后产出融合结果的任务（仅 llm_pending 时存在）
+    llm_fusion: Optional["asyncio.Task"] = field(default=None, repr=False, compare=False)
+
 
 class ScoringEngine:
     """评分引擎"""
@@ -83,34 +103,145 @@ class ScoringEngine:
         "pass_turns": 5,                # 及格轮次
     }
 
-    def __init__(self, weights: Dict[str, float] = None, standards: Dict[str, Any] = None):
+    def __init__(
+        self,
+        weights: Dict[str, float] = None,
+        standards: Dict[str, Any] = None,
+        lexicon: Optional[ScoringLexicon] = None
+    ):
         """
         初始化评分引擎
 
         Args:
             weights: 评分权重配置
             standards: 评分标准配置
+            lexicon: 评分词表，默认使用全局词表（随配置文件热加载）
         """
         self.weights = weights or self.DEFAULT_WEIGHTS.copy()
         self.standards = standards or self.DEFAULT_STANDARDS.copy()
+        self._lexicon = lexicon
+
+    @property
+    def lexicon(self) -> ScoringLexicon:
+        """当前使用的评分词表（礼貌/共情/症状维度等预编译模式）"""
+        return self._lexicon or get_scoring_lexicon()
+
+    @classmethod
+    def from_rule(cls, rule) -> "ScoringEngine":
+        """
+        按评分规则配置创建评分引擎
+
+        Args:
+            rule: ScoringRule记录
+
+        Returns:
+            ScoringEngine对象
+        """
+        weights = {
+            "inquiry": float(rule.inquiry_weight),
+            "diagnosis": float(rule.diagnosis_weight),
+            "communication": float(rule.communication_weight)
+        }
+        standards = {
+            "key_question_score": float(rule.key_question_score),
+            "symptom_detail_score": float(rule.symptom_detail_score),
+            "logic_score": float(rule.logic_score),
+            "etiquette_score": float(rule.etiquette_score),
+            "correct_score": float(rule.diagnosis_correct_score),
+            "partial_score": float(rule.diagnosis_partial_score),
+            "wrong_score": float(rule.diagnosis_wrong_score),
+            "full_turns": rule.min_turns_for_full_score,
+            "pass_turns": rule.min_turns_for_pass_score
+        }
+        return cls(weights=weights, standards=standards)
 
     async def score_session(
         self,
         conversation_history: List[Dict[str, Any]],
         student_diagnosis: str,
-        case_data: Dict[str, Any]
+        case_data: Dict[str, Any],
+        llm_deadline: Optional[float] = None,
+        rule_features: Optional[Dict[str, Any]] = None
     ) -> ScoringResult:
         """
         对整个会话进行评分
 
+        规则评分在线程中执行，与百川评估并行。百川评估超过截止时间时，
+        先返回仅含规则评分的结果（llm_pending=True），并通过 llm_fusion
+        任务在评估返回后产出融合结果，供调用方补写。
+
         Args:
             conversation_history: 对话历史
             student_diagnosis: 学生诊断
             case_data: 病例数据
+            llm_deadline: 等待百川评估的截止时间（秒），默认取配置，<=0 表示一直等待
+            rule_features: 增量评分已累积的规则特征，提供时不再重新扫描对话
 
         Returns:
             ScoringResult对象
         """
+        started = time.monotonic()
+        if llm_deadline is None:
+            llm_deadline = settings.SCORING_LLM_DEADLINE
+
+        # 1. 先发起百川大模型智能评估
+        baichuan_service = get_baichuan_service()
+        llm_task = asyncio.create_task(
+            baichuan_service.evaluate_student_performance(
+                case_data, conversation_history, student_diagnosis
+            )
+        )
+
+        # 2. 规则评分（问诊/诊断/沟通）放到线程中，不阻塞事件循环
+        try:
+            if rule_features is not None:
+                rule_results = self._rule_results(rule_features)
+            else:
+                rule_results = await asyncio.to_thread(
+                    self._score_rules,
+                    conversation_history,
+                    student_diagnosis,
+                    case_data
+                )
+        except BaseException:
+            llm_task.cancel()
+            raise
+
+        # 3. 在截止时间内等待百川结果
+        try:
+            if llm_deadline > 0:
+                remaining = max(llm_deadline - (time.monotonic() - started), 0)
+                llm_result = await asyncio.wait_for(asyncio.shield(llm_task), timeout=remaining)
+            else:
+                llm_result = await llm_task
+        except asyncio.TimeoutError:
+            logger.warning(f"百川评估超过截止时间({llm_deadline}s)，先返回规则评分")
+            result = self._build_result(*rule_results, llm_result=None, case_data=case_data)
+            result.llm_pending = True
+            result.llm_fusion = asyncio.create_task(
+                self._fuse_when_ready(llm_task, rule_results, case_data)
+            )
+            return result
+
+        return self._build_result(*rule_results, llm_result=llm_result, case_data=case_data)
+
+    async def _fuse_when_ready(
+        self,
+        llm_task: "asyncio.Task",
+        rule_results: Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]],
+        case_data: Dict[str, Any]
+    ) -> ScoringResult:
+        """等待迟到的百川评估并生成融合结果"""
+        llm_result = await llm_task
+        return self._build_result(*rule_results, llm_result=llm_result, case_data=case_data)
+
+    def _score_rules(
+        self,
+        conversation_history: List[Dict[str, Any]],
+        student_diagnosis: str,
+        case_data: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+        """规则评分：返回 (问诊, 诊断, 沟通) 结果"""
         # 1. 问诊评分 (规则基础)
         inquiry_result = self._score_inquiry(conversation_history, case_data)
 
@@ -124,21 +255,153 @@ class ScoringEngine:
         # 3. 沟通评分 (规则基础)
         communication_result = self._score_communication(conversation_history)
 
-        # 4. 调用百川大模型进行智能评估
-        baichuan_service = get_baichuan_service()
-        llm_result = await baichuan_service.evaluate_student_performance(
-            case_data, conversation_history, student_diagnosis
+        return inquiry_result, diagnosis_result, communication_result
+
+    def rule_features(
+        self,
+        conversation_history: List[Dict[str, Any]],
+        student_diagnosis: str,
+        case_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        提取与评分标准无关的规则特征
+
+        规则评分 = 特征 x 评分标准，评分规则变更时只需用新标准重新组合特征
+        （见 app/services/batch_rescoring.py），结果与 _score_rules 一致。
+
+        Args:
+            conversation_history: 对话历史
+            student_diagnosis: 学生诊断
+            case_data: 病例数据
+
+        Returns:
+            特征字典
+        """
+        student_messages = [
+            msg for msg in conversation_history
+            if msg.get("role") == "student"
+        ]
+        student_questions = [msg.get("content", "") for msg in student_messages]
+        key_questions = case_data.get("key_questions", [])
+        covered, missed = self._match_key_questions(student_questions, key_questions)
+
+        accuracy, _ = self._check_diagnosis_accuracy(
+            student_diagnosis,
+            case_data.get("standard_diagnosis", "")
+        )
+        polite_rate, _ = self._score_polite_expression(student_messages)
+
+        avg_length = 0
+        if student_messages:
+            avg_length = sum(len(q) for q in student_questions) / len(student_messages)
+
+        return {
+            "covered": covered,
+            "missed": missed,
+            "coverage_rate": len(covered) / len(key_questions) if key_questions else 0,
+            "symptom_dimensions": self._count_symptom_dimensions(student_questions),
+            "question_count": len(student_questions),
+            "duplicates": self._count_duplicate_questions(student_questions),
+            "etiquette_rate": self._polite_ratio(student_questions),
+            "accuracy": accuracy,
+            "differential_count": self._count_differential_mentioned(
+                student_diagnosis,
+                conversation_history,
+                case_data.get("differential_diagnosis", [])
+            ),
+            "reasoning_score": self._score_diagnosis_reasoning(conversation_history, case_data),
+            "turn_count": len(student_messages),
+            "avg_length": avg_length,
+            "polite_rate": polite_rate,
+            "empathy_score": self._score_empathy(student_messages)
+        }
+
+    def _rule_results(
+        self,
+        features: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+        """
+        由规则特征按评分标准组合出 (问诊, 诊断, 沟通) 结果
+
+        与 _score_rules 对同一会话的结果一致，用于增量评分（会话结束时只需组合，
+        不必重新扫描对话）。
+        """
+        standards = self.standards
+        covered, missed = features["covered"], features["missed"]
+
+        symptom_max = standards["symptom_detail_score"]
+        symptom_score = min(
+            features["symptom_dimensions"] * symptom_max / len(self.lexicon.symptom_dimensions),
+            symptom_max
         )
+        logic_score = 0
+        if features["question_count"]:
+            logic_score = max(standards["logic_score"] - features["duplicates"] * 2, 0)
+        etiquette_score = features["etiquette_rate"] * standards["etiquette_score"]
+        key_question_score = features["coverage_rate"] * standards["key_question_score"]
+
+        inquiry_result = {
+            "covered_count": len(covered),
+            "total_count": len(covered) + len(missed),
+            "coverage_rate": features["coverage_rate"],
+            "covered": covered,
+            "missed": missed,
+            "symptom_score": symptom_score,
+            "logic_score": logic_score,
+            "etiquette_score": etiquette_score,
+            "total": key_question_score + symptom_score + logic_score + etiquette_score
+        }
+
+        base_score = {
+            "correct": standards["correct_score"],
+            "partial": standards["partial_score"]
+        }.get(features["accuracy"], standards["wrong_score"])
+        diagnosis_result = {
+            "accuracy": features["accuracy"],
+            "differential_count": features["differential_count"],
+            "reasoning_score": features["reasoning_score"],
+            "total": min(base_score + features["reasoning_score"], 35)
+        }
+
+        turn_score = self._score_turn_count(features["turn_count"])
+        communication_result = {
+            "turn_count": features["turn_count"],
+            "avg_length": features["avg_length"],
+            "polite_rate": features["polite_rate"],
+            "empathy_score": features["empathy_score"],
+            "total": min(turn_score + features["polite_rate"] * 5 + features["empathy_score"], 25)
+        }
+
+        return inquiry_result, diagnosis_result, communication_result
+
+    def score_features(
+        self,
+        features: Dict[str, Any],
+        case_data: Dict[str, Any]
+    ) -> ScoringResult:
+        """仅按规则特征评分（不调用大模型），用于会话进行中的实时分数"""
+        return self._build_result(*self._rule_results(features), llm_result=None, case_data=case_data)
+
+    def _build_result(
+        self,
+        inquiry_result: Dict[str, Any],
+        diagnosis_result: Dict[str, Any],
+        communication_result: Dict[str, Any],
+        llm_result: Optional[Dict[str, Any]],
+        case_data: Dict[str, Any]
+    ) -> ScoringResult:
+        """融合规则评分与百川评估（可为空），生成最终结果"""
+        # 复制规则结果，融合时不修改原始数据（迟到的百川结果还需要再次融合）
+        inquiry_result = dict(inquiry_result)
+        diagnosis_result = dict(diagnosis_result)
+        communication_result = dict(communication_result)
+        llm_result = llm_result or {"scores": {}}
 
         # 5. 融合分数 (LLM 修正)
         # 问诊逻辑: 规则(20分) -> LLM(25分) * 0.8
         if llm_result["scores"].get("inquiry_logic", 0) > 0:
             inquiry_result["logic_score"] = llm_result["scores"]["inquiry_logic"] * 0.8
             # 重新计算问诊总分
-            inquiry_result["total"] = (
-                inquiry_result["total"] - self.standards["logic_score"] # 减去原满分/得分? 应该是重新加和
-                # 由于 _score_inquiry 返回的是各部分得分，我们可以重新计算 total
-            )
             inquiry_result["total"] = (
                 inquiry_result["key_question_score"] if "key_question_score" in inquiry_result else (inquiry_result["coverage_rate"] * self.standards["key_question_score"]) +
                 inquiry_result["symptom_score"] +
@@ -237,7 +500,9 @@ class ScoringEngine:
             suggestions=suggestions,
 
             # AI评语
-            ai_comments=ai_comments
+            ai_comments=ai_comments,
+
+            llm_scores=dict(llm_result["scores"])
         )
 
     def _score_inquiry(
@@ -265,24 +530,7 @@ class ScoringEngine:
         key_questions = case_data.get("key_questions", [])
 
         # 1. 检查关键问题覆盖
-        covered = []
-        missed = []
-
-        for question in key_questions:
-            found = False
-            question_lower = question.lower()
-
-            for student_q in student_questions:
-                # 检查是否包含关键词
-                keywords = self._extract_keywords(question)
-                if any(kw.lower() in student_q.lower() for kw in keywords):
-                    found = True
-                    break
-
-            if found:
-                covered.append(question)
-            else:
-                missed.append(question)
+        covered, missed = self._match_key_questions(student_questions, key_questions)
 
         coverage_rate = len(covered) / len(key_questions) if key_questions else 0
         key_question_score = coverage_rate * self.standards["key_question_score"]
@@ -404,17 +652,15 @@ class ScoringEngine:
 
     def _extract_keywords(self, question: str) -> List[str]:
         """从问题中提取关键词"""
-        # 移除标点符号
-        question = re.sub(r'[^\w\s]', '', question)
-
-        # 分词
-        words = question.split()
+        return extract_keywords(question)
 
-        # 过滤掉常用词
-        stop_words = {"的", "了", "是", "在", "有", "和", "与", "或"}
-        keywords = [w for w in words if w not in stop_words and len(w) > 1]
-
-        return keywords
+    def _match_key_questions(
+        self,
+        student_questions: List[str],
+        key_questions: List[str]
+    ) -> Tuple[List[str], List[str]]:
+        """关键问题覆盖检查，返回 (已覆盖, 未覆盖)"""
+        return get_case_index(key_questions).match(student_questions)
 
     def _score_symptom_inquiry(
         self,
@@ -426,32 +672,13 @@ class ScoringEngine:
 
         检查是否询问了症状的各个维度
         """
-        symptoms = case_data.get("symptoms", {})
-        all_text = " ".join(questions).lower()
-
-        score = 0
         max_score = self.standards["symptom_detail_score"]
+        asked = self._count_symptom_dimensions(questions)
+        return min(asked * max_score / len(self.lexicon.symptom_dimensions), max_score)
 
-        # 检查各个症状维度
-        dimensions = [
-            ("部位", symptoms.get("location", ""), ["部位", "哪里", "位置"]),
-            ("性质", symptoms.get("nature", ""), ["性质", "怎么", "样", "感觉"]),
-            ("程度", symptoms.get("severity", ""), ["程度", "多", "严重", "几分"]),
-            ("持续时间", symptoms.get("duration", ""), ["多久", "多长时间", "持续"]),
-            ("诱因", symptoms.get("aggravating_factors", []), ["诱因", "什么", "原因", "引起"]),
-            ("缓解因素", symptoms.get("relieving_factors", []), ["缓解", "怎么", "舒服"]),
-            ("伴随症状", symptoms.get("associated_symptoms", []), ["还", "其他", "伴随"])
-        ]
-
-        for dim_name, dim_value, keywords in dimensions:
-            if isinstance(dim_value, list):
-                dim_value = " ".join(dim_value)
-
-            # 检查是否询问了该维度
-            if any(kw in all_text for kw in keywords):
-                score += max_score / len(dimensions)
-
-        return min(score, max_score)
+    def _count_symptom_dimensions(self, questions: List[str]) -> int:
+        """统计询问到的症状维度数"""
+        return len(self.lexicon.symptom_hits(questions))
 
     def _score_inquiry_logic(
         self,
@@ -469,20 +696,28 @@ class ScoringEngine:
         max_score = self.standards["logic_score"]
         score = max_score  # 默认满分
 
-        # 检查是否有重复问题
+        # 重复问题扣分
+        duplicates = self._count_duplicate_questions(questions)
+        if duplicates > 0:
+            score -= (duplicates * 2)
+
+        return max(score, 0)
+
+    @staticmethod
+    def _normalize_question(question: str) -> str:
+        """重复提问判断时的问题规范化（小写、去标点）"""
+        return ScoringLexicon.normalize_question(question)
+
+    def _count_duplicate_questions(self, questions: List[str]) -> int:
+        """统计重复提问次数"""
         unique_questions = set()
         duplicates = 0
         for q in questions:
-            q_normalized = re.sub(r'[^\w\s]', '', q.lower().strip())
+            q_normalized = self._normalize_question(q)
             if q_normalized in unique_questions and len(q_normalized) > 5:
                 duplicates += 1
             unique_questions.add(q_normalized)
-
-        # 重复问题扣分
-        if duplicates > 0:
-            score -= (duplicates * 2)
-
-        return max(score, 0)
+        return duplicates
 
     def _score_medical_etiquette(self, questions: List[str]) -> float:
         """
@@ -490,27 +725,14 @@ class ScoringEngine:
 
         检查是否有礼貌用语
         """
-        max_score = self.standards["etiquette_score"]
-
-        polite_patterns = [
-            r"请", r"您好", r"麻烦", r"谢谢", r"不好意思"
-        ]
+        return self._polite_ratio(questions) * self.standards["etiquette_score"]
 
-        polite_count = 0
-        for q in questions:
-            for pattern in polite_patterns:
-                if re.search(pattern, q):
-                    polite_count += 1
-                    break
-
-        # 至少一半的问题有礼貌用语才能得满分
-        if len(questions) > 0:
-            polite_rate = polite_count / len(questions)
-            score = polite_rate * max_score
-        else:
-            score = 0
+    def _polite_ratio(self, questions: List[str]) -> float:
+        """含礼貌用语的问题占比"""
+        if not questions:
+            return 0
 
-        return score
+        return self.lexicon.count("etiquette", questions) / len(questions)
 
     def _check_diagnosis_accuracy(
         self,
@@ -526,8 +748,8 @@ class ScoringEngine:
             return "correct", self.standards["correct_score"]
 
         # 部分匹配（包含关键词）
-        student_words = set(re.findall(r'[\w]+', student_lower))
-        standard_words = set(re.findall(r'[\w]+', standard_lower))
+        student_words = set(_WORD.findall(student_lower))
+        standard_words = set(_WORD.findall(standard_lower))
         overlap = student_words & standard_words
 
         if len(overlap) >= 2:
@@ -574,17 +796,11 @@ class ScoringEngine:
             return 0
 
         # 检查关键问题覆盖率
-        covered = 0
-        for question in key_questions:
-            keywords = self._extract_keywords(question)
-            for student_q in student_questions:
-                if any(kw.lower() in student_q.lower() for kw in keywords):
-                    covered += 1
-                    break
-
-        coverage_rate = covered / len(key_questions)
+        covered, _ = self._match_key_questions(student_questions, key_questions)
+        return self._reasoning_from_coverage(len(covered) / len(key_questions))
 
-        # 基于覆盖率给推理分
+    def _reasoning_from_coverage(self, coverage_rate: float) -> float:
+        """基于关键问题覆盖率给推理分"""
         if coverage_rate >= 0.8:
             return 10
         elif coverage_rate >= 0.6:
@@ -614,17 +830,7 @@ class ScoringEngine:
         if not messages:
             return 0, 0
 
-        polite_patterns = [
-            r"请", r"您好", r"麻烦", r"谢谢", r"不好意思", r"请问"
-        ]
-
-        polite_count = 0
-        for msg in messages:
-            content = msg.get("content", "")
-            for pattern in polite_patterns:
-                if re.search(pattern, content):
-                    polite_count += 1
-                    break
+        polite_count = self.lexicon.count("polite", [msg.get("content", "") for msg in messages])
 
         polite_rate = polite_count / len(messages)
         polite_score = polite_rate * 5
@@ -633,18 +839,7 @@ class ScoringEngine:
 
     def _score_empathy(self, messages: List[Dict[str, Any]]) -> float:
         """共情评分"""
-        empathy_patterns = [
-            r"理解", r"担心", r"不容易", r"别急", r"慢慢来",
-            r"感受", r"心情", r"安慰"
-        ]
-
-        empathy_count = 0
-        for msg in messages:
-            content = msg.get("content", "")
-            for pattern in empathy_patterns:
-                if re.search(pattern, content):
-                    empathy_count += 1
-                    break
+        empathy_count = self.lexicon.count("empathy", [msg.get("content", "") for msg in messages])
 
         # 最多5分
         return min(empathy_count, 5)
@@ -0,0 +1,227 @@
+"""
+评分词表 - 规则评分使用的各类模式，加载时预编译
+
+- 医德医风/礼貌表达/共情：每类模式编译成一个组合正则，每条消息一次扫描
+- 症状询问维度：全部维度关键词编译成一个 PatternSet（类别为维度序号）
+- 重复提问判断的规范化正则
+
+默认词表内置在本模块；配置 SCORING_LEXICON_PATH 指向JSON文件时从文件
+加载（缺少的类别使用默认值），并按 SCORING_LEXICON_RELOAD_SECONDS 间隔
+检查文件修改时间，文件变化后自动重新编译，无需重启服务。
+
+JSON格式:
+    {
+        "etiquette": ["请", "您好"],
+        "polite": ["请", "请问"],
+        "empathy": ["理解", "担心"],
+        "symptom_dimensions": {"部位": ["部位", "哪里"]}
+    }
+其中前三类为正则模式，症状维度关键词按字面量匹配。
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from app.config import settings
+from app.core.pattern_matcher import PatternSet
+
+logger = logging.getLogger(__name__)
+
+# 医德医风（提问中的礼貌用语）
+DEFAULT_ETIQUETTE_PATTERNS = [r"请", r"您好", r"麻烦", r"谢谢", r"不好意思"]
+
+# 沟通中的礼貌表达
+DEFAULT_POLITE_PATTERNS = [r"请", r"您好", r"麻烦", r"谢谢", r"不好意思", r"请问"]
+
+# 共情表达
+DEFAULT_EMPATHY_PATTERNS = [
+    r"理解", r"担心", r"不容易", r"别急", r"慢慢来",
+    r"感受", r"心情", r"安慰"
+]
+
+# 症状询问维度: (维度, 关键词)
+DEFAULT_SYMPTOM_DIMENSIONS = [
+    ("部位", ["部位", "哪里", "位置"]),
+    ("性质", ["性质", "怎么", "样", "感觉"]),
+    ("程度", ["程度", "多", "严重", "几分"]),
+    ("持续时间", ["多久", "多长时间", "持续"]),
+    ("诱因", ["诱因", "什么", "原因", "引起"]),
+    ("缓解因素", ["缓解", "怎么", "舒服"]),
+    ("伴随症状", ["还", "其他", "伴随"])
+]
+
+# 重复提问判断时去除的标点
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+PATTERN_FAMILIES = ("etiquette", "polite", "empathy")
+
+
+def _combine(patterns: List[str]) -> Optional[re.Pattern]:
+    """一类模式编译成一个组合正则（空列表返回None，表示永不命中）"""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+
+class ScoringLexicon:
+    """预编译的评分词表"""
+
+    def __init__(
+        self,
+        families: Optional[Dict[str, List[str]]] = None,
+        symptom_dimensions: Optional[List[Tuple[str, List[str]]]] = None,
+        version: str = "default"
+    ):
+        """
+        编译词表
+
+        Args:
+            families: {类别: [正则模式, ...]}，类别为 etiquette/polite/empathy，缺省使用默认模式
+            symptom_dimensions: [(维度, [关键词, ...]), ...]，缺省使用默认维度
+            version: 词表版本（增量评分快照据此判断是否仍然有效）
+        """
+        families = families or {}
+        defaults = {
+            "etiquette": DEFAULT_ETIQUETTE_PATTERNS,
+            "polite": DEFAULT_POLITE_PATTERNS,
+            "empathy": DEFAULT_EMPATHY_PATTERNS
+        }
+        self.patterns: Dict[str, List[str]] = {
+            family: list(families.get(family, defaults[family])) for family in PATTERN_FAMILIES
+        }
+        self.symptom_dimensions = list(symptom_dimensions or DEFAULT_SYMPTOM_DIMENSIONS)
+        self.version = version
+
+        self._compiled = {family: _combine(patterns) for family, patterns in self.patterns.items()}
+        dimension_patterns = {
+            i: [re.escape(kw.lower()) for kw in keywords]
+            for i, (_, keywords) in enumerate(self.symptom_dimensions) if keywords
+        }
+        self._dimensions: Optional[PatternSet] = PatternSet(dimension_patterns) if dimension_patterns else None
+
+    @classmethod
+    def load(cls, path: Path) -> "ScoringLexicon":
+        """
+        从JSON文件加载词表
+
+        Args:
+            path: 词表文件路径
+
+        Returns:
+            ScoringLexicon对象，版本为文件内容的哈希
+        """
+        raw = Path(path).read_bytes()
+        data = json.loads(raw.decode("utf-8"))
+        dimensions = data.get("symptom_dimensions")
+        return cls(
+            families={family: data[family] for family in PATTERN_FAMILIES if family in data},
+            symptom_dimensions=list(dimensions.items()) if dimensions else None,
+            version=hashlib.sha1(raw).hexdigest()[:12]
+        )
+
+    def matches(self, family: str, text: str) -> bool:
+        """
+        文本是否命中某类模式
+
+        Args:
+            family: 模式类别（etiquette/polite/empathy）
+            text: 待检测文本
+        """
+        compiled = self._compiled[family]
+        return compiled is not None and compiled.search(text) is not None
+
+    def count(self, family: str, texts: List[str]) -> int:
+        """命中某类模式的文本条数"""
+        compiled = self._compiled[family]
+        if compiled is None:
+            return 0
+        search = compiled.search
+        return sum(1 for text in texts if search(text))
+
+    def symptom_hits(self, questions: List[str]) -> Set[int]:
+        """
+        询问到的症状维度序号
+
+        Args:
+            questions: 学生提问列表
+        """
+        if self._dimensions is None or not questions:
+            return set()
+        return self._dimensions.categories_in(" ".join(questions).lower())
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """重复提问判断时的问题规范化（小写、去标点）"""
+        return _PUNCTUATION.sub('', question.lower().strip())
+
+
+class LexiconLoader:
+    """按文件修改时间热加载评分词表"""
+
+    def __init__(self, path: str = "", reload_seconds: int = 30):
+        """
+        Args:
+            path: 词表JSON路径，为空时使用内置默认词表
+            reload_seconds: 检查文件修改时间的间隔（秒）
+        """
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._lexicon = ScoringLexicon()
+        self._mtime: Optional[float] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def get(self) -> ScoringLexicon:
+        """获取当前词表（到检查间隔时若文件已修改则重新编译）"""
+        if self.path and time.monotonic() - self._checked_at >= self.reload_seconds:
+            self.reload()
+        return self._lexicon
+
+    def reload(self, force: bool = False) -> ScoringLexicon:
+        """
+        检查并重新加载词表文件
+
+        加载失败时保留当前词表。
+
+        Args:
+            force: 忽略修改时间强制重新加载
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if not self.path:
+                return self._lexicon
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if force or mtime != self._mtime:
+                    self._lexicon = ScoringLexicon.load(Path(self.path))
+                    self._mtime = mtime
+                    self.reloads += 1
+                    logger.info(f"评分词表已加载: {self.path} (版本 {self._lexicon.version})")
+            except (OSError, ValueError, TypeError, AttributeError, re.error) as e:
+                logger.warning(f"评分词表加载失败({self.path}): {e}，继续使用当前词表")
+            return self._lexicon
+
+
+# 全局单例
+_loader: Optional[LexiconLoader] = None
+
+
+def get_lexicon_loader() -> LexiconLoader:
+    """获取词表加载器单例"""
+    global _loader
+    if _loader is None:
+        _loader = LexiconLoader(settings.SCORING_LEXICON_PATH, settings.SCORING_LEXICON_RELOAD_SECONDS)
+    return _loader
+
+
+def get_scoring_lexicon() -> ScoringLexicon:
+    """获取当前评分词表"""
+    return get_lexicon_loader().get()
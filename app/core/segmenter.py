@@ -0,0 +1,234 @@
+"""
+中文分词 - 关键问题关键词提取使用的可替换分词层
+
+- WhitespaceSegmenter: 按空白切分（原有行为）
+- MaxMatchSegmenter: 基于医学词典的双向最大匹配，未登录的连续单字合并为一个词
+
+词典文件（每行一个词）每个进程只读取一次，载入内存中的集合；分词结果
+按 (文本, 词典版本) 做LRU缓存，词典内容变化后旧结果自然失效。关键问题的
+数量有限，评分热路径上的分词几乎全部命中缓存。
+"""
+
+from typing import Dict, List, Optional, Protocol, Set, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import logging
+import re
+import threading
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEXICON_PATH = Path(__file__).resolve().parent.parent.parent / "data" / "lexicon" / "medical_lexicon.txt"
+
+# 中文连续段 / 其他文字（字母、数字）连续段，标点和空白作为分隔
+_TOKEN_RUN = re.compile(r"([\u4e00-\u9fff]+)|([^\W\u4e00-\u9fff]+)")
+
+
+class Segmenter(Protocol):
+    """分词器接口"""
+    # 分词结果缓存的版本标识（词典变化时改变）
+    version: str
+
+    def cut(self, text: str) -> List[str]: ...
+
+
+class WhitespaceSegmenter:
+    """按空白切分"""
+
+    version = "whitespace"
+
+    def cut(self, text: str) -> List[str]:
+        return text.split()
+
+
+class Lexicon:
+    """分词词典"""
+
+    def __init__(self, words: Set[str], version: str):
+        self.words = words
+        self.version = version
+        self.max_len = max((len(w) for w in words), default=1)
+
+    @classmethod
+    def load(cls, path: Path) -> "Lexicon":
+        """
+        加载词典文件
+
+        Args:
+            path: 词典路径（UTF-8，每行一个词，# 开头为注释）
+
+        Returns:
+            Lexicon对象，版本为文件内容的哈希
+        """
+        raw = Path(path).read_bytes()
+        words: Set[str] = set()
+        for line in raw.decode("utf-8").splitlines():
+            word = line.strip()
+            if word and not word.startswith("#"):
+                words.add(word)
+        return cls(words, hashlib.sha1(raw).hexdigest()[:12])
+
+
+class MaxMatchSegmenter:
+    """基于词典的双向最大匹配分词"""
+
+    def __init__(self, lexicon: Lexicon):
+        self.lexicon = lexicon
+        self.version = f"mm:{lexicon.version}"
+
+    def cut(self, text: str) -> List[str]:
+        tokens: List[str] = []
+        for match in _TOKEN_RUN.finditer(text):
+            chinese, other = match.groups()
+            if chinese:
+                tokens.extend(self._cut_chinese(chinese))
+            else:
+                tokens.append(other)
+        return tokens
+
+    def _forward(self, text: str) -> List[str]:
+        words = self.lexicon.words
+        tokens = []
+        i = 0
+        while i < len(text):
+            for size in range(min(self.lexicon.max_len, len(text) - i), 0, -1):
+                if size == 1 or text[i:i + size] in words:
+                    tokens.append(text[i:i + size])
+                    i += size
+                    break
+        return tokens
+
+    def _backward(self, text: str) -> List[str]:
+        words = self.lexicon.words
+        tokens = []
+        j = len(text)
+        while j > 0:
+            for size in range(min(self.lexicon.max_len, j), 0, -1):
+                if size == 1 or text[j - size:j] in words:
+                    tokens.append(text[j - size:j])
+                    j -= size
+                    break
+        tokens.reverse()
+        return tokens
+
+    def _cut_chinese(self, text: str) -> List[str]:
+        """
+        中文段分词
+
+        正向与逆向最大匹配取词数少的一种；词数相同时取单字少的，
+        仍相同时取逆向结果（中文里逆向最大匹配的歧义更少）。
+        """
+        forward = self._forward(text)
+        backward = self._backward(text)
+
+        def cost(tokens: List[str]) -> Tuple[int, int]:
+            return len(tokens), sum(1 for t in tokens if len(t) == 1)
+
+        tokens = forward if cost(forward) < cost(backward) else backward
+        return self._merge_unknown(tokens)
+
+    def _merge_unknown(self, tokens: List[str]) -> List[str]:
+        """合并连续的未登录单字，词典外的词不会被拆成单字后当作停用字丢弃"""
+        words = self.lexicon.words
+        merged: List[str] = []
+        run = ""
+        for token in tokens:
+            if len(token) == 1 and token not in words:
+                run += token
+                continue
+            if run:
+                merged.append(run)
+                run = ""
+            merged.append(token)
+        if run:
+            merged.append(run)
+        return merged
+
+
+class SegmentCache:
+    """分词结果LRU缓存，键为 (文本, 分词器版本)"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, str], Tuple[str, ...]]" = OrderedDict()
+        # 评分在线程池中执行，需加锁
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[Tuple[str, ...]]:
+        with self._lock:
+            tokens = self._data.get(key)
+            if tokens is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return tokens
+
+    def put(self, key: Tuple[str, str], tokens: Tuple[str, ...]):
+        with self._lock:
+            self._data[key] = tokens
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# 全局单例
+_segmenter: Optional[Segmenter] = None
+_cache: Optional[SegmentCache] = None
+
+
+def get_segmenter() -> Segmenter:
+    """获取分词器单例（KEYWORD_SEGMENTER: max_match / whitespace）"""
+    global _segmenter
+    if _segmenter is None:
+        if settings.KEYWORD_SEGMENTER == "whitespace":
+            _segmenter = WhitespaceSegmenter()
+        else:
+            path = Path(settings.SEGMENTER_LEXICON_PATH) if settings.SEGMENTER_LEXICON_PATH else DEFAULT_LEXICON_PATH
+            try:
+                _segmenter = MaxMatchSegmenter(Lexicon.load(path))
+            except OSError as e:
+                logger.warning(f"分词词典加载失败({path}): {e}，改为按空白切分")
+                _segmenter = WhitespaceSegmenter()
+    return _segmenter
+
+
+def get_segment_cache() -> SegmentCache:
+    """获取分词缓存单例"""
+    global _cache
+    if _cache is None:
+        _cache = SegmentCache(maxsize=settings.SEGMENT_CACHE_SIZE)
+    return _cache
+
+
+def segment(text: str, segmenter: Optional[Segmenter] = None) -> List[str]:
+    """
+    分词（带缓存）
+
+    Args:
+        text: 待分词文本
+        segmenter: 分词器，默认使用全局分词器
+
+    Returns:
+        词列表
+    """
+    segmenter = segmenter or get_segmenter()
+    cache = get_segment_cache()
+    key = (text, segmenter.version)
+    tokens = cache.get(key)
+    if tokens is None:
+        tokens = tuple(segmenter.cut(text))
+        cache.put(key, tokens)
+    return list(tokens)
@@ -29,6 +29,20 @@ AsyncSessionLocal = sessionmaker(
 )
 
 
+def get_pool_stats() -> dict:
+    """数据库连接池使用情况（SQLite等不带连接池上限的驱动只返回类型）"""
+    pool = async_engine.pool
+    stats = {"pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": engine_kwargs.get("max_overflow", 0)
+        })
+    return stats
+
+
 async def get_async_db():
     """异步数据库会话依赖"""
     async with AsyncSessionLocal() as session:
@@ -2,6 +2,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.api import chat, websocket, auth, cases, tasks
+from app.services.zhipu_client import close_zhipu_client
+from app.services.scoring_jobs import get_scoring_job_queue
+from app.services.single_flight import get_single_flight
+from app.services.llm_router import get_llm_router
+from app.services.rate_limiter import get_governor_stats
+from app.services.resilience import get_resilience_stats
+from app.db.session import get_pool_stats
 from contextlib import asynccontextmanager
 import logging
 
@@ -20,9 +27,16 @@ async def lifespan(app: FastAPI):
     logger.info(f"启动 {settings.APP_NAME} v{settings.APP_VERSION}")
     logger.info("AI对话引擎初始化完成")
 
+    # 启动评分任务队列，完成后通过WebSocket推送
+    scoring_jobs = get_scoring_job_queue()
+    scoring_jobs.add_listener(websocket.push_score_job)
+    await scoring_jobs.start()
+
     yield
 
     # 关闭时执行
+    await scoring_jobs.stop()
+    await close_zhipu_client()
     logger.info("应用关闭")
 
 
@@ -69,7 +83,12 @@ async def health_check():
     return {
         "status": "healthy",
         "service": settings.APP_NAME,
-        "version": settings.APP_VERSION
+        "version": settings.APP_VERSION,
+        "llm_single_flight": get_single_flight().stats(),
+        "llm_router": get_llm_router().get_stats(),
+        "llm_rate_limit": get_governor_stats(),
+        "llm_circuit_breakers": get_resilience_stats(),
+        "db_pool": get_pool_stats()
     }
 
 
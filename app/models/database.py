@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, Enum as SQLEnum, Boolean, Numeric, Date
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, Enum as SQLEnum, Boolean, Numeric, Date, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from app.db.base import Base
 import enum
 
@@ -90,9 +90,13 @@ class ChatSession(Base):
     status = Column(SQLEnum(SessionStatus), default=SessionStatus.ACTIVE)
 
     # 会话数据
+    # 已废弃：对话历史以 messages 表为准，此列不再写入（旧数据见 scripts/migrate_backfill_messages.py）
     conversation_history = Column(JSON, default=list)
     turn_count = Column(Integer, default=0)
 
+    # 增量评分状态快照（见 app/core/incremental_scoring.py）
+    scoring_state = Column(JSON)
+
     # 评分数据
     inquiry_score = Column(Float)
     diagnosis_score = Column(Float)
@@ -126,6 +130,11 @@ class Message(Base):
     meta_data = Column(JSON)  # 存储情绪、疼痛等级等信息
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+    # 按会话读取最近N条消息 (WHERE session_id = ? ORDER BY id DESC LIMIT n)
+    __table_args__ = (
+        Index("idx_messages_session_id_id", "session_id", "id"),
+    )
+
     # 关系
     session = relationship("ChatSession", back_populates="messages")
 
@@ -212,6 +221,10 @@ class SessionScore(Base):
     grade = Column(String(10))
     passed = Column(Boolean, default=False)
 
+    # 百川评估原始分数（inquiry_logic / diagnosis_reasoning / communication 等），
+    # 评分规则变更后批量重算时复用
+    llm_scores = Column(JSON)
+
     # AI评分备注
     ai_comments = Column(Text)
     reviewer_comments = Column(Text)
@@ -391,6 +404,66 @@ class ImprovementSuggestion(Base):
     session_score = relationship("SessionScore", back_populates="improvement_suggestions")
 
 
+class ScoringJobStatus(str, enum.Enum):
+    """评分任务状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class ScoringJob(Base):
+    """评分任务表（/api/chat/end 异步评分队列，进程重启后可恢复）"""
+    __tablename__ = "scoring_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(64), unique=True, index=True, nullable=False)
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    student_diagnosis = Column(Text)
+    reasoning = Column(Text)
+
+    status = Column(String(20), default="pending", index=True)  # pending/running/completed/failed
+    attempts = Column(Integer, default=0)
+    # 执行租约到期时间，超时未完成的 running 任务可被其他工作者重新领取
+    locked_until = Column(DateTime(timezone=True))
+
+    session_score_id = Column(Integer, ForeignKey("session_scores.id"))
+    error = Column(Text)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    # 每个会话最多一个未失败的任务（并发的重复 /end 提交只有一个能入队）
+    __table_args__ = (
+        Index(
+            "uq_scoring_jobs_active_session", "session_id",
+            unique=True,
+            postgresql_where=text("status <> 'failed'"),
+            sqlite_where=text("status <> 'failed'")
+        ),
+    )
+
+    # 关系
+    session = relationship("ChatSession")
+
+
+class ScoringResultCache(Base):
+    """评分结果缓存表（相同输入的重复评分直接复用，不再调用大模型）"""
+    __tablename__ = "scoring_result_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 病例版本、评分规则、规范化对话、学生诊断、评估提示词版本等的哈希
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    result = Column(JSON, nullable=False)  # ScoringResult 字段
+    hits = Column(Integer, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True))
+
+
 class StudyPlanStatus(str, enum.Enum):
     """学习计划状态"""
     ACTIVE = "active"
@@ -1,6 +1,11 @@
 from openai import AsyncOpenAI
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 from app.config import settings
+from app.services.single_flight import get_single_flight, request_key
+from app.services.rate_limiter import (
+    get_governor, estimate_request_tokens, PRIORITY_CHAT, PRIORITY_SCORING
+)
+from app.services.resilience import get_resilience_policy
 import logging
 import json
 
@@ -8,7 +13,12 @@ logger = logging.getLogger(__name__)
 
 
 class BaichuanService:
-    """百川大模型服务 - 封装 OpenAI SDK 调用"""
+    """百川大模型服务 - 封装 OpenAI SDK 调用，同时作为路由器的备选服务"""
+
+    name = "baichuan"
+
+    # 学生表现评估提示词版本，修改评估提示词时递增以使评分结果缓存失效
+    EVALUATION_PROMPT_VERSION = "1"
 
     def __init__(self):
         """初始化百川客户端"""
@@ -17,24 +27,120 @@ class BaichuanService:
         self.model = settings.BAICHUAN_MODEL
         self.temperature = settings.DEFAULT_TEMPERATURE
         self.max_tokens = settings.MAX_TOKENS
+        self.single_flight = get_single_flight()
+        self.governor = get_governor(self.name)
+        self.resilience = get_resilience_policy(self.name)
 
         if not self.api_key:
             logger.warning("未配置 BAICHUAN_API_KEY，百川服务功能将受限")
 
         # 初始化异步客户端
+        # 重试与超时由容错策略统一处理，关闭SDK自带的重试
         self.client = AsyncOpenAI(
             api_key=self.api_key or "dummy_key",
-            base_url=self.base_url
+            base_url=self.base_url,
+            timeout=settings.TIMEOUT,
+            max_retries=0
         )
         
         logger.info(f"百川AI客户端初始化完成，模型: {self.model}")
 
+    @property
+    def available(self) -> bool:
+        """是否已配置（供路由器选路）"""
+        return bool(self.api_key)
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        json_mode: bool = False,
+        priority: int = PRIORITY_CHAT
+    ) -> str:
+        """
+        调用百川生成完整回复（路由器适配接口，失败时抛出异常）
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大token数
+            json_mode: 是否强制JSON输出
+            priority: 限流排队优先级
+
+        Returns:
+            回复文本，API返回空响应时为空字符串
+        """
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature or self.temperature,
+            "max_tokens": max_tokens or self.max_tokens,
+        }
+
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+
+        # 同时在途的相同请求只调用一次上游
+        key = request_key(
+            "baichuan", params["model"], params["temperature"], params["max_tokens"],
+            messages, json_mode=json_mode
+        )
+        response = await self.single_flight.do(
+            "baichuan",
+            key,
+            lambda: self.resilience.call(lambda: self._governed_completion(params, priority))
+        )
+
+        if response.choices and len(response.choices) > 0:
+            return response.choices[0].message.content or ""
+        return ""
+
+    async def _governed_completion(self, params: Dict[str, Any], priority: int):
+        """经限流调度放行后调用上游"""
+        tokens = estimate_request_tokens(params["messages"], params["max_tokens"])
+        slot = await self.governor.acquire(tokens, priority)
+        async with slot:
+            response = await self.resilience.upstream(self.client.chat.completions.create(**params))
+            if response.usage:
+                slot.used_tokens = response.usage.total_tokens
+        return response
+
+    async def complete_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        priority: int = PRIORITY_CHAT
+    ) -> AsyncIterator[str]:
+        """调用百川流式生成回复（路由器适配接口，失败时抛出异常）"""
+        max_tokens = max_tokens or self.max_tokens
+
+        async def open_stream():
+            # 整个流式输出期间占用一个并发名额
+            slot = await self.governor.acquire(estimate_request_tokens(messages, max_tokens), priority)
+            async with slot:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature or self.temperature,
+                    max_tokens=max_tokens,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+
+        async for delta in self.resilience.stream(open_stream):
+            yield delta
+
     async def generate_response(
         self,
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
-        json_mode: bool = False
+        json_mode: bool = False,
+        priority: int = PRIORITY_CHAT
     ) -> str:
         """
         生成AI回复
@@ -44,6 +150,7 @@ class BaichuanService:
             temperature: 温度参数
             max_tokens: 最大token数
             json_mode: 是否强制JSON输出
+            priority: 限流排队优先级
 
         Returns:
             AI回复内容
@@ -52,23 +159,12 @@ class BaichuanService:
             if not self.api_key:
                 return json.dumps({"error": "未配置百川API Key"}) if json_mode else "系统未配置百川API Key"
 
-            params = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature or self.temperature,
-                "max_tokens": max_tokens or self.max_tokens,
-            }
-            
-            if json_mode:
-                params["response_format"] = {"type": "json_object"}
-
-            response = await self.client.chat.completions.create(**params)
-
-            if response.choices and len(response.choices) > 0:
-                return response.choices[0].message.content
-            else:
+            response = await self.complete(
+                messages, temperature, max_tokens, json_mode=json_mode, priority=priority
+            )
+            if not response:
                 logger.warning("百川API返回空响应")
-                return ""
+            return response
 
         except Exception as e:
             logger.error(f"百川API调用错误: {str(e)}")
@@ -145,7 +241,8 @@ class BaichuanService:
             messages, 
             temperature=0.3, # 评分需要相对客观
             max_tokens=1000,
-            json_mode=True
+            json_mode=True,
+            priority=PRIORITY_SCORING  # 排在交互对话之后
         )
 
         # 4. 解析结果
@@ -0,0 +1,319 @@
+"""
+批量重算评分 - 评分规则变更后对历史会话重新评分
+
+评分规则（ScoringRule）只改变权重和各项分值，不改变对话内容，因此：
+- 规则特征（关键问题覆盖、症状维度、重复提问、礼貌用语等）由
+  ScoringEngine.rule_features 从对话中提取，不调用大模型
+- 百川评估的原始分数复用评分记录中保存的 llm_scores
+- 各项分数、加权总分、等级和是否及格在整批会话上用 NumPy 数组一次算出，
+  与 ScoringEngine._build_result 的逐条计算结果一致
+
+会话按评分记录ID分批流式读取，每批一次性批量更新，内存占用与总量无关。
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+import numpy as np
+from sqlalchemy import select, update
+
+from app.core.scoring_engine import ScoringEngine
+from app.core.scoring_lexicon import get_scoring_lexicon
+from app.db.session import AsyncSessionLocal
+from app.models.database import (
+    SessionScore, ScoringRule, ChatSession, Case, Message, SessionStatus
+)
+from app.services.case_store import case_to_dict
+
+logger = logging.getLogger(__name__)
+
+# 百川评估融合时使用的分数项
+LLM_SCORE_KEYS = ("inquiry_logic", "diagnosis_reasoning", "communication")
+
+# 有百川评语时 _build_result 追加的标记（早期评分记录没有 llm_scores 时据此判断）
+_LLM_COMMENT_MARKER = "\n\n详细评价：\n"
+
+
+def stored_llm_scores(
+    llm_scores: Optional[Dict[str, Any]],
+    ai_comments: Optional[str],
+    inquiry_logic_score: Optional[float],
+    diagnosis_reasoning_score: Optional[float],
+    communication_total_score: Optional[float]
+) -> Dict[str, float]:
+    """
+    取评分记录中的百川评估分数
+
+    早期评分记录没有 llm_scores 列：如果评语来自百川，则由已保存的融合分项
+    反推原始分数（融合时 逻辑 = LLM*0.8、推理 = LLM*0.4、沟通 = LLM），
+    即沿用原有的大模型分项；否则视为纯规则评分。
+
+    Returns:
+        {inquiry_logic, diagnosis_reasoning, communication}，未评估的项为0
+    """
+    if llm_scores:
+        return {key: float(llm_scores.get(key) or 0) for key in LLM_SCORE_KEYS}
+
+    if ai_comments and _LLM_COMMENT_MARKER in ai_comments:
+        return {
+            "inquiry_logic": float(inquiry_logic_score or 0) / 0.8,
+            "diagnosis_reasoning": float(diagnosis_reasoning_score or 0) / 0.4,
+            "communication": float(communication_total_score or 0)
+        }
+
+    return {key: 0.0 for key in LLM_SCORE_KEYS}
+
+
+def compute_scores(
+    features: Dict[str, np.ndarray],
+    llm: Dict[str, np.ndarray],
+    weights: Dict[str, float],
+    standards: Dict[str, Any]
+) -> Dict[str, np.ndarray]:
+    """
+    按评分规则对一批会话向量化计算分数
+
+    Args:
+        features: 规则特征数组（字段同 ScoringEngine.rule_features 的数值项，
+            accuracy 为字符串数组）
+        llm: 百川评估分数数组（inquiry_logic / diagnosis_reasoning / communication）
+        weights: 评分权重
+        standards: 评分标准
+
+    Returns:
+        各分项、总分、等级与是否及格的数组
+    """
+    # 问诊
+    key_question = features["coverage_rate"] * standards["key_question_score"]
+    symptom = np.minimum(
+        features["symptom_dimensions"] * standards["symptom_detail_score"] / len(get_scoring_lexicon().symptom_dimensions),
+        standards["symptom_detail_score"]
+    )
+    logic = np.where(
+        features["question_count"] > 0,
+        np.maximum(standards["logic_score"] - features["duplicates"] * 2, 0),
+        0
+    )
+    logic = np.where(llm["inquiry_logic"] > 0, llm["inquiry_logic"] * 0.8, logic)
+    etiquette = features["etiquette_rate"] * standards["etiquette_score"]
+    inquiry_total = key_question + symptom + logic + etiquette
+
+    # 诊断（百川修正推理分时，准确性基础分按固定的 35/15/0 计，与 _build_result 一致）
+    accuracy = features["accuracy"]
+    correct = accuracy == "correct"
+    partial = accuracy == "partial"
+    base = np.select(
+        [correct, partial],
+        [standards["correct_score"], standards["partial_score"]],
+        standards["wrong_score"]
+    )
+    fused_base = np.select([correct, partial], [35, 15], 0)
+    has_reasoning = llm["diagnosis_reasoning"] > 0
+    reasoning = np.where(has_reasoning, llm["diagnosis_reasoning"] * 0.4, features["reasoning_score"])
+    diagnosis_total = np.minimum(np.where(has_reasoning, fused_base, base) + reasoning, 35)
+
+    # 沟通
+    turns = features["turn_count"]
+    full_turns = standards["full_turns"]
+    pass_turns = standards["pass_turns"]
+    turn_score = np.select(
+        [turns >= full_turns, turns >= pass_turns],
+        [15, 10 + (turns - pass_turns) / max(full_turns - pass_turns, 1) * 5],
+        np.maximum(5, turns * 2)
+    )
+    communication_total = np.minimum(
+        turn_score + features["polite_rate"] * 5 + features["empathy_score"], 25
+    )
+    communication_total = np.where(
+        llm["communication"] > 0, np.minimum(llm["communication"], 25), communication_total
+    )
+
+    # 综合
+    final = (
+        inquiry_total * weights["inquiry"] +
+        diagnosis_total * weights["diagnosis"] +
+        communication_total * weights["communication"]
+    )
+    grade = np.select(
+        [final >= 90, final >= 80, final >= 70, final >= 60],
+        ["A", "B", "C", "D"],
+        "F"
+    )
+
+    return {
+        "symptom_inquiry_score": symptom,
+        "inquiry_logic_score": logic,
+        "medical_etiquette_score": etiquette,
+        "inquiry_total_score": inquiry_total,
+        "diagnosis_reasoning_score": reasoning,
+        "diagnosis_total_score": diagnosis_total,
+        "communication_total_score": communication_total,
+        "final_score": np.round(final, 2),
+        "grade": grade,
+        "passed": final >= 60
+    }
+
+
+def _to_arrays(rows: List[Dict[str, Any]], keys) -> Dict[str, np.ndarray]:
+    return {key: np.array([row[key] for row in rows]) for key in keys}
+
+
+_FEATURE_KEYS = (
+    "coverage_rate", "symptom_dimensions", "question_count", "duplicates",
+    "etiquette_rate", "accuracy", "reasoning_score", "turn_count",
+    "polite_rate", "empathy_score"
+)
+
+
+async def _load_chunk(db, after_id: int, chunk_size: int) -> List[Tuple]:
+    """读取一批已完成会话的评分记录（按评分记录ID分页）"""
+    result = await db.execute(
+        select(SessionScore, ChatSession.student_diagnosis, Case)
+        .join(ChatSession, SessionScore.session_id == ChatSession.id)
+        .join(Case, ChatSession.case_id == Case.id)
+        .where(
+            ChatSession.status == SessionStatus.COMPLETED,
+            SessionScore.id > after_id
+        )
+        .order_by(SessionScore.id)
+        .limit(chunk_size)
+    )
+    return result.all()
+
+
+async def _load_histories(db, session_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """一次查询读取一批会话的对话历史"""
+    result = await db.execute(
+        select(Message.session_id, Message.role, Message.content)
+        .where(Message.session_id.in_(session_ids))
+        .order_by(Message.session_id, Message.id)
+    )
+    histories: Dict[int, List[Dict[str, Any]]] = {sid: [] for sid in session_ids}
+    for session_id, role, content in result.all():
+        histories[session_id].append({"role": role, "content": content})
+    return histories
+
+
+async def rescore_sessions(
+    rule: ScoringRule,
+    session_factory=AsyncSessionLocal,
+    chunk_size: int = 500,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    按评分规则重算所有已完成会话的评分
+
+    Args:
+        rule: 新的评分规则
+        session_factory: 数据库会话工厂
+        chunk_size: 每批处理的评分记录数
+        dry_run: 只计算统计，不写回数据库
+
+    Returns:
+        重算统计（处理条数、等级变化数、重算前后的平均分与及格率、耗时）
+    """
+    engine = ScoringEngine.from_rule(rule)
+    started = time.perf_counter()
+    stats = {
+        "rule_id": rule.id,
+        "scored": 0,
+        "grade_changed": 0,
+        "before_avg": 0.0,
+        "after_avg": 0.0,
+        "before_pass_rate": 0.0,
+        "after_pass_rate": 0.0,
+        "dry_run": dry_run
+    }
+    before_sum = after_sum = 0.0
+    before_passed = after_passed = 0
+    after_id = 0
+
+    while True:
+        async with session_factory() as db:
+            rows = await _load_chunk(db, after_id, chunk_size)
+            if not rows:
+                break
+            after_id = rows[-1][0].id
+
+            histories = await _load_histories(db, list({score.session_id for score, _, _ in rows}))
+            cases: Dict[int, Dict[str, Any]] = {}
+            jobs = []
+            for score, student_diagnosis, case in rows:
+                if case.id not in cases:
+                    cases[case.id] = case_to_dict(case)
+                jobs.append((histories[score.session_id], student_diagnosis or "", cases[case.id]))
+
+            # 规则特征提取是纯文本处理，放到线程中，不阻塞事件循环
+            features = await asyncio.to_thread(
+                lambda: [engine.rule_features(*job) for job in jobs]
+            )
+            llm = [
+                stored_llm_scores(
+                    score.llm_scores, score.ai_comments, score.inquiry_logic_score,
+                    score.diagnosis_reasoning_score, score.communication_total_score
+                )
+                for score, _, _ in rows
+            ]
+
+            scores = compute_scores(
+                _to_arrays(features, _FEATURE_KEYS),
+                _to_arrays(llm, LLM_SCORE_KEYS),
+                engine.weights,
+                engine.standards
+            )
+            columns = {key: value.tolist() for key, value in scores.items()}
+
+            score_updates = []
+            session_updates = []
+            for i, (score, _, _) in enumerate(rows):
+                feature = features[i]
+                old_final = float(score.final_score or 0)
+                before_sum += old_final
+                before_passed += bool(score.passed)
+                after_sum += columns["final_score"][i]
+                after_passed += columns["passed"][i]
+                if score.grade != columns["grade"][i]:
+                    stats["grade_changed"] += 1
+
+                score_updates.append({
+                    "id": score.id,
+                    "scoring_rule_id": rule.id,
+                    "key_questions_covered": len(feature["covered"]),
+                    "key_questions_total": len(feature["covered"]) + len(feature["missed"]),
+                    "key_question_coverage_rate": feature["coverage_rate"],
+                    "covered_questions": feature["covered"],
+                    "missed_questions": feature["missed"],
+                    "diagnosis_accuracy": feature["accuracy"],
+                    "differential_considered": feature["differential_count"],
+                    "turn_count": feature["turn_count"],
+                    "avg_response_length": feature["avg_length"],
+                    "polite_expression_rate": feature["polite_rate"],
+                    "empathy_score": feature["empathy_score"],
+                    **{key: values[i] for key, values in columns.items()}
+                })
+                session_updates.append({
+                    "id": score.session_id,
+                    "inquiry_score": columns["inquiry_total_score"][i],
+                    "diagnosis_score": columns["diagnosis_total_score"][i],
+                    "communication_score": columns["communication_total_score"][i],
+                    "total_score": columns["final_score"][i]
+                })
+
+            stats["scored"] += len(rows)
+            if not dry_run:
+                # 按主键批量更新（executemany）
+                await db.execute(update(SessionScore), score_updates)
+                await db.execute(update(ChatSession), session_updates)
+                await db.commit()
+
+        logger.info(f"评分重算进度: {stats['scored']} 条 (rule_id={rule.id})")
+
+    if stats["scored"]:
+        stats["before_avg"] = round(before_sum / stats["scored"], 2)
+        stats["after_avg"] = round(after_sum / stats["scored"], 2)
+        stats["before_pass_rate"] = round(before_passed / stats["scored"], 4)
+        stats["after_pass_rate"] = round(after_passed / stats["scored"], 4)
+    stats["elapsed"] = round(time.perf_counter() - started, 3)
+    return stats
@@ -0,0 +1,127 @@
+"""
+病例存储服务 - 带TTL的进程内病例缓存
+
+REST 和 WebSocket 两条对话链路共用，避免每轮对话都查询一次 cases 表。
+病例更新/删除时由 app/api/cases.py 主动失效；多 worker 部署下其他进程
+依靠 TTL 过期兜底。
+"""
+
+from typing import Dict, Any, Optional, Tuple
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.config import settings
+from app.models.database import Case
+
+
+def case_to_dict(case: Case) -> Dict[str, Any]:
+    """将Case记录转换为对话/评分引擎使用的病例字典"""
+    version_time = case.updated_at or case.created_at
+
+    return {
+        "case_id": case.case_id,
+        "title": case.title,
+        "description": case.description,
+        "difficulty": case.difficulty,
+        "category": case.category,
+        "patient_info": case.patient_info or {},
+        "chief_complaint": case.chief_complaint or {},
+        "symptoms": case.symptoms or {},
+        "standard_diagnosis": case.standard_diagnosis,
+        "differential_diagnosis": case.differential_diagnosis or [],
+        "key_questions": case.key_questions or [],
+        # 病例版本，用于下游缓存（提示词、评分等）的失效判断
+        "version": version_time.isoformat() if version_time else "0"
+    }
+
+
+def default_case_data(case_id: str) -> Dict[str, Any]:
+    """数据库中不存在病例时使用的兜底病例"""
+    return {
+        "case_id": case_id,
+        "title": "默认病例",
+        "description": "病例未找到",
+        "difficulty": "medium",
+        "category": "内科",
+        "patient_info": {},
+        "chief_complaint": {"text": "我不舒服"},
+        "symptoms": {},
+        "standard_diagnosis": "待诊断",
+        "differential_diagnosis": [],
+        "key_questions": [],
+        "version": "0"
+    }
+
+
+class CaseStore:
+    """病例存储 - 按 case_id 缓存规范化后的病例字典"""
+
+    def __init__(self, ttl_seconds: int = 300):
+        """
+        初始化病例存储
+
+        Args:
+            ttl_seconds: 缓存有效期（秒）
+        """
+        self.ttl_seconds = ttl_seconds
+        # case_id -> (过期时间, 病例字典)
+        self._cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    async def get_case(
+        self,
+        db: AsyncSession,
+        case_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        获取病例数据，优先读缓存
+
+        Args:
+            db: 数据库会话
+            case_id: 病例ID (字符串，如 "case_001")
+
+        Returns:
+            病例字典（缓存共享对象，调用方不得修改），不存在时返回None
+        """
+        entry = self._cache.get(case_id)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+
+        result = await db.execute(
+            select(Case).where(Case.case_id == case_id)
+        )
+        case = result.scalar_one_or_none()
+
+        if not case:
+            self._cache.pop(case_id, None)
+            return None
+
+        case_data = case_to_dict(case)
+        self._cache[case_id] = (now + self.ttl_seconds, case_data)
+        return case_data
+
+    def invalidate(self, case_id: Optional[str] = None):
+        """
+        使缓存失效
+
+        Args:
+            case_id: 病例ID，为None时清空全部缓存
+        """
+        if case_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(case_id, None)
+
+
+# 全局单例
+_case_store: Optional[CaseStore] = None
+
+
+def get_case_store() -> CaseStore:
+    """获取病例存储单例"""
+    global _case_store
+    if _case_store is None:
+        _case_store = CaseStore(ttl_seconds=settings.CASE_CACHE_TTL_SECONDS)
+    return _case_store
@@ -0,0 +1,365 @@
+"""
+LLM服务路由 - 在多个大模型服务之间按延迟和错误率选路
+
+每个服务（智谱、百川）实现统一的异步接口：
+- name: 服务名
+- available: 是否已配置可用
+- complete(messages, temperature, max_tokens): 返回完整回复，失败时抛出异常
+- complete_stream(messages, temperature, max_tokens): 逐段产出增量文本
+
+路由器按服务记录延迟与错误率的指数加权移动平均（EWMA），每次选择最快的
+健康服务；当前服务失败时立即切换到下一个。可选对冲请求：首选服务超过其
+p95延迟仍未返回时，再向第二个服务发出同样的请求，取先返回的结果。
+"""
+
+from typing import Dict, Any, List, Optional, AsyncIterator, Protocol, Tuple
+from collections import deque
+import asyncio
+import logging
+import math
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmptyResponseError(Exception):
+    """服务返回空回复"""
+
+
+class NoProviderAvailableError(Exception):
+    """没有可用的服务"""
+
+
+class LLMProvider(Protocol):
+    """大模型服务统一接口"""
+    name: str
+
+    @property
+    def available(self) -> bool: ...
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> str: ...
+
+    def complete_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]: ...
+
+
+class ProviderStats:
+    """单个服务的延迟与错误率统计"""
+
+    def __init__(self, alpha: float = 0.2, window: int = 200):
+        """
+        Args:
+            alpha: EWMA平滑系数，越大越偏重最近的调用
+            window: 计算p95时保留的最近延迟样本数
+        """
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: deque = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.last_failure_at: Optional[float] = None
+
+    def record_success(self, elapsed: float):
+        self.requests += 1
+        self.samples.append(elapsed)
+        self.latency = elapsed if self.latency is None else (
+            self.alpha * elapsed + (1 - self.alpha) * self.latency
+        )
+        self.error_rate = (1 - self.alpha) * self.error_rate
+
+    def record_failure(self, elapsed: float):
+        self.requests += 1
+        self.failures += 1
+        self.last_failure_at = time.monotonic()
+        # 失败的耗时同样计入延迟，超时的服务会被排到后面
+        self.latency = elapsed if self.latency is None else (
+            self.alpha * elapsed + (1 - self.alpha) * self.latency
+        )
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+
+    def p95(self) -> Optional[float]:
+        """最近调用延迟的p95，无样本时返回None"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "latency_ewma": round(self.latency, 4) if self.latency is not None else None,
+            "latency_p95": round(p95, 4) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+class LLMRouter:
+    """按延迟和错误率选路的大模型路由器"""
+
+    def __init__(
+        self,
+        providers: List[LLMProvider],
+        ewma_alpha: float = 0.2,
+        error_threshold: float = 0.5,
+        cooldown_seconds: float = 30.0,
+        hedge_enabled: bool = False,
+        hedge_delay: float = 3.0,
+        hedge_min_samples: int = 20
+    ):
+        """
+        初始化路由器
+
+        Args:
+            providers: 服务列表，顺序即没有统计数据时的优先级
+            ewma_alpha: EWMA平滑系数
+            error_threshold: 错误率超过该值视为不健康
+            cooldown_seconds: 不健康的服务在最近一次失败后多久重新参与选路
+            hedge_enabled: 是否启用对冲请求
+            hedge_delay: 样本不足时的对冲等待时间（秒）
+            hedge_min_samples: 使用p95作为对冲等待时间所需的最少样本数
+        """
+        self.providers = providers
+        self.error_threshold = error_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.stats: Dict[str, ProviderStats] = {
+            p.name: ProviderStats(alpha=ewma_alpha) for p in providers
+        }
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def is_healthy(self, name: str) -> bool:
+        """错误率低于阈值，或距最近一次失败已超过冷却时间（允许试探恢复）"""
+        stats = self.stats[name]
+        if stats.error_rate < self.error_threshold:
+            return True
+        return time.monotonic() - (stats.last_failure_at or 0) >= self.cooldown_seconds
+
+    def ranked(self) -> List[LLMProvider]:
+        """
+        按选路优先级排序的可用服务
+
+        健康的服务在前，其中EWMA延迟低的在前；还没有延迟数据的服务
+        排在有数据的服务之后，按配置顺序。
+        """
+        candidates = [p for p in self.providers if p.available]
+        order = {p.name: i for i, p in enumerate(self.providers)}
+
+        def key(p: LLMProvider) -> Tuple[bool, float, int]:
+            latency = self.stats[p.name].latency
+            return (
+                not self.is_healthy(p.name),
+                latency if latency is not None else math.inf,
+                order[p.name]
+            )
+
+        return sorted(candidates, key=key)
+
+    def _hedge_delay_for(self, name: str) -> float:
+        stats = self.stats[name]
+        if len(stats.samples) >= self.hedge_min_samples:
+            return stats.p95()
+        return self.hedge_delay
+
+    async def _timed(self, provider: LLMProvider, messages, temperature, max_tokens) -> str:
+        """调用服务并记录耗时与成败"""
+        start = time.perf_counter()
+        try:
+            text = await provider.complete(messages, temperature=temperature, max_tokens=max_tokens)
+            if not text:
+                raise EmptyResponseError(f"{provider.name} 返回空回复")
+        # 对冲落败被取消时（CancelledError）不计入统计
+        except Exception:
+            self.stats[provider.name].record_failure(time.perf_counter() - start)
+            raise
+        self.stats[provider.name].record_success(time.perf_counter() - start)
+        return text
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Tuple[str, str]:
+        """
+        生成完整回复
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数（None时使用各服务默认值）
+            max_tokens: 最大token数（None时使用各服务默认值）
+
+        Returns:
+            (回复文本, 实际应答的服务名)
+
+        Raises:
+            NoProviderAvailableError: 没有已配置的服务
+            Exception: 所有服务都失败时抛出最后一个错误
+        """
+        queue = self.ranked()
+        if not queue:
+            raise NoProviderAvailableError("没有可用的大模型服务")
+
+        last_error: Optional[BaseException] = None
+        pending: Dict[asyncio.Task, LLMProvider] = {}
+        hedges = set()
+
+        def launch() -> asyncio.Task:
+            provider = queue.pop(0)
+            task = asyncio.create_task(self._timed(provider, messages, temperature, max_tokens))
+            pending[task] = provider
+            return task
+
+        launch()
+        try:
+            while pending:
+                # 只有一个在途请求、还有备选服务且启用对冲时，最多等到该服务的p95延迟
+                timeout = None
+                if self.hedge_enabled and queue and len(pending) == 1:
+                    timeout = self._hedge_delay_for(next(iter(pending.values())).name)
+
+                done, _ = await asyncio.wait(
+                    pending.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    slow = next(iter(pending.values())).name
+                    hedges.add(launch())
+                    self.hedged += 1
+                    logger.info(f"{slow} 超过 {timeout:.2f}s 未返回，发出对冲请求")
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        if task in hedges:
+                            self.hedge_wins += 1
+                        return task.result(), provider.name
+                    last_error = task.exception()
+                    logger.warning(f"{provider.name} 调用失败: {last_error}")
+
+                # 在途请求全部失败时，立即切换到下一个服务
+                if not pending and queue:
+                    self.failovers += 1
+                    launch()
+        finally:
+            # 取消落败的请求（请求合并时没有其他等待方则上游调用随之取消，释放限流槽位）
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式生成回复
+
+        选择最快的健康服务；在输出第一段文本之前失败时切换到下一个服务，
+        已输出部分内容后失败则直接抛出（不对冲，避免两路输出交错）。
+
+        Yields:
+            增量回复文本片段
+        """
+        queue = self.ranked()
+        if not queue:
+            raise NoProviderAvailableError("没有可用的大模型服务")
+
+        last_error: Optional[BaseException] = None
+        for i, provider in enumerate(queue):
+            if i:
+                self.failovers += 1
+            stats = self.stats[provider.name]
+            start = time.perf_counter()
+            emitted = False
+            try:
+                async for delta in provider.complete_stream(
+                    messages, temperature=temperature, max_tokens=max_tokens
+                ):
+                    if not emitted:
+                        # 流式调用以首段延迟作为延迟样本
+                        stats.record_success(time.perf_counter() - start)
+                        emitted = True
+                    yield delta
+                if not emitted:
+                    raise EmptyResponseError(f"{provider.name} 返回空的流式响应")
+                return
+            except Exception as e:
+                if emitted:
+                    raise
+                stats.record_failure(time.perf_counter() - start)
+                last_error = e
+                logger.warning(f"{provider.name} 流式调用失败: {e}")
+
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各服务的延迟、错误率与对冲统计"""
+        return {
+            "providers": {
+                p.name: {
+                    **self.stats[p.name].to_dict(),
+                    "available": p.available,
+                    "healthy": self.is_healthy(p.name)
+                }
+                for p in self.providers
+            },
+            "hedge_enabled": self.hedge_enabled,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers
+        }
+
+
+# 全局单例
+_llm_router: Optional[LLMRouter] = None
+
+
+def get_llm_router() -> LLMRouter:
+    """获取路由器单例（按 LLM_ROUTER_PROVIDERS 的顺序组装服务）"""
+    global _llm_router
+    if _llm_router is None:
+        from app.services.llm_service import get_llm_service
+        from app.services.baichuan_service import get_baichuan_service
+
+        factories = {
+            "zhipu": get_llm_service,
+            "baichuan": get_baichuan_service
+        }
+        providers = []
+        for name in settings.LLM_ROUTER_PROVIDERS:
+            if name not in factories:
+                logger.warning(f"未知的大模型服务: {name}")
+                continue
+            providers.append(factories[name]())
+
+        _llm_router = LLMRouter(
+            providers,
+            ewma_alpha=settings.LLM_ROUTER_EWMA_ALPHA,
+            error_threshold=settings.LLM_ROUTER_ERROR_THRESHOLD,
+            cooldown_seconds=settings.LLM_ROUTER_COOLDOWN_SECONDS,
+            hedge_enabled=settings.LLM_HEDGE_ENABLED,
+            hedge_delay=settings.LLM_HEDGE_DELAY,
+            hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+        )
+    return _llm_router
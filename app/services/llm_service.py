@@ -1,32 +1,127 @@
-from zai import ZhipuAiClient
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 from app.config import settings
-import asyncio
+from app.services.zhipu_client import get_zhipu_client
+from app.services.single_flight import get_single_flight, request_key
+from app.services.llm_router import get_llm_router, EmptyResponseError
+from app.services.rate_limiter import get_governor, estimate_request_tokens, PRIORITY_CHAT
+from app.services.resilience import get_resilience_policy
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class LLMService:
-    """LLM服务 - 封装智谱AI API调用"""
+    """LLM服务 - 封装智谱AI API调用，对话请求经路由器在各服务间选路"""
+
+    name = "zhipu"
 
     def __init__(self):
         """初始化LLM客户端"""
-        self.client = ZhipuAiClient(api_key=settings.ZHIPU_API_KEY)
+        # 共享连接池的异步HTTP客户端
+        self.client = get_zhipu_client()
         self.model = settings.ZHIPU_MODEL
         self.base_url = settings.ZHIPU_BASE_URL
         self.temperature = settings.DEFAULT_TEMPERATURE
         self.max_tokens = settings.MAX_TOKENS
+        self.single_flight = get_single_flight()
+        self.governor = get_governor(self.name)
+        self.resilience = get_resilience_policy(self.name)
 
         logger.info(f"智谱AI客户端初始化完成，模型: {self.model}")
 
+    @property
+    def available(self) -> bool:
+        """是否已配置（供路由器选路）"""
+        return bool(settings.ZHIPU_API_KEY)
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        priority: int = PRIORITY_CHAT
+    ) -> str:
+        """
+        调用智谱AI生成完整回复（路由器适配接口，失败时抛出异常）
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大token数
+            priority: 限流排队优先级
+
+        Returns:
+            回复文本，API返回空响应时为空字符串
+        """
+        temperature = self.temperature if temperature is None else temperature
+        max_tokens = max_tokens or self.max_tokens
+
+        # 同时在途的相同请求只调用一次上游
+        key = request_key("zhipu", self.model, temperature, max_tokens, messages)
+        response = await self.single_flight.do(
+            "zhipu",
+            key,
+            lambda: self.resilience.call(
+                lambda: self._governed_completion(messages, temperature, max_tokens, priority)
+            )
+        )
+
+        choices = response.get("choices") or []
+        if choices:
+            return choices[0].get("message", {}).get("content") or ""
+        return ""
+
+    async def _governed_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        priority: int
+    ) -> Dict[str, Any]:
+        """经限流调度放行后调用上游"""
+        slot = await self.governor.acquire(estimate_request_tokens(messages, max_tokens), priority)
+        async with slot:
+            response = await self.resilience.upstream(self.client.chat_completion(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ))
+            slot.used_tokens = (response.get("usage") or {}).get("total_tokens")
+        return response
+
+    async def complete_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        priority: int = PRIORITY_CHAT
+    ) -> AsyncIterator[str]:
+        """调用智谱AI流式生成回复（路由器适配接口，失败时抛出异常）"""
+        max_tokens = max_tokens or self.max_tokens
+
+        async def open_stream():
+            # 整个流式输出期间占用一个并发名额
+            slot = await self.governor.acquire(estimate_request_tokens(messages, max_tokens), priority)
+            async with slot:
+                async for delta in self.client.stream_chat_completion(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature if temperature is None else temperature,
+                    max_tokens=max_tokens
+                ):
+                    yield delta
+
+        async for delta in self.resilience.stream(open_stream):
+            yield delta
+
     async def generate_response(
         self,
         messages: List[Dict[str, str]],
         stream: bool = False
     ) -> str:
         """
-        生成AI回复
+        生成AI回复（经路由器选择最快的健康服务）
 
         Args:
             messages: 消息历史列表
@@ -35,28 +130,61 @@ class LLMService:
         Returns:
             AI生成的回复文本
         """
+        if stream:
+            # 流式模式下聚合增量片段，保持返回完整文本的接口不变
+            chunks = [chunk async for chunk in self.generate_response_stream(messages)]
+            return "".join(chunks)
+
         try:
-            # 在异步上下文中运行同步的API调用
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.model,
-                messages=messages,
+            response, _ = await get_llm_router().complete(
+                messages,
                 temperature=self.temperature,
                 max_tokens=self.max_tokens
             )
+            return response
 
-            # 提取回复内容
-            if response.choices and len(response.choices) > 0:
-                return response.choices[0].message.content
-            else:
-                logger.warning("API返回空响应")
-                return "我...我现在不太舒服，能...能再说一遍吗？"
+        except EmptyResponseError:
+            logger.warning("API返回空响应")
+            return "我...我现在不太舒服，能...能再说一遍吗？"
 
         except Exception as e:
             logger.error(f"LLM调用错误: {str(e)}")
             # 错误处理
             return f"病人正在思考，请稍等..."
 
+    async def generate_response_stream(
+        self,
+        messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        """
+        流式生成AI回复，逐段产出增量文本（经路由器选路）
+
+        Args:
+            messages: 消息历史列表
+
+        Yields:
+            增量回复文本片段
+        """
+        emitted = False
+        try:
+            async for delta in get_llm_router().stream(
+                messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            ):
+                emitted = True
+                yield delta
+
+        except EmptyResponseError:
+            logger.warning("API返回空的流式响应")
+            yield "我...我现在不太舒服，能...能再说一遍吗？"
+
+        except Exception as e:
+            logger.error(f"LLM流式调用错误: {str(e)}")
+            # 已输出部分内容时直接结束，否则返回兜底话术
+            if not emitted:
+                yield "病人正在思考，请稍等..."
+
     async def chat_with_prompt(
         self,
         system_prompt: str,
@@ -0,0 +1,270 @@
+"""
+上游LLM调用限流 - 每个服务一个令牌桶 + 并发上限的调度器
+
+分别限制每分钟请求数（RPM）、每分钟token数（TPM）和并发数，避免大班考试时
+触发服务商的429限流。排队的请求按优先级、同优先级按到达顺序放行：交互对话
+优先于会话结束后的评分。
+
+token数在放行时按（提示词估算 + max_tokens）预扣，调用结束拿到实际用量后
+多退少补。
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from app.config import settings
+from app.core.context_window import message_tokens
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先放行
+PRIORITY_CHAT = 0
+PRIORITY_SCORING = 10
+
+# 令牌桶允许的突发量（秒）：桶容量 = 每分钟限额 * BURST_SECONDS / 60
+BURST_SECONDS = 10
+
+
+class QueueTimeoutError(Exception):
+    """排队超时"""
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """估算一次调用的token数（提示词 + 回复上限）"""
+    return sum(message_tokens(m.get("content", "")) for m in messages) + max_tokens
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: 每分钟补充的令牌数，<=0 表示不限制
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, per_minute * BURST_SECONDS / 60.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """还需等待多久才有足够的令牌（超过桶容量的请求按容量计）"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        if not self.unlimited:
+            self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """退还（负数为补扣）令牌"""
+        if not self.unlimited:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Slot:
+    """一次已放行的调用，结束时通过 used_tokens 回报实际token用量"""
+
+    def __init__(self, governor: "ProviderGovernor", reserved_tokens: int):
+        self.governor = governor
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens: Optional[int] = None
+
+    async def __aenter__(self) -> "Slot":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.governor.release(self)
+
+
+class ProviderGovernor:
+    """单个服务的限流调度器"""
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_concurrency: int = 0,
+        queue_timeout: Optional[float] = None
+    ):
+        """
+        初始化调度器
+
+        Args:
+            name: 服务名
+            rpm: 每分钟请求数上限，0为不限
+            tpm: 每分钟token数上限，0为不限
+            max_concurrency: 并发上限，0为不限
+            queue_timeout: 最长排队时间（秒），超时抛出 QueueTimeoutError
+        """
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        # (优先级, 到达序号, 预扣token数, future)
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.granted = 0
+        self.timeouts = 0
+        self.waits: deque = deque(maxlen=500)
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_CHAT) -> Slot:
+        """
+        排队等待放行
+
+        Args:
+            tokens: 预扣的token数
+            priority: 优先级（PRIORITY_CHAT / PRIORITY_SCORING）
+
+        Returns:
+            Slot对象，需用 async with 包裹上游调用以归还并发名额
+
+        Raises:
+            QueueTimeoutError: 排队超过 queue_timeout
+        """
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(future):
+                self.timeouts += 1
+                raise QueueTimeoutError(f"{self.name} 排队超过 {self.queue_timeout}s")
+        except asyncio.CancelledError:
+            if self._abandon(future):
+                # 放行与取消同时发生：名额和预扣的token全部归还
+                slot = Slot(self, tokens)
+                slot.used_tokens = 0
+                self.release(slot)
+            raise
+
+        self.waits.append(time.monotonic() - start)
+        return Slot(self, tokens)
+
+    def _abandon(self, future: asyncio.Future) -> bool:
+        """放弃排队；如果已经被放行则返回True（名额已占用）"""
+        if future.done() and not future.cancelled():
+            return True
+        future.cancel()
+        self._dispatch()
+        return False
+
+    def release(self, slot: Slot):
+        """归还并发名额，并按实际用量校正TPM"""
+        self.active -= 1
+        if slot.used_tokens is not None:
+            self.tokens.refund(slot.reserved_tokens - slot.used_tokens)
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级放行队首请求，直到遇到并发或令牌不足"""
+        while self._queue:
+            priority, _, tokens, future = self._queue[0]
+            if future.done():
+                # 已取消或超时的请求
+                heapq.heappop(self._queue)
+                continue
+
+            if self.max_concurrency and self.active >= self.max_concurrency:
+                return
+
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                # 队首等待令牌时不让后面的请求插队，保证大请求不会饿死
+                self._schedule(wait)
+                return
+
+            heapq.heappop(self._queue)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.active += 1
+            self.granted += 1
+            future.set_result(None)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            return
+
+        def fire():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(delay, fire)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """队列深度、并发和排队耗时统计"""
+        depth: Dict[int, int] = {}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                depth[priority] = depth.get(priority, 0) + 1
+
+        waits = sorted(self.waits)
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": sum(depth.values()),
+            "queue_depth_by_priority": depth,
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+            "wait_avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "wait_p95": round(waits[int(0.95 * (len(waits) - 1))], 4) if waits else 0.0
+        }
+
+
+# 每个服务一个调度器
+_governors: Dict[str, ProviderGovernor] = {}
+
+
+def get_governor(provider: str) -> ProviderGovernor:
+    """
+    获取服务的限流调度器，限额读取 {PROVIDER}_RPM_LIMIT / _TPM_LIMIT / _MAX_CONCURRENCY
+
+    Args:
+        provider: 服务名（zhipu / baichuan）
+    """
+    governor = _governors.get(provider)
+    if governor is None:
+        prefix = provider.upper()
+        governor = ProviderGovernor(
+            provider,
+            rpm=getattr(settings, f"{prefix}_RPM_LIMIT", 0),
+            tpm=getattr(settings, f"{prefix}_TPM_LIMIT", 0),
+            max_concurrency=getattr(settings, f"{prefix}_MAX_CONCURRENCY", 0),
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT or None
+        )
+        _governors[provider] = governor
+    return governor
+
+
+def get_governor_stats() -> Dict[str, Any]:
+    """所有服务的限流统计"""
+    return {name: governor.get_stats() for name, governor in _governors.items()}
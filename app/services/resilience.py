@@ -0,0 +1,272 @@
+"""
+LLM调用容错 - 单次超时 + 抖动退避重试 + 熔断器
+
+- 每次上游调用以 Settings.TIMEOUT 为上限（限流排队的等待时间不计入，
+  排队超时也不计入熔断）
+- 可重试的错误（超时、连接错误、429、5xx）按指数退避加全抖动重试，次数有上限
+- 连续失败达到阈值后熔断：熔断期间直接抛出 CircuitOpenError，调用方立即
+  走兜底逻辑（路由器切换服务 / 返回兜底话术），不再逐个等待已经挂掉的上游；
+  冷却时间过后放行一个试探请求，成功则恢复
+"""
+
+from typing import Dict, Any, Optional, Callable, Awaitable, AsyncIterator, TypeVar
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断中，直接失败"""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """从 httpx / openai SDK 的异常中取HTTP状态码"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    错误是否可重试（同时也是熔断器计数的错误）
+
+    超时、连接错误和 408/409/429/5xx 可重试；其余错误（如 400、401、
+    返回格式错误）重试也不会成功，直接抛出。
+    """
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # openai SDK 的连接错误和超时没有状态码
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class CircuitBreaker:
+    """熔断器（关闭 -> 打开 -> 半开）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """
+        Args:
+            name: 服务名
+            failure_threshold: 连续失败多少次后熔断
+            recovery_timeout: 熔断多久后放行试探请求（秒）
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.opened = 0
+        self._probing = False
+
+    def allow(self):
+        """
+        检查是否放行
+
+        Raises:
+            CircuitOpenError: 熔断中，或半开状态下已有试探请求在途
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} 熔断中")
+            self.state = self.HALF_OPEN
+            self._probing = False
+
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} 熔断试探中")
+            self._probing = True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"{self.name} 熔断恢复")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.warning(f"{self.name} 连续失败 {self.consecutive_failures} 次，熔断 {self.recovery_timeout}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """试探请求因与上游无关的原因结束（如排队超时），允许下一个请求试探"""
+        self._probing = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "rejected": self.rejected
+        }
+
+
+class ResiliencePolicy:
+    """单个服务的超时、重试与熔断策略"""
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 4.0,
+        attempt_timeout: Optional[float] = 30.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0
+    ):
+        """
+        初始化容错策略
+
+        Args:
+            name: 服务名
+            max_attempts: 最多尝试次数（含首次）
+            base_delay: 退避基数（秒）
+            max_delay: 单次退避上限（秒）
+            attempt_timeout: 单次上游调用超时（秒），None为不限
+            failure_threshold: 熔断阈值（连续失败次数）
+            recovery_timeout: 熔断恢复试探间隔（秒）
+        """
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.breaker = CircuitBreaker(name, failure_threshold, recovery_timeout)
+        self.retries = 0
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（指数退避 + 全抖动）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    async def upstream(self, call: Awaitable[T]) -> T:
+        """
+        对单次上游调用施加超时
+
+        在限流槽位内包住实际的上游请求，排队等待槽位的时间不计入超时。
+
+        Args:
+            call: 上游调用的协程
+
+        Raises:
+            asyncio.TimeoutError: 超过 attempt_timeout
+        """
+        return await asyncio.wait_for(call, self.attempt_timeout)
+
+    async def call(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        """
+        按策略执行调用
+
+        Args:
+            attempt: 发起一次尝试的协程工厂（每次重试重新调用），其中的上游请求
+                应经 upstream() 施加超时
+
+        Returns:
+            调用结果
+
+        Raises:
+            CircuitOpenError: 熔断中
+            Exception: 不可重试的错误，或重试耗尽后的最后一个错误
+        """
+        for n in range(1, self.max_attempts + 1):
+            self.breaker.allow()
+            try:
+                result = await attempt()
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                if n >= self.max_attempts:
+                    raise
+                delay = self.backoff(n)
+                self.retries += 1
+                logger.warning(f"{self.name} 调用失败（第{n}次）: {e!r}，{delay:.2f}s 后重试")
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        按熔断策略执行流式调用
+
+        流式调用不重试：已输出的内容无法撤回，首段输出前的失败由路由器切换服务。
+
+        Args:
+            open_stream: 返回异步迭代器的工厂
+
+        Yields:
+            上游产出的片段
+        """
+        self.breaker.allow()
+        completed = False
+        try:
+            async for item in open_stream():
+                yield item
+            completed = True
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            if completed:
+                self.breaker.record_success()
+            else:
+                self.breaker.release_probe()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.breaker.get_stats(), "retries": self.retries}
+
+
+# 每个服务一个策略
+_policies: Dict[str, ResiliencePolicy] = {}
+
+
+def get_resilience_policy(provider: str) -> ResiliencePolicy:
+    """获取服务的容错策略"""
+    policy = _policies.get(provider)
+    if policy is None:
+        policy = ResiliencePolicy(
+            provider,
+            max_attempts=settings.LLM_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            attempt_timeout=settings.TIMEOUT or None,
+            failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.LLM_BREAKER_RECOVERY_SECONDS
+        )
+        _policies[provider] = policy
+    return policy
+
+
+def get_resilience_stats() -> Dict[str, Any]:
+    """所有服务的熔断与重试统计"""
+    return {name: policy.get_stats() for name, policy in _policies.items()}
@@ -0,0 +1,200 @@
+"""
+评分结果缓存 - 相同输入的重复评分直接复用已保存的结果
+
+/end 重试、WebSocket 重连后重新结束、教师触发的重新评估等场景会对同一段
+对话再次评分，其中包括付费的百川评估调用。评分结果只取决于：
+
+- 病例（ID与版本）
+- 评分规则（ID、权重与评分标准）
+- 规范化后的对话（角色 + 去除多余空白的内容，不含时间戳等元数据）
+- 学生诊断
+- 百川评估提示词版本与模型、评分词表版本
+
+以上内容的哈希作为缓存键。缓存分两层：进程内LRU在前，数据库表
+scoring_result_cache 在后（进程重启、多实例部署时仍可命中）。
+
+只缓存百川评估已返回有效分数的完整结果；超过截止时间先返回的规则评分、
+百川降级结果都不缓存，下次评分仍会重新调用百川。
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import fields
+from datetime import datetime
+import copy
+import hashlib
+import json
+import logging
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.scoring_engine import ScoringEngine, ScoringResult
+from app.models.database import ScoringResultCache
+from app.services.baichuan_service import BaichuanService
+
+logger = logging.getLogger(__name__)
+
+# 不持久化的运行时字段
+_TRANSIENT_FIELDS = {"llm_pending", "llm_fusion"}
+
+
+def normalize_conversation(conversation_history: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """对话规范化：只保留角色和内容，内容合并连续空白"""
+    return [
+        (msg.get("role", ""), " ".join((msg.get("content") or "").split()))
+        for msg in conversation_history
+    ]
+
+
+def scoring_cache_key(
+    engine: ScoringEngine,
+    scoring_rule_id: Optional[int],
+    conversation_history: List[Dict[str, Any]],
+    student_diagnosis: str,
+    case_data: Dict[str, Any]
+) -> str:
+    """
+    计算评分缓存键
+
+    Args:
+        engine: 评分引擎（权重与评分标准参与计算，规则修改后自然失效）
+        scoring_rule_id: 评分规则ID
+        conversation_history: 对话历史
+        student_diagnosis: 学生诊断
+        case_data: 病例数据
+
+    Returns:
+        SHA-256 十六进制摘要
+    """
+    payload = json.dumps(
+        {
+            "case": [case_data.get("case_id"), str(case_data.get("version", "0"))],
+            "rule": [scoring_rule_id, engine.weights, engine.standards],
+            "conversation": normalize_conversation(conversation_history),
+            "diagnosis": " ".join((student_diagnosis or "").split()),
+            "prompt": [BaichuanService.EVALUATION_PROMPT_VERSION, settings.BAICHUAN_MODEL],
+            "lexicon": engine.lexicon.version
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(result: ScoringResult) -> bool:
+    """只缓存百川评估已返回有效分数的结果"""
+    return not result.llm_pending and any(v > 0 for v in result.llm_scores.values())
+
+
+def result_to_dict(result: ScoringResult) -> Dict[str, Any]:
+    """ScoringResult 转为可JSON序列化的字典"""
+    return {
+        f.name: getattr(result, f.name)
+        for f in fields(ScoringResult) if f.name not in _TRANSIENT_FIELDS
+    }
+
+
+def result_from_dict(data: Dict[str, Any]) -> ScoringResult:
+    """由缓存字典恢复 ScoringResult（忽略未知字段，兼容字段增减；深拷贝，调用方可随意修改）"""
+    names = {f.name for f in fields(ScoringResult)} - _TRANSIENT_FIELDS
+    return ScoringResult(**copy.deepcopy({k: v for k, v in data.items() if k in names}))
+
+
+class ScoringCache:
+    """评分结果缓存（进程内LRU + 数据库表）"""
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, data: Dict[str, Any]):
+        with self._lock:
+            self._data[key] = data
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    async def get(self, db: AsyncSession, key: str) -> Optional[ScoringResult]:
+        """
+        查找缓存的评分结果
+
+        Args:
+            db: 数据库会话
+            key: 缓存键
+
+        Returns:
+            ScoringResult对象（每次返回新对象），未命中返回None
+        """
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+                self.memory_hits += 1
+        if data is not None:
+            return result_from_dict(data)
+
+        row = (await db.execute(
+            select(ScoringResultCache).where(ScoringResultCache.cache_key == key)
+        )).scalar_one_or_none()
+        if row is None:
+            self.misses += 1
+            return None
+
+        row.hits = (row.hits or 0) + 1
+        row.last_hit_at = datetime.utcnow()
+        self.db_hits += 1
+        self._remember(key, row.result)
+        return result_from_dict(row.result)
+
+    async def put(self, db: AsyncSession, key: str, result: ScoringResult):
+        """
+        保存评分结果（随调用方的事务提交）
+
+        并发评分同一输入时另一请求可能已写入，此时忽略唯一键冲突。
+
+        Args:
+            db: 数据库会话
+            key: 缓存键
+            result: 评分结果
+        """
+        data = copy.deepcopy(result_to_dict(result))
+        self._remember(key, data)
+        try:
+            async with db.begin_nested():
+                db.add(ScoringResultCache(cache_key=key, result=data, hits=0))
+        except IntegrityError:
+            logger.debug(f"评分缓存已存在: {key[:12]}")
+
+    def clear(self):
+        """清空进程内缓存（数据库表不受影响）"""
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses
+        }
+
+
+# 全局单例
+_scoring_cache: Optional[ScoringCache] = None
+
+
+def get_scoring_cache() -> ScoringCache:
+    """获取评分结果缓存单例"""
+    global _scoring_cache
+    if _scoring_cache is None:
+        _scoring_cache = ScoringCache(maxsize=settings.SCORING_CACHE_SIZE)
+    return _scoring_cache
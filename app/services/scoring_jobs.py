@@ -0,0 +1,550 @@
+"""
+评分任务队列 - /api/chat/end 的异步评分
+
+scoring_jobs 表即队列本身：接口只负责入队并立即返回任务ID，固定数量的
+工作协程从表中领取任务，完成评分及全部持久化后通知订阅方（WebSocket推送）。
+领取任务时写入执行租约，执行期间定期续约；进程重启或工作者崩溃后，租约
+过期的任务会被重新领取。写回结果时按 (状态, 执行次数) 确认租约仍归自己，
+已被其他工作者接管的任务不再写回。
+"""
+
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Set
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import uuid
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+
+from app.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.database import (
+    ScoringJob, ScoringJobStatus, SessionScore, ImprovementSuggestion,
+    SessionStatus
+)
+from app.core.incremental_scoring import IncrementalScorer
+from app.services.case_store import get_case_store, default_case_data
+from app.services.scoring_service import ScoringService
+from app.services.session_service import SessionService
+
+logger = logging.getLogger(__name__)
+
+# 任务完成/失败时的订阅回调: (会话ID, 推送数据)
+JobListener = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class ScoringJobConflictError(Exception):
+    """会话已提交过不同的诊断（首次提交为准，不能改交）"""
+
+    def __init__(self, job: ScoringJob):
+        super().__init__(f"会话已提交诊断，评分任务: {job.job_id}")
+        self.job = job
+
+
+async def build_score_report(db: AsyncSession, session_id: str, session_score: SessionScore) -> Dict[str, Any]:
+    """
+    构建评分报告（即原 /api/chat/end 同步接口的返回结构）
+
+    Args:
+        db: 数据库会话
+        session_id: 会话ID（字符串）
+        session_score: 评分记录
+
+    Returns:
+        可JSON序列化的评分报告
+    """
+    suggestions_result = await db.execute(
+        select(ImprovementSuggestion)
+        .where(ImprovementSuggestion.session_score_id == session_score.id)
+    )
+    suggestions = suggestions_result.scalars().all()
+
+    return jsonable_encoder({
+        "session_id": session_id,
+        "completed_at": session_score.created_at.isoformat() if session_score.created_at else None,
+        "scores": {
+            "inquiry": {
+                "total": session_score.inquiry_total_score,
+                "symptom_inquiry": session_score.symptom_inquiry_score,
+                "inquiry_logic": session_score.inquiry_logic_score,
+                "medical_etiquette": session_score.medical_etiquette_score,
+                "coverage_rate": session_score.key_question_coverage_rate,
+                "covered": session_score.covered_questions,
+                "missed": session_score.missed_questions
+            },
+            "diagnosis": {
+                "total": session_score.diagnosis_total_score,
+                "accuracy": session_score.diagnosis_accuracy,
+                "differential_count": session_score.differential_considered,
+                "reasoning": session_score.diagnosis_reasoning_score
+            },
+            "communication": {
+                "total": session_score.communication_total_score,
+                "turn_count": session_score.turn_count,
+                "polite_rate": session_score.polite_expression_rate,
+                "empathy": session_score.empathy_score
+            },
+            "total": session_score.final_score
+        },
+        "grade": session_score.grade,
+        "passed": session_score.passed,
+        "ai_comments": session_score.ai_comments,
+        "suggestions": [
+            {
+                "type": s.suggestion_type,
+                "priority": s.priority,
+                "title": s.title,
+                "description": s.description
+            }
+            for s in suggestions
+        ]
+    })
+
+
+async def process_scoring_job(db: AsyncSession, job: ScoringJob) -> Dict[str, Any]:
+    """
+    执行一个评分任务：评分（含学习记录、知识点掌握度）、会话分数与状态
+
+    评分记录写入后立即记到任务上，重试时不会重复评分和重复记录学习数据。
+
+    Args:
+        db: 数据库会话
+        job: 评分任务（已加载 session 关系）
+
+    Returns:
+        评分报告
+    """
+    session_service = SessionService(db)
+    scoring_service = ScoringService(db)
+
+    session = await session_service.get_session_by_id(job.session.session_id)
+    case_data = await get_case_store().get_case(db, session.case.case_id)
+    if not case_data:
+        case_data = default_case_data(session.case.case_id)
+
+    # 1. 评分（重试时复用已保存的评分记录）
+    session_score = None
+    if job.session_score_id:
+        session_score = await db.get(SessionScore, job.session_score_id)
+
+    if session_score is None:
+        conversation_history = await session_service.get_conversation_history(session.session_id)
+
+        # 增量评分快照完整时直接使用累积的规则特征（对话历史仍用于百川评估）
+        rule_features = None
+        scorer = IncrementalScorer.from_state(session.scoring_state, case_data)
+        if scorer is not None and scorer.messages == len(conversation_history):
+            rule_features = scorer.features(job.student_diagnosis or "")
+
+        session_score = await scoring_service.score_session(
+            session_id=session.id,
+            conversation_history=conversation_history,
+            student_diagnosis=job.student_diagnosis or "",
+            case_data=case_data,
+            rule_features=rule_features
+        )
+        job.session_score_id = session_score.id
+        await db.commit()
+
+    # 2. 更新chat_sessions表的评分（快速查询用）及会话状态
+    # 先刷新评分记录：百川评估迟到时补写任务可能已更新了分数
+    await db.refresh(session_score)
+    await session_service.save_scores(
+        session_id=session.session_id,
+        inquiry_score=session_score.inquiry_total_score,
+        diagnosis_score=session_score.diagnosis_total_score,
+        communication_score=session_score.communication_total_score,
+        total_score=session_score.final_score
+    )
+    await session_service.update_session_status(
+        session_id=session.session_id,
+        status=SessionStatus.COMPLETED
+    )
+    await db.commit()
+
+    await db.refresh(session_score)
+    return await build_score_report(db, session.session_id, session_score)
+
+
+class ScoringJobQueue:
+    """基于数据库表的评分任务队列 + 有界工作协程池"""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        lease_seconds: int = 300,
+        poll_interval: float = 2.0,
+        max_attempts: int = 3,
+        session_factory=AsyncSessionLocal
+    ):
+        """
+        初始化任务队列
+
+        Args:
+            workers: 工作协程数量（并发评分上限）
+            lease_seconds: 执行租约时长（秒），执行期间每隔三分之一时长续约
+            poll_interval: 空闲时轮询任务表的间隔（秒）
+            max_attempts: 单个任务最大执行次数
+            session_factory: 数据库会话工厂
+        """
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.session_factory = session_factory
+
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._listeners: List[JobListener] = []
+        # 正在执行的推送任务（保持引用）
+        self._notifications: Set[asyncio.Task] = set()
+
+    def add_listener(self, listener: JobListener):
+        """注册任务完成/失败回调（如 WebSocket 推送）"""
+        self._listeners.append(listener)
+
+    async def start(self):
+        """启动工作协程；遗留的未完成任务会在租约过期后被领取"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(i))
+            for i in range(self.workers)
+        ]
+        logger.info(f"评分任务队列已启动，工作协程数: {self.workers}")
+
+    async def stop(self):
+        """停止工作协程（执行中的任务保留为 running，租约过期后重新领取）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        session_id: int,
+        user_id: int,
+        student_diagnosis: str,
+        reasoning: Optional[str] = None
+    ) -> ScoringJob:
+        """
+        提交评分任务并提交事务
+
+        同一会话已有未失败的任务时：诊断与推理相同则返回该任务（/end 重试幂等）；
+        内容不同则拒绝（首次提交为准，评分不会使用改交的内容）。并发提交
+        （双击、客户端重试）由唯一索引保证只有一个入队，其余按已有任务处理。
+
+        Args:
+            db: 数据库会话
+            session_id: 会话数据库ID
+            user_id: 用户ID
+            student_diagnosis: 学生诊断
+            reasoning: 诊断推理（可选）
+
+        Returns:
+            ScoringJob对象
+
+        Raises:
+            ScoringJobConflictError: 已有任务且诊断或推理不同（未提交事务）
+        """
+        job = await self._active_job(db, session_id)
+
+        if job is None:
+            job = ScoringJob(
+                job_id=uuid.uuid4().hex,
+                session_id=session_id,
+                user_id=user_id,
+                student_diagnosis=student_diagnosis,
+                reasoning=reasoning,
+                status=ScoringJobStatus.PENDING.value,
+                attempts=0
+            )
+            try:
+                async with db.begin_nested():
+                    db.add(job)
+            except IntegrityError:
+                # 另一并发请求已为该会话入队
+                job = await self._active_job(db, session_id)
+                if job is None:
+                    raise
+
+        if (
+            (job.student_diagnosis or "").strip() != (student_diagnosis or "").strip()
+            or (job.reasoning or "").strip() != (reasoning or "").strip()
+        ):
+            raise ScoringJobConflictError(job)
+
+        await db.commit()
+        self._wakeup.set()
+        return job
+
+    async def _active_job(self, db: AsyncSession, session_id: int) -> Optional[ScoringJob]:
+        """会话当前未失败的任务"""
+        result = await db.execute(
+            select(ScoringJob)
+            .where(
+                and_(
+                    ScoringJob.session_id == session_id,
+                    ScoringJob.status != ScoringJobStatus.FAILED.value
+                )
+            )
+            .order_by(ScoringJob.id.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    async def get_job(self, db: AsyncSession, job_id: str) -> Optional[ScoringJob]:
+        """按任务ID获取评分任务"""
+        result = await db.execute(
+            select(ScoringJob)
+            .options(selectinload(ScoringJob.session))
+            .where(ScoringJob.job_id == job_id)
+        )
+        return result.scalar_one_or_none()
+
+    def _claimable(self, now: datetime):
+        """可领取条件：待执行，或执行中但租约已过期"""
+        return or_(
+            ScoringJob.status == ScoringJobStatus.PENDING.value,
+            and_(
+                ScoringJob.status == ScoringJobStatus.RUNNING.value,
+                ScoringJob.locked_until < now
+            )
+        )
+
+    async def claim(self) -> Optional[int]:
+        """
+        领取一个任务（条件更新，多进程下同一任务只会被一个工作者领取）
+
+        Returns:
+            任务主键，无可领取任务时返回None
+        """
+        async with self.session_factory() as db:
+            while True:
+                now = datetime.utcnow()
+                result = await db.execute(
+                    select(ScoringJob.id)
+                    .where(self._claimable(now))
+                    .order_by(ScoringJob.id)
+                    .limit(1)
+                )
+                job_pk = result.scalar_one_or_none()
+                if job_pk is None:
+                    return None
+
+                claimed = await db.execute(
+                    update(ScoringJob)
+                    .where(and_(ScoringJob.id == job_pk, self._claimable(now)))
+                    .values(
+                        status=ScoringJobStatus.RUNNING.value,
+                        attempts=ScoringJob.attempts + 1,
+                        locked_until=now + timedelta(seconds=self.lease_seconds),
+                        started_at=now
+                    )
+                )
+                await db.commit()
+                if claimed.rowcount == 1:
+                    return job_pk
+
+    def _owned(self, job_pk: int, attempts: int):
+        """租约仍归本次执行：任务执行中且没有被重新领取（重新领取会增加执行次数）"""
+        return and_(
+            ScoringJob.id == job_pk,
+            ScoringJob.status == ScoringJobStatus.RUNNING.value,
+            ScoringJob.attempts == attempts
+        )
+
+    async def _heartbeat(self, job_pk: int, attempts: int):
+        """执行期间每隔三分之一租约时长续约，评分耗时超过租约时长也不会被重新领取"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with self.session_factory() as db:
+                    renewed = await db.execute(
+                        update(ScoringJob)
+                        .where(self._owned(job_pk, attempts))
+                        .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"评分任务续约失败 (job_pk={job_pk}): {e}")
+                continue
+            if renewed.rowcount != 1:
+                logger.warning(f"评分任务租约已失效 (job_pk={job_pk})，停止续约")
+                return
+
+    async def run_job(self, job_pk: int):
+        """执行一个已领取的任务，成功/失败后写回状态并通知订阅方"""
+        async with self.session_factory() as db:
+            job = await self._load(db, job_pk)
+            session_key = job.session.session_id
+            attempts = job.attempts
+
+            if attempts > self.max_attempts:
+                await self._fail(db, job, "超过最大重试次数", session_key)
+                return
+
+            heartbeat = asyncio.create_task(self._heartbeat(job_pk, attempts))
+            try:
+                report = await process_scoring_job(db, job)
+            except Exception as e:
+                logger.exception(f"评分任务执行失败 (job_id={job.job_id}): {e}")
+                await db.rollback()
+                job = await self._load(db, job_pk)
+                if job.status != ScoringJobStatus.RUNNING.value or job.attempts != attempts:
+                    logger.warning(f"评分任务已被其他工作者接管，不再写回 (job_id={job.job_id})")
+                elif job.attempts >= self.max_attempts:
+                    await self._fail(db, job, str(e), session_key)
+                else:
+                    # 放回队列等待重试
+                    job.status = ScoringJobStatus.PENDING.value
+                    job.locked_until = None
+                    job.error = str(e)
+                    await db.commit()
+                    self._wakeup.set()
+                return
+            finally:
+                heartbeat.cancel()
+
+            # 条件更新：租约已被其他工作者接管时不覆盖其状态
+            completed = await db.execute(
+                update(ScoringJob)
+                .where(self._owned(job_pk, attempts))
+                .values(
+                    status=ScoringJobStatus.COMPLETED.value,
+                    locked_until=None,
+                    error=None,
+                    finished_at=datetime.utcnow()
+                )
+            )
+            await db.commit()
+            if completed.rowcount != 1:
+                logger.warning(f"评分任务租约已失效，结果未写回 (job_id={job.job_id})")
+                return
+
+        self._notify(session_key, {
+            "job_id": job.job_id,
+            "status": ScoringJobStatus.COMPLETED.value,
+            "result": report
+        })
+
+    async def _load(self, db: AsyncSession, job_pk: int) -> ScoringJob:
+        result = await db.execute(
+            select(ScoringJob)
+            .options(selectinload(ScoringJob.session))
+            .where(ScoringJob.id == job_pk)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one()
+
+    async def _fail(self, db: AsyncSession, job: ScoringJob, error: str, session_key: str):
+        """标记任务失败并通知订阅方"""
+        job.status = ScoringJobStatus.FAILED.value
+        job.locked_until = None
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+
+        self._notify(session_key, {
+            "job_id": job.job_id,
+            "status": job.status,
+            "error": error
+        })
+
+    async def _release(self, job_pk: int, error: str):
+        """
+        run_job 未能写回状态时释放租约
+
+        仍有重试次数时放回队列，否则标记失败；释放也失败时任务保持 running，
+        租约过期后会被重新领取。
+        """
+        try:
+            async with self.session_factory() as db:
+                job = await db.get(ScoringJob, job_pk)
+                if job is None or job.status != ScoringJobStatus.RUNNING.value:
+                    return
+                if job.attempts >= self.max_attempts:
+                    job.status = ScoringJobStatus.FAILED.value
+                    job.finished_at = datetime.utcnow()
+                else:
+                    job.status = ScoringJobStatus.PENDING.value
+                    self._wakeup.set()
+                job.locked_until = None
+                job.error = error
+                await db.commit()
+        except Exception as e:
+            logger.error(f"释放评分任务租约失败 (job_pk={job_pk}): {e}，租约过期后重新领取")
+
+    def _notify(self, session_id: str, payload: Dict[str, Any]):
+        """异步通知订阅方，推送失败不影响任务状态"""
+        for listener in self._listeners:
+            task = asyncio.create_task(self._safe_call(listener, session_id, payload))
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+
+    @staticmethod
+    async def _safe_call(listener: JobListener, session_id: str, payload: Dict[str, Any]):
+        try:
+            await listener(session_id, payload)
+        except Exception as e:
+            logger.warning(f"评分任务通知失败 (session_id={session_id}): {e}")
+
+    async def _worker(self, index: int):
+        """工作协程：领取 -> 执行，空闲时等待入队信号或轮询"""
+        while True:
+            self._wakeup.clear()
+            try:
+                job_pk = await self.claim()
+            except Exception as e:
+                logger.error(f"领取评分任务失败 (worker={index}): {e}")
+                job_pk = None
+
+            if job_pk is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.run_job(job_pk)
+            except Exception as e:
+                # run_job 自身的数据库操作出错：记录并释放租约，工作协程继续运行
+                logger.exception(f"评分任务执行异常 (worker={index}, job_pk={job_pk}): {e}")
+                await self._release(job_pk, str(e))
+
+
+def job_to_dict(job: ScoringJob) -> Dict[str, Any]:
+    """评分任务状态（不含评分报告）"""
+    return {
+        "job_id": job.job_id,
+        "session_id": job.session.session_id if job.session else None,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+# 全局单例
+_scoring_job_queue: Optional[ScoringJobQueue] = None
+
+
+def get_scoring_job_queue() -> ScoringJobQueue:
+    """获取评分任务队列单例"""
+    global _scoring_job_queue
+    if _scoring_job_queue is None:
+        _scoring_job_queue = ScoringJobQueue(
+            workers=settings.SCORING_JOB_WORKERS,
+            lease_seconds=settings.SCORING_JOB_LEASE_SECONDS,
+            poll_interval=settings.SCORING_JOB_POLL_INTERVAL,
+            max_attempts=settings.SCORING_JOB_MAX_ATTEMPTS
+        )
+    return _scoring_job_queue
@@ -0,0 +1,130 @@
+"""
+评分规则注册表 - 将数据库中的 ScoringRule 转换为可复用的评分引擎
+
+评分规则表很小，注册表按TTL整体加载，评分时直接取内存中的引擎，不再每次
+评分都查询一次 scoring_rules 表。引擎按 (规则ID, 更新时间) 缓存：刷新时只为
+新增或修改过的规则重新构建引擎，未变化的规则沿用原引擎对象。
+"""
+
+from typing import Dict, Any, Optional, Tuple
+import logging
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.scoring_engine import ScoringEngine
+from app.models.database import ScoringRule
+
+logger = logging.getLogger(__name__)
+
+# (规则ID, 规则版本)
+RuleKey = Tuple[int, str]
+
+
+def rule_key(rule: ScoringRule) -> RuleKey:
+    """规则的缓存键：ID + 最后修改时间"""
+    version_time = rule.updated_at or rule.created_at
+    return rule.id, version_time.isoformat() if version_time else "0"
+
+
+class ScoringRuleRegistry:
+    """评分规则注册表"""
+
+    def __init__(self, ttl_seconds: int = 60):
+        """
+        初始化注册表
+
+        Args:
+            ttl_seconds: 规则列表的刷新间隔（秒）
+        """
+        self.ttl_seconds = ttl_seconds
+        self.default_engine = ScoringEngine()
+
+        self._engines: Dict[RuleKey, ScoringEngine] = {}
+        # 规则ID -> 当前版本的缓存键
+        self._rules: Dict[int, RuleKey] = {}
+        self._active_id: Optional[int] = None
+        self._expires_at = 0.0
+
+        self.refreshes = 0
+        self.builds = 0
+
+    async def refresh(self, db: AsyncSession):
+        """重新加载规则列表，只为新增或修改过的规则构建引擎"""
+        result = await db.execute(
+            select(ScoringRule).order_by(ScoringRule.created_at.desc(), ScoringRule.id.desc())
+        )
+        rules = result.scalars().all()
+
+        engines: Dict[RuleKey, ScoringEngine] = {}
+        self._rules = {}
+        self._active_id = None
+        for rule in rules:
+            key = rule_key(rule)
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = ScoringEngine.from_rule(rule)
+                self.builds += 1
+            engines[key] = engine
+            self._rules[rule.id] = key
+            # 与 ScoringService.get_active_scoring_rule 一致：最新创建的启用规则
+            if rule.is_active and self._active_id is None:
+                self._active_id = rule.id
+
+        self._engines = engines
+        self._expires_at = time.monotonic() + self.ttl_seconds
+        self.refreshes += 1
+
+    async def get_engine(
+        self,
+        db: AsyncSession,
+        rule_id: Optional[int] = None
+    ) -> Tuple[ScoringEngine, Optional[int]]:
+        """
+        获取评分引擎
+
+        Args:
+            db: 数据库会话（仅在规则列表过期时使用）
+            rule_id: 评分规则ID，为None时使用当前启用的规则
+
+        Returns:
+            (评分引擎, 实际使用的规则ID)；没有可用规则时返回默认引擎和None
+        """
+        if time.monotonic() >= self._expires_at:
+            await self.refresh(db)
+
+        if rule_id is None:
+            rule_id = self._active_id
+        elif rule_id not in self._rules:
+            logger.warning(f"评分规则不存在: {rule_id}，使用当前启用的规则")
+            rule_id = self._active_id
+
+        if rule_id is None:
+            return self.default_engine, None
+        return self._engines[self._rules[rule_id]], rule_id
+
+    def invalidate(self):
+        """规则变更后调用，下次取引擎时重新加载规则列表"""
+        self._expires_at = 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rules": len(self._rules),
+            "active_rule_id": self._active_id,
+            "refreshes": self.refreshes,
+            "builds": self.builds
+        }
+
+
+# 全局单例
+_registry: Optional[ScoringRuleRegistry] = None
+
+
+def get_scoring_rule_registry() -> ScoringRuleRegistry:
+    """获取评分规则注册表单例"""
+    global _registry
+    if _registry is None:
+        _registry = ScoringRuleRegistry(ttl_seconds=settings.SCORING_RULE_CACHE_TTL_SECONDS)
+    return _registry
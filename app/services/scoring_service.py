@@ -2,25 +2,173 @@
 评分服务层 - 负责评分相关的数据库操作
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from datetime import datetime
+import asyncio
+import logging
 
 from app.models.database import (
     SessionScore, ScoringRule, QuestionCoverage, DiagnosisRecord,
     LearningRecord, ImprovementSuggestion, KnowledgePoint,
-    StudentKnowledgeMastery, ChatSession
+    StudentKnowledgeMastery, ChatSession, MasteryLevel
 )
 from app.core.scoring_engine import ScoringEngine, ScoringResult
+from app.config import settings
+from app.db.session import AsyncSessionLocal
+from app.services.scoring_cache import get_scoring_cache, scoring_cache_key, is_cacheable
+from app.services.scoring_rules import get_scoring_rule_registry
+
+logger = logging.getLogger(__name__)
+
+# 正在补写百川融合结果的后台任务（保持引用，避免任务被回收）
+_pending_fusions: Set[asyncio.Task] = set()
+
+
+def _suggestion_type(suggestion: str) -> str:
+    """根据建议内容确定建议类型"""
+    if "诊断" in suggestion or "鉴别" in suggestion:
+        return "diagnosis"
+    elif "沟通" in suggestion or "礼貌" in suggestion or "共情" in suggestion:
+        return "communication"
+    return "inquiry"
+
+
+def _mastery_level(mastery_rate: float) -> MasteryLevel:
+    """按掌握率确定掌握等级"""
+    if mastery_rate >= 90:
+        return MasteryLevel.EXPERT
+    elif mastery_rate >= 75:
+        return MasteryLevel.PROFICIENT
+    elif mastery_rate >= 60:
+        return MasteryLevel.DEVELOPING
+    return MasteryLevel.NOVICE
+
+
+def _knowledge_point_codes(case_data: Dict[str, Any]) -> List[str]:
+    """病例关联的知识点编码（未指定时根据类别推断）"""
+    knowledge_point_codes = case_data.get("knowledge_points", [])
+
+    if not knowledge_point_codes:
+        # 如果病例没有指定知识点，根据类别推断
+        category = case_data.get("category", "")
+        code_prefix = {
+            "心内科": "CARDIO",
+            "心内": "CARDIO",
+            "消化内科": "GASTRO",
+            "消化": "GASTRO",
+            "呼吸内科": "RESP",
+            "呼吸": "RESP"
+        }.get(category, "")
+
+        if code_prefix:
+            knowledge_point_codes = [f"{code_prefix}-001"]
+
+    return knowledge_point_codes
+
+
+def _learning_knowledge(case_data: Dict[str, Any], passed: bool) -> Tuple[list, list]:
+    """学习记录中的 (已掌握, 薄弱) 知识点"""
+    category = case_data.get("category")
+    return ([category], []) if passed else ([], [category])
+
+
+def _apply_result_scores(session_score: SessionScore, result: ScoringResult):
+    """将评分结果中可能被百川评估修正的字段写入评分记录"""
+    session_score.inquiry_logic_score = result.inquiry_logic_score
+    session_score.inquiry_total_score = result.inquiry_total_score
+    session_score.diagnosis_reasoning_score = result.diagnosis_reasoning_score
+    session_score.diagnosis_total_score = result.diagnosis_total_score
+    session_score.communication_total_score = result.communication_total_score
+    session_score.final_score = result.final_score
+    session_score.grade = result.grade
+    session_score.passed = result.passed
+    session_score.llm_scores = result.llm_scores or None
+    session_score.ai_comments = result.ai_comments
+
+
+async def apply_late_fusion(
+    session_score_id: int,
+    user_id: int,
+    fusion: "asyncio.Task",
+    case_data: Dict[str, Any],
+    cache_key: Optional[str] = None,
+    session_factory=AsyncSessionLocal
+):
+    """
+    百川评估迟到时，等待融合结果并补写评分记录
+
+    学习记录和知识点掌握度已按规则评分写入，融合后同步修正，保持与评分记录一致。
+    规则评分结果不进缓存，融合后的完整结果在此写入评分缓存。
+
+    Args:
+        session_score_id: 评分记录ID
+        user_id: 用户ID
+        fusion: 产出融合后 ScoringResult 的任务
+        case_data: 病例数据
+        cache_key: 评分缓存键（未启用缓存时为None）
+        session_factory: 数据库会话工厂（后台任务不能复用请求的会话）
+    """
+    try:
+        result = await fusion
+    except Exception as e:
+        logger.error(f"百川评估补写失败 (score_id={session_score_id}): {e}")
+        return
+
+    async with session_factory() as db:
+        session_score = await db.get(SessionScore, session_score_id)
+        if not session_score:
+            return
+
+        previously_passed = bool(session_score.passed)
+        _apply_result_scores(session_score, result)
+        await ScoringService(db).revise_learning(session_score, user_id, previously_passed, case_data)
+
+        # 追加规则评分之外的新建议
+        existing = await db.execute(
+            select(ImprovementSuggestion.description)
+            .where(ImprovementSuggestion.session_score_id == session_score_id)
+        )
+        known = set(existing.scalars().all())
+        for suggestion in result.suggestions:
+            if suggestion in known:
+                continue
+            db.add(ImprovementSuggestion(
+                session_score_id=session_score_id,
+                user_id=user_id,
+                suggestion_type=_suggestion_type(suggestion),
+                title="改进建议",
+                description=suggestion,
+                action_items=[]
+            ))
+
+        # 同步 chat_sessions 表的快速查询分数
+        chat_session = await db.get(ChatSession, session_score.session_id)
+        if chat_session:
+            chat_session.inquiry_score = result.inquiry_total_score
+            chat_session.diagnosis_score = result.diagnosis_total_score
+            chat_session.communication_score = result.communication_total_score
+            chat_session.total_score = result.final_score
+
+        if cache_key is not None and is_cacheable(result):
+            await get_scoring_cache().put(db, cache_key, result)
+
+        await db.commit()
+        logger.info(f"已补写百川融合评分 (score_id={session_score_id})")
 
 
 class ScoringService:
     """评分服务"""
 
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, engine: Optional[ScoringEngine] = None):
+        """
+        Args:
+            db: 数据库会话
+            engine: 指定评分引擎；为None时按评分规则从注册表获取
+        """
         self.db = db
-        self.engine = ScoringEngine()
+        self.engine = engine
 
     async def score_session(
         self,
@@ -28,27 +176,51 @@ class ScoringService:
         conversation_history: list,
         student_diagnosis: str,
         case_data: Dict[str, Any],
-        scoring_rule_id: Optional[int] = None
+        scoring_rule_id: Optional[int] = None,
+        rule_features: Optional[Dict[str, Any]] = None
     ) -> SessionScore:
         """
         对会话进行评分并保存结果
 
+        相同输入（病例版本、评分规则、对话、诊断、提示词版本）已评分过时直接
+        复用缓存的结果，不再调用百川评估。
+
         Args:
             session_id: 会话ID
             conversation_history: 对话历史
             student_diagnosis: 学生诊断
             case_data: 病例数据
-            scoring_rule_id: 评分规则ID（可选）
+            scoring_rule_id: 评分规则ID（可选，默认使用当前启用的规则）
+            rule_features: 增量评分累积的规则特征（可选，提供时不再重新扫描对话）
 
         Returns:
             SessionScore对象
         """
-        # 使用评分引擎计算评分
-        result = await self.engine.score_session(
-            conversation_history=conversation_history,
-            student_diagnosis=student_diagnosis,
-            case_data=case_data
-        )
+        engine = self.engine
+        if engine is None:
+            engine, scoring_rule_id = await get_scoring_rule_registry().get_engine(
+                self.db, scoring_rule_id
+            )
+
+        cache = get_scoring_cache() if settings.SCORING_CACHE_ENABLED else None
+        cache_key = None
+        result = None
+        if cache is not None:
+            cache_key = scoring_cache_key(
+                engine, scoring_rule_id, conversation_history, student_diagnosis, case_data
+            )
+            result = await cache.get(self.db, cache_key)
+
+        if result is None:
+            # 使用评分引擎计算评分
+            result = await engine.score_session(
+                conversation_history=conversation_history,
+                student_diagnosis=student_diagnosis,
+                case_data=case_data,
+                rule_features=rule_features
+            )
+            if cache is not None and is_cacheable(result):
+                await cache.put(self.db, cache_key, result)
 
         # 获取会话的用户ID
         session_result = await self.db.execute(
@@ -90,6 +262,7 @@ class ScoringService:
             final_score=result.final_score,
             grade=result.grade,
             passed=result.passed,
+            llm_scores=result.llm_scores or None,
 
             # AI评语
             ai_comments=result.ai_comments
@@ -118,17 +291,10 @@ class ScoringService:
 
         # 创建改进建议
         for suggestion in result.suggestions:
-            # 确定建议类型
-            suggestion_type = "inquiry"  # 默认
-            if "诊断" in suggestion or "鉴别" in suggestion:
-                suggestion_type = "diagnosis"
-            elif "沟通" in suggestion or "礼貌" in suggestion or "共情" in suggestion:
-                suggestion_type = "communication"
-
             self.db.add(ImprovementSuggestion(
                 session_score_id=session_score.id,
                 user_id=user_id,
-                suggestion_type=suggestion_type,
+                suggestion_type=_suggestion_type(suggestion),
                 title="改进建议",
                 description=suggestion,
                 action_items=[]
@@ -144,8 +310,22 @@ class ScoringService:
             diagnosis_confidence="high" if result.diagnosis_accuracy == "correct" else "medium"
         ))
 
+        # 学习记录与知识点掌握度与评分记录在同一事务中写入（百川迟到时由补写任务修正）
+        if chat_session:
+            await self.record_learning(chat_session, session_score, case_data)
+
         await self.db.commit()
 
+        # 百川评估未在截止时间内返回：后台等待并补写融合结果
+        if result.llm_pending and result.llm_fusion is not None:
+            task = asyncio.create_task(
+                apply_late_fusion(
+                    session_score.id, user_id, result.llm_fusion, case_data, cache_key
+                )
+            )
+            _pending_fusions.add(task)
+            task.add_done_callback(_pending_fusions.discard)
+
         return session_score
 
     async def get_session_score(self, session_id: int) -> Optional[SessionScore]:
@@ -175,9 +355,10 @@ class ScoringService:
         time_spent: int,
         knowledge_tested: list,
         knowledge_mastered: list,
-        knowledge_weak: list
+        knowledge_weak: list,
+        commit: bool = True
     ) -> LearningRecord:
-        """创建学习记录"""
+        """创建学习记录（commit=False 时只加入当前事务）"""
         record = LearningRecord(
             user_id=user_id,
             session_id=session_id,
@@ -192,16 +373,112 @@ class ScoringService:
         )
 
         self.db.add(record)
-        await self.db.commit()
+        if commit:
+            await self.db.commit()
 
         return record
 
+    async def record_learning(
+        self,
+        chat_session: ChatSession,
+        session_score: SessionScore,
+        case_data: Dict[str, Any]
+    ):
+        """
+        按评分结果写入学习记录和知识点掌握度（不提交事务）
+
+        Args:
+            chat_session: 会话
+            session_score: 评分记录
+            case_data: 病例数据
+        """
+        mastered, weak = _learning_knowledge(case_data, session_score.passed)
+        await self.create_learning_record(
+            user_id=chat_session.user_id,
+            session_id=chat_session.id,
+            case_id=chat_session.case_id,
+            score=session_score.final_score,
+            time_spent=0,  # 可以后续计算
+            knowledge_tested=[],
+            knowledge_mastered=mastered,
+            knowledge_weak=weak,
+            commit=False
+        )
+        await self.update_knowledge_mastery(
+            user_id=chat_session.user_id,
+            case_data=case_data,
+            score=session_score.final_score,
+            passed=session_score.passed,
+            commit=False
+        )
+
+    async def revise_learning(
+        self,
+        session_score: SessionScore,
+        user_id: int,
+        previously_passed: bool,
+        case_data: Dict[str, Any]
+    ):
+        """
+        评分被百川融合结果修正后，同步修正学习记录和知识点掌握度（不提交事务）
+
+        掌握度只在及格与否变化时调整答对次数，作答次数不变。
+
+        Args:
+            session_score: 已更新的评分记录
+            user_id: 用户ID
+            previously_passed: 修正前是否及格
+            case_data: 病例数据
+        """
+        result = await self.db.execute(
+            select(LearningRecord).where(LearningRecord.session_id == session_score.session_id)
+        )
+        records = result.scalars().all()
+        if not records:
+            return
+
+        passed = bool(session_score.passed)
+        mastered, weak = _learning_knowledge(case_data, passed)
+        for record in records:
+            record.score = session_score.final_score
+            record.knowledge_points_mastered = mastered
+            record.knowledge_points_weak = weak
+
+        if passed == previously_passed:
+            return
+
+        for mastery in await self._mastery_records(user_id, case_data):
+            mastery.correct_count = min(
+                max((mastery.correct_count or 0) + (1 if passed else -1), 0),
+                mastery.total_attempts
+            )
+            mastery.mastery_rate = (mastery.correct_count / mastery.total_attempts) * 100
+            mastery.mastery_level = _mastery_level(mastery.mastery_rate)
+
+    async def _mastery_records(self, user_id: int, case_data: Dict[str, Any]) -> List[StudentKnowledgeMastery]:
+        """用户在病例关联知识点上已有的掌握记录"""
+        codes = _knowledge_point_codes(case_data)
+        if not codes:
+            return []
+        result = await self.db.execute(
+            select(StudentKnowledgeMastery)
+            .join(KnowledgePoint, KnowledgePoint.id == StudentKnowledgeMastery.knowledge_point_id)
+            .where(
+                and_(
+                    StudentKnowledgeMastery.user_id == user_id,
+                    KnowledgePoint.code.in_(codes)
+                )
+            )
+        )
+        return list(result.scalars().all())
+
     async def update_knowledge_mastery(
         self,
         user_id: int,
         case_data: Dict[str, Any],
         score: float,
-        passed: bool
+        passed: bool,
+        commit: bool = True
     ):
         """
         更新知识点掌握度
@@ -211,25 +488,10 @@ class ScoringService:
             case_data: 病例数据
             score: 评分
             passed: 是否及格
+            commit: 是否提交事务（False 时只加入当前事务）
         """
         # 获取病例关联的知识点
-        knowledge_point_codes = case_data.get("knowledge_points", [])
-
-        if not knowledge_point_codes:
-            # 如果病例没有指定知识点，根据类别推断
-            category = case_data.get("category", "")
-            code_prefix = {
-                "心内科": "CARDIO",
-                "心内科": "CARDIO",
-                "心内": "CARDIO",
-                "消化内科": "GASTRO",
-                "消化": "GASTRO",
-                "呼吸内科": "RESP",
-                "呼吸": "RESP"
-            }.get(category, "")
-
-            if code_prefix:
-                knowledge_point_codes = [f"{code_prefix}-001"]
+        knowledge_point_codes = _knowledge_point_codes(case_data)
 
         # 更新每个知识点的掌握度
         for code in knowledge_point_codes:
@@ -268,27 +530,12 @@ class ScoringService:
                 mastery.last_attempt_at = now
 
                 # 确定掌握等级
-                if mastery.mastery_rate >= 90:
-                    mastery.mastery_level = MasteryLevel.EXPERT
-                elif mastery.mastery_rate >= 75:
-                    mastery.mastery_level = MasteryLevel.PROFICIENT
-                elif mastery.mastery_rate >= 60:
-                    mastery.mastery_level = MasteryLevel.DEVELOPING
-                else:
-                    mastery.mastery_level = MasteryLevel.NOVICE
+                mastery.mastery_level = _mastery_level(mastery.mastery_rate)
 
             else:
                 # 创建新记录
                 mastery_rate = 100 if passed else 0
-
-                if mastery_rate >= 90:
-                    level = MasteryLevel.EXPERT
-                elif mastery_rate >= 75:
-                    level = MasteryLevel.PROFICIENT
-                elif mastery_rate >= 60:
-                    level = MasteryLevel.DEVELOPING
-                else:
-                    level = MasteryLevel.NOVICE
+                level = _mastery_level(mastery_rate)
 
                 mastery = StudentKnowledgeMastery(
                     user_id=user_id,
@@ -303,7 +550,8 @@ class ScoringService:
 
                 self.db.add(mastery)
 
-        await self.db.commit()
+        if commit:
+            await self.db.commit()
 
     async def get_user_learning_progress(
         self,
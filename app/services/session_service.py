@@ -1,11 +1,12 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload, defer
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import uuid
 
 from app.models.database import ChatSession, Message, Case, User, SessionStatus
+from app.core.incremental_scoring import get_incremental_scorer_cache
 from app.models.schemas import SessionCreate, SessionResponse
 
 
@@ -14,6 +15,8 @@ class SessionService:
 
     def __init__(self, db: AsyncSession):
         self.db = db
+        # 请求级会话缓存: session_id -> ChatSession，同一请求内会话行只查询一次
+        self._sessions: Dict[str, ChatSession] = {}
 
     async def create_session(
         self,
@@ -72,7 +75,6 @@ class SessionService:
             user_id=user_id,
             case_id=case.id,  # 使用Case表的数据库ID
             status=SessionStatus.ACTIVE,
-            conversation_history=[],
             turn_count=0,
             started_at=datetime.utcnow()
         )
@@ -80,27 +82,41 @@ class SessionService:
         self.db.add(db_session)
         await self.db.flush()
 
+        self._sessions[db_session.session_id] = db_session
         return db_session
 
     async def get_session_by_id(self, session_id: str) -> Optional[ChatSession]:
         """
         根据session_id获取会话
 
+        只加载会话行和病例的 id/case_id；消息列表不预加载（见
+        get_session_messages / get_conversation_history），已废弃的
+        conversation_history JSON 列不加载。
+        同一 SessionService 实例内重复调用直接返回缓存的会话。
+
         Args:
             session_id: 会话ID
 
         Returns:
             ChatSession对象或None
         """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            return session
+
         result = await self.db.execute(
             select(ChatSession)
             .where(ChatSession.session_id == session_id)
             .options(
-                selectinload(ChatSession.messages),
-                selectinload(ChatSession.case)  # 预加载Case关联
+                defer(ChatSession.conversation_history),
+                joinedload(ChatSession.case).load_only(Case.id, Case.case_id)
             )
         )
-        return result.scalar_one_or_none()
+        session = result.scalar_one_or_none()
+
+        if session is not None:
+            self._sessions[session_id] = session
+        return session
 
     async def get_active_session(
         self,
@@ -146,7 +162,8 @@ class SessionService:
         session_id: str,
         role: str,
         content: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        case_data: Optional[Dict[str, Any]] = None
     ) -> Message:
         """
         添加消息到会话
@@ -156,6 +173,7 @@ class SessionService:
             role: 角色 (student/patient/system)
             content: 消息内容
             metadata: 元数据 (情绪、疼痛等级等)
+            case_data: 病例数据，提供时同时更新会话的增量评分状态
 
         Returns:
             创建的Message对象
@@ -176,21 +194,16 @@ class SessionService:
 
         self.db.add(message)
 
-        # 更新会话的对话历史
-        if not session.conversation_history:
-            session.conversation_history = []
-
-        session.conversation_history.append({
-            "role": role,
-            "content": content,
-            "metadata": metadata or {},
-            "timestamp": datetime.utcnow().isoformat()
-        })
-
         # 更新轮次计数（学生消息计入）
         if role == "student":
             session.turn_count = (session.turn_count or 0) + 1
 
+        if case_data is not None:
+            # 快照缺失或病例已变化时从头累积，消息数对不上时结束评分会退回全量扫描
+            scorer = get_incremental_scorer_cache().get(session.id, session.scoring_state, case_data)
+            scorer.add_message(role, content)
+            session.scoring_state = scorer.to_state()
+
         await self.db.flush()
 
         return message
@@ -326,8 +339,12 @@ class SessionService:
         if not session:
             return []
 
-        # 从conversation_history返回，或从messages表查询
-        return session.messages
+        result = await self.db.execute(
+            select(Message)
+            .where(Message.session_id == session.id)
+            .order_by(Message.id)
+        )
+        return result.scalars().all()
 
     async def cleanup_expired_sessions(
         self,
@@ -367,22 +384,54 @@ class SessionService:
 
     async def get_conversation_history(
         self,
-        session_id: str
+        session_id: str,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
-        获取会话的对话历史 (用于LLM上下文)
+        获取会话的对话历史 (用于LLM上下文和评分)
+
+        以 messages 表为准；指定 limit 时只读取最近 limit 条
+        （ORDER BY id DESC LIMIT n），指定 after_id 时只读取该消息之后的
+        记录（对话引擎的上下文摘要游标），读取量与会话长度无关。
 
         Args:
             session_id: 会话ID
+            limit: 最近消息条数，None 表示不限
+            after_id: 只返回ID大于该值的消息
 
         Returns:
-            对话历史列表 [{role, content, metadata}, ...]
+            对话历史列表 [{id, role, content, metadata, timestamp}, ...]（按时间正序）
         """
         session = await self.get_session_by_id(session_id)
         if not session:
             return []
 
-        return session.conversation_history or []
+        query = (
+            select(Message.id, Message.role, Message.content, Message.meta_data, Message.timestamp)
+            .where(Message.session_id == session.id)
+        )
+        if after_id is not None:
+            query = query.where(Message.id > after_id)
+        if limit is not None:
+            query = query.order_by(Message.id.desc()).limit(limit)
+        else:
+            query = query.order_by(Message.id)
+
+        rows = (await self.db.execute(query)).all()
+        if limit is not None:
+            rows.reverse()
+
+        return [
+            {
+                "id": row.id,
+                "role": row.role,
+                "content": row.content,
+                "metadata": row.meta_data or {},
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None
+            }
+            for row in rows
+        ]
 
     async def increment_turn_count(self, session_id: str) -> int:
         """
@@ -0,0 +1,148 @@
+"""
+LLM请求合并（single-flight）
+
+同一班学生同时开始同一病例时，会在同一秒内发出大量完全相同的LLM请求
+（系统提示词 + 病人开场白 + 相同的第一个问题）。以 (服务, 模型, 温度,
+最大token数, 消息列表) 的哈希为键，正在进行中的相同请求只调用一次上游，
+其余请求等待同一个结果。
+
+只合并"同时在途"的请求，上游调用结束即释放，不做结果缓存。
+所有等待方都已取消（客户端断开、对冲请求落败）时取消上游调用，
+及时释放限流槽位。
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import asyncio
+import hashlib
+import json
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    messages: List[Dict[str, str]],
+    **extra: Any
+) -> str:
+    """
+    LLM请求的合并键
+
+    Args:
+        provider: 服务名（zhipu / baichuan）
+        model: 模型名
+        temperature: 温度参数
+        max_tokens: 最大token数
+        messages: 消息列表
+        **extra: 其他影响结果的参数（如 json_mode）
+
+    Returns:
+        键（sha256）
+    """
+    payload = json.dumps(
+        [provider, model, temperature, max_tokens, messages, extra],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _consume_exception(task: asyncio.Task):
+    """取出异常，避免所有等待方都已取消时出现 "exception was never retrieved" 警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """在途请求合并器"""
+
+    def __init__(self, enabled: bool = True):
+        """
+        初始化合并器
+
+        Args:
+            enabled: 是否启用合并，关闭时直接调用上游
+        """
+        self.enabled = enabled
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # 每个上游调用当前的等待方数量
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+        # 按服务名统计：发起的上游调用数 / 被合并的请求数
+        self.upstream_calls: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+
+    async def do(
+        self,
+        provider: str,
+        key: str,
+        call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        执行请求，相同键的在途请求共享同一次上游调用
+
+        Args:
+            provider: 服务名，用于统计
+            key: request_key() 生成的合并键
+            call: 发起上游调用的协程工厂
+
+        Returns:
+            上游调用结果（上游异常会传给所有等待方）
+        """
+        if not self.enabled:
+            self.upstream_calls[provider] = self.upstream_calls.get(provider, 0) + 1
+            return await call()
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._release(key, t))
+            task.add_done_callback(_consume_exception)
+            self.upstream_calls[provider] = self.upstream_calls.get(provider, 0) + 1
+        else:
+            self.coalesced[provider] = self.coalesced.get(provider, 0) + 1
+            logger.debug(f"合并相同的{provider}请求: {key[:12]}")
+
+        # 单个等待方取消（如客户端断开）不影响其他等待方
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                # 最后一个等待方也已取消：没有人需要结果，取消上游调用
+                if not task.done():
+                    task.cancel()
+
+    def _release(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        return {
+            "enabled": self.enabled,
+            "inflight": len(self._inflight),
+            "upstream_calls": dict(self.upstream_calls),
+            "coalesced": dict(self.coalesced)
+        }
+
+
+# 全局单例（智谱与百川服务共享）
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """获取请求合并器单例"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight(enabled=settings.LLM_SINGLE_FLIGHT_ENABLED)
+    return _single_flight
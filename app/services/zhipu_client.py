@@ -0,0 +1,175 @@
+"""
+智谱AI异步HTTP客户端 - 基于 httpx.AsyncClient 的 chat/completions 传输层
+
+所有请求共享一个连接池（keep-alive，可用时启用 HTTP/2），
+并发能力取决于连接数而不是线程池大小。
+"""
+
+from typing import List, Dict, Any, Optional, AsyncIterator
+import json
+import logging
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    """检查是否安装了 HTTP/2 依赖（h2）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ZhipuAsyncClient:
+    """智谱AI chat/completions 异步客户端"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        """
+        初始化客户端
+
+        Args:
+            api_key: 智谱AI API Key
+            base_url: API根地址，如 https://open.bigmodel.cn/api/paas/v4
+            http_client: 可选的外部 httpx 客户端（测试时注入）
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self._http = http_client or self._create_http_client()
+
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """创建带连接池的 httpx 客户端"""
+        http2 = settings.LLM_HTTP2 and _http2_available()
+        if settings.LLM_HTTP2 and not http2:
+            logger.info("未安装 h2，智谱AI客户端回退到 HTTP/1.1")
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(settings.TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT)
+        )
+
+    @property
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def chat_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """
+        调用 chat/completions（非流式）
+
+        Returns:
+            API返回的JSON对象
+
+        Raises:
+            httpx.HTTPError: 网络错误或非2xx响应
+        """
+        response = await self._http.post(
+            f"{self.base_url}/chat/completions",
+            headers=self._headers,
+            json={
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def stream_chat_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncIterator[str]:
+        """
+        调用 chat/completions（流式，SSE）
+
+        Yields:
+            增量回复文本片段
+
+        Raises:
+            httpx.HTTPError: 网络错误或非2xx响应
+        """
+        async with self._http.stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            headers=self._headers,
+            json={
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "stream": True
+            }
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"无法解析智谱AI流式数据: {data}")
+                    continue
+
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+    async def aclose(self):
+        """关闭连接池"""
+        await self._http.aclose()
+
+
+# 全局单例
+_zhipu_client: Optional[ZhipuAsyncClient] = None
+
+
+def get_zhipu_client() -> ZhipuAsyncClient:
+    """获取共享连接池的智谱AI客户端单例"""
+    global _zhipu_client
+    if _zhipu_client is None:
+        _zhipu_client = ZhipuAsyncClient(
+            api_key=settings.ZHIPU_API_KEY,
+            base_url=settings.ZHIPU_BASE_URL
+        )
+    return _zhipu_client
+
+
+async def close_zhipu_client():
+    """关闭智谱AI客户端连接池（应用关闭时调用）"""
+    global _zhipu_client
+    if _zhipu_client is not None:
+        await _zhipu_client.aclose()
+        _zhipu_client = None
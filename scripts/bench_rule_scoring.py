@@ -0,0 +1,70 @@
+"""
+规则评分微基准 - 预编译评分词表下的规则评分吞吐量
+
+运行方式:
+    python scripts/bench_rule_scoring.py [会话数量]
+
+用固定随机种子生成的合成对话（每段5~15轮）测量 ScoringEngine 规则评分
+（不含百川评估）的每秒会话数。
+"""
+
+import random
+import sys
+import os
+import time
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.scoring_engine import ScoringEngine
+from app.core.scoring_lexicon import ScoringLexicon
+
+CASE_DATA = {
+    "standard_diagnosis": "急性心肌梗死",
+    "differential_diagnosis": ["心绞痛", "主动脉夹层"],
+    "key_questions": ["疼痛的性质和部位", "持续时间", "既往心脏病史", "吸烟饮酒史"],
+}
+
+STUDENT = [
+    "您好，请问您哪里不舒服？", "疼痛持续多长时间了？", "是什么样的疼痛，压榨样还是刺痛？",
+    "我理解您很担心，别急，慢慢说", "以前有没有心脏病、高血压？", "疼痛有没有向左肩放射",
+    "还有其他不舒服吗，比如出汗、恶心？", "麻烦说一下疼痛的程度，几分？", "平时抽烟喝酒吗",
+    "休息后能缓解吗", "谢谢您的配合", "不好意思，再确认一下，是今天早上开始的吗？",
+]
+PATIENT = ["胸口疼，像压了块石头。", "三个小时了。", "以前医生说过可能是心绞痛", "没有了。", "出了一身冷汗。"]
+
+
+def synthetic_conversation(rng):
+    history = [{"role": "patient", "content": rng.choice(PATIENT)}]
+    for _ in range(rng.randint(5, 15)):
+        history.append({"role": "student", "content": rng.choice(STUDENT)})
+        history.append({"role": "patient", "content": rng.choice(PATIENT)})
+    return history
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = random.Random(42)
+    conversations = [synthetic_conversation(rng) for _ in range(count)]
+    engine = ScoringEngine(lexicon=ScoringLexicon())
+    # 预热（编译正则、构建关键问题索引）
+    engine._score_rules(conversations[0], "急性心肌梗死", CASE_DATA)
+
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for history in conversations:
+            engine._score_rules(history, "急性心肌梗死", CASE_DATA)
+        best = min(best, time.perf_counter() - start)
+
+    print(f"会话数量: {count}")
+    print(f"规则评分: {count / best:,.0f} 会话/秒")
+
+
+if __name__ == "__main__":
+    main()
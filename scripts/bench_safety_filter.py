@@ -0,0 +1,152 @@
+"""
+安全过滤器微基准 - 对比逐模式 re.search 与单次扫描匹配器的吞吐量
+
+运行方式:
+    python scripts/bench_safety_filter.py [消息数量]
+
+每条消息依次执行 check_student_input / should_refuse_answer /
+check_patient_response / extract_symptom_keywords，输出每秒处理消息数，
+并校验新旧实现结果一致。
+"""
+
+import random
+import re
+import sys
+import os
+import time
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.safety_filter import SafetyFilter
+
+
+class LegacySafetyFilter:
+    """优化前的实现（逐模式 re.search），仅用于对比"""
+
+    @staticmethod
+    def check_student_input(message):
+        for signal_type, patterns in SafetyFilter.DANGER_SIGNALS.items():
+            for pattern in patterns:
+                if re.search(pattern, message):
+                    return False, signal_type, message
+        return True, None, message
+
+    @staticmethod
+    def should_refuse_answer(question):
+        for category, patterns in SafetyFilter.FORBIDDEN_PATTERNS.items():
+            for pattern in patterns:
+                if re.search(pattern, question):
+                    return True, SafetyFilter.DENIAL_RESPONSES[category]
+        return False, None
+
+    @staticmethod
+    def check_patient_response(response):
+        medical_terms = [
+            r"心绞痛", r"心肌梗死", r"冠脉",
+            r"心电图", r"CT", r"MRI", r"超声",
+            r"抗生素", r"消炎药", r"降压药"
+        ]
+        for term in medical_terms:
+            if term in response:
+                response = SafetyFilter._replace_medical_term(response, term)
+        if re.search(r"(你是|你得了|可能是).*炎|症|病", response):
+            return False, "我也不太清楚具体是什么病，就是特别难受。"
+        if re.search(r"(你应该|可以|建议).*吃|用|治", response):
+            return False, "我不懂这些，您是医生，您说怎么办就怎么样。"
+        return True, response
+
+    @staticmethod
+    def extract_symptom_keywords(message):
+        symptom_keywords = [
+            r"疼|痛|不适",
+            r"咳|喘|气短",
+            r"吐|泻|恶心",
+            r"晕|乏力",
+            r"发烧|发热",
+        ]
+        found = []
+        for pattern in symptom_keywords:
+            if re.search(pattern, message):
+                found.extend(re.findall(pattern, message))
+        return found
+
+
+STUDENT_TEMPLATES = [
+    "您好，请问您哪里不舒服？",
+    "疼痛是什么性质的，是压榨样的还是针刺样的？",
+    "这种疼痛持续多长时间了？有没有向其他地方放射？",
+    "平时有没有咳嗽、气短或者恶心呕吐？",
+    "您以前有没有高血压、糖尿病或者心脏病？",
+    "请问您抽烟喝酒吗？一天大概多少？",
+    "这个药一次吃几粒？",
+    "我得了什么病，需要做手术吗？",
+    "最近有没有头晕乏力，发烧发热的情况？",
+    "别急，慢慢说，我理解您现在很担心。",
+]
+
+PATIENT_TEMPLATES = [
+    "医生，我胸口疼得厉害，喘不上气。",
+    "就是压着疼，干活的时候更厉害，歇一会儿能好点。",
+    "以前做过心电图，说是有点问题，我也不懂。",
+    "疼了大概三个小时了，还出了一身汗。",
+    "我不抽烟，偶尔喝点酒。",
+]
+
+
+def build_messages(count: int, seed: int = 42):
+    """生成合成消息（学生问题与患者回复成对）"""
+    rng = random.Random(seed)
+    return [
+        (rng.choice(STUDENT_TEMPLATES), rng.choice(PATIENT_TEMPLATES))
+        for _ in range(count)
+    ]
+
+
+def run(impl, messages):
+    """对全部消息执行四项检查，返回结果列表"""
+    results = []
+    for question, reply in messages:
+        results.append((
+            impl.check_student_input(question),
+            impl.should_refuse_answer(question),
+            impl.check_patient_response(reply),
+            impl.extract_symptom_keywords(question),
+        ))
+    return results
+
+
+def bench(impl, messages, repeat: int = 3) -> float:
+    """返回最优一轮的每秒消息数"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(impl, messages)
+        best = min(best, time.perf_counter() - start)
+    return len(messages) / best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    messages = build_messages(count)
+
+    # 结果一致性校验
+    assert run(LegacySafetyFilter, messages[:2000]) == run(SafetyFilter, messages[:2000]), \
+        "新旧实现结果不一致"
+
+    legacy = bench(LegacySafetyFilter, messages)
+    current = bench(SafetyFilter, messages)
+
+    print(f"消息数量: {count}")
+    print(f"优化前 (逐模式 re.search): {legacy:,.0f} 条/秒")
+    print(f"优化后 (单次扫描匹配器):   {current:,.0f} 条/秒")
+    print(f"加速比: {current / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
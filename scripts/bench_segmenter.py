@@ -0,0 +1,79 @@
+"""
+分词微基准 - 医学词典最大匹配分词与关键问题索引的吞吐量
+
+运行方式:
+    python scripts/bench_segmenter.py [文本数量]
+
+分别输出：无缓存分词、带缓存分词（评分时关键问题重复出现的情形）、
+按新病例构建关键问题索引的每秒处理量。
+"""
+
+import json
+import random
+import sys
+import os
+import time
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.case_index import CaseKeywordIndex
+from app.core.segmenter import get_segmenter, segment
+
+SAMPLE_CASES = Path(__file__).parent.parent / "data" / "cases" / "sample_cases.json"
+
+EXTRA_QUESTIONS = [
+    "疼痛的性质和部位", "疼痛是否向左肩放射", "胸闷气短持续多久",
+    "既往高血压糖尿病病史", "有无药物过敏史", "家族中有无心脏病患者",
+    "恶心呕吐与进食的关系", "发热最高体温多少度", "咳嗽咳痰的颜色和量",
+    "近期体重变化和食欲情况", "大便颜色有无黑便", "夜间能否平卧睡眠",
+]
+
+
+def load_questions():
+    questions = list(EXTRA_QUESTIONS)
+    if SAMPLE_CASES.exists():
+        data = json.loads(SAMPLE_CASES.read_text(encoding="utf-8"))
+        for case in data.get("cases", data) if isinstance(data, dict) else data:
+            questions.extend(case.get("key_questions", []))
+    return questions
+
+
+def bench(fn, items, repeat: int = 3) -> float:
+    """返回最优一轮的每秒处理量"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(42)
+    questions = load_questions()
+    segmenter = get_segmenter()
+
+    texts = [rng.choice(questions) for _ in range(count)]
+    # 每个病例5个关键问题
+    cases = [rng.sample(questions, 5) for _ in range(count // 5)]
+
+    print(f"分词器: {type(segmenter).__name__} ({segmenter.version})")
+    print(f"文本数量: {count}")
+    print(f"无缓存分词:   {bench(segmenter.cut, texts):,.0f} 条/秒")
+    print(f"带缓存分词:   {bench(segment, texts):,.0f} 条/秒")
+    print(f"构建病例索引: {bench(CaseKeywordIndex, cases):,.0f} 个/秒")
+    print("\n示例:")
+    for question in questions[:5]:
+        print(f"  {question} -> {' / '.join(segmenter.cut(question))}")
+
+
+if __name__ == "__main__":
+    main()
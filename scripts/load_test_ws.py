@@ -0,0 +1,353 @@
+"""
+WebSocket端到端压测 - 模拟N个学生同时问诊
+
+每个模拟学生：
+1. 使用JWT认证连接 /ws/chat/{session_id}
+2. 发送 start，收到 session_started 后按服务端返回的会话ID重连
+   （start 会创建新的会话ID）
+3. 按脚本依次发送 message（可选流式），每条等待患者回复
+4. 发送 end，等待 session_ended
+
+按帧类型统计 p50/p95/p99 延迟和错误率，压测期间轮询 /health 记录数据库
+连接池占用峰值，最后输出JSON报告，可与上一次的报告对比。
+
+离线压测时可配合 scripts/mock_llm_server.py 使用。
+
+运行方式:
+    python scripts/load_test_ws.py --students 50 [--base-url http://127.0.0.1:8000]
+        [--user-id 1 | --login student:123456 | --token <jwt>] [--case-id case_001]
+        [--ramp-up 5] [--think-time 0.5] [--stream] [--script questions.json]
+        [--output report.json] [--compare previous.json]
+
+--user-id 使用本地 SECRET_KEY 直接签发令牌（需与服务端配置一致）。
+"""
+
+from typing import Dict, Any, List, Optional
+from collections import defaultdict
+from datetime import timedelta
+import argparse
+import asyncio
+import json
+import math
+import sys
+import os
+import time
+import uuid
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+import websockets
+
+# 默认问诊脚本
+DEFAULT_SCRIPT = [
+    "您好，请问您哪里不舒服？",
+    "疼了多久了？",
+    "是什么样的疼？压着疼还是刺痛？",
+    "疼的时候会放射到别的地方吗？",
+    "什么情况下会加重？",
+    "休息以后会好一点吗？",
+    "还有没有出汗、恶心这些情况？",
+    "以前有没有高血压、糖尿病？",
+    "抽烟喝酒吗？",
+    "家里人有没有心脏病？"
+]
+
+# 各请求帧对应的完成帧
+DONE_FRAMES = {
+    "start": {"session_started", "session_resumed"},
+    "message": {"response", "patient_done"},
+    "end": {"session_ended"},
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Metrics:
+    """压测指标收集"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: List[str] = []
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+        self.pool_samples: List[Dict[str, Any]] = []
+
+    def record(self, frame: str, elapsed: float):
+        self.latencies[frame].append(elapsed)
+
+    def error(self, frame: str, detail: str):
+        self.errors[frame] += 1
+        if len(self.error_samples) < 20:
+            self.error_samples.append(f"{frame}: {detail}")
+
+    def summary(self) -> Dict[str, Any]:
+        frames = {}
+        for frame in sorted(set(self.latencies) | set(self.errors)):
+            values = self.latencies.get(frame, [])
+            total = len(values) + self.errors.get(frame, 0)
+            frames[frame] = {
+                "count": len(values),
+                "errors": self.errors.get(frame, 0),
+                "error_rate": round(self.errors.get(frame, 0) / total, 4) if total else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+                "max_ms": round(max(values) * 1000, 1) if values else 0.0
+            }
+        return frames
+
+    def pool_summary(self) -> Dict[str, Any]:
+        """连接池占用峰值"""
+        sized = [s for s in self.pool_samples if "checked_out" in s]
+        if not sized:
+            kind = self.pool_samples[-1].get("pool") if self.pool_samples else None
+            return {"pool": kind, "samples": len(self.pool_samples)}
+
+        capacity = sized[-1]["size"] + sized[-1].get("max_overflow", 0)
+        peak = max(s["checked_out"] for s in sized)
+        return {
+            "pool": sized[-1].get("pool"),
+            "samples": len(sized),
+            "size": sized[-1]["size"],
+            "max_overflow": sized[-1].get("max_overflow", 0),
+            "peak_checked_out": peak,
+            "peak_saturation": round(peak / capacity, 4) if capacity else None,
+            "mean_checked_out": round(sum(s["checked_out"] for s in sized) / len(sized), 2)
+        }
+
+
+async def resolve_token(args) -> str:
+    """获取JWT：直接传入 / 登录 / 本地签发"""
+    if args.token:
+        return args.token
+
+    if args.login:
+        username, _, password = args.login.partition(":")
+        async with httpx.AsyncClient(base_url=args.base_url) as client:
+            response = await client.post(
+                "/api/auth/login", data={"username": username, "password": password}
+            )
+            response.raise_for_status()
+            return response.json()["access_token"]
+
+    from app.utils.auth import create_access_token
+    return create_access_token(
+        {"sub": f"load_test_{args.user_id}", "user_id": args.user_id},
+        expires_delta=timedelta(hours=2)
+    )
+
+
+def ws_url(base_url: str, session_id: str, token: str) -> str:
+    scheme_url = base_url.replace("https://", "wss://").replace("http://", "ws://")
+    return f"{scheme_url.rstrip('/')}/ws/chat/{session_id}?token={token}"
+
+
+async def request(ws, frame: str, payload: Dict[str, Any], metrics: Metrics, timeout: float) -> Dict[str, Any]:
+    """
+    发送一帧并等待对应的完成帧，记录延迟
+
+    流式回复额外记录首段延迟（message_first_delta）。
+
+    Raises:
+        RuntimeError: 服务端返回 error 帧
+    """
+    start = time.perf_counter()
+    await ws.send(json.dumps(payload, ensure_ascii=False))
+    first_delta = True
+
+    while True:
+        raw = await asyncio.wait_for(ws.recv(), timeout)
+        reply = json.loads(raw)
+        kind = reply.get("type")
+
+        if kind == "error":
+            raise RuntimeError(reply.get("message", "error"))
+        if kind == "patient_delta" and first_delta:
+            metrics.record(f"{frame}_first_delta", time.perf_counter() - start)
+            first_delta = False
+        if kind in DONE_FRAMES[frame]:
+            metrics.record(frame, time.perf_counter() - start)
+            return reply
+
+
+async def simulate_student(index: int, args, token: str, script: List[str], metrics: Metrics):
+    """模拟一个学生完成一次完整问诊"""
+    await asyncio.sleep(args.ramp_up * index / max(1, args.students))
+
+    frame = "connect"
+    try:
+        start = time.perf_counter()
+        ws = await websockets.connect(ws_url(args.base_url, f"load-{uuid.uuid4().hex}", token))
+        metrics.record("connect", time.perf_counter() - start)
+
+        try:
+            frame = "start"
+            started = await request(ws, "start", {"type": "start", "case_id": args.case_id}, metrics, args.timeout)
+            session_id = started.get("session_id")
+        finally:
+            await ws.close()
+
+        # 后续消息发送到服务端创建的会话
+        frame = "connect"
+        start = time.perf_counter()
+        ws = await websockets.connect(ws_url(args.base_url, session_id, token))
+        metrics.record("connect", time.perf_counter() - start)
+
+        try:
+            frame = "message"
+            for question in script:
+                await request(
+                    ws, "message",
+                    {"type": "message", "content": question, "stream": args.stream},
+                    metrics, args.timeout
+                )
+                if args.think_time:
+                    await asyncio.sleep(args.think_time)
+
+            frame = "end"
+            await request(ws, "end", {"type": "end", "diagnosis": args.diagnosis}, metrics, args.timeout)
+        finally:
+            await ws.close()
+
+        metrics.sessions_completed += 1
+
+    except Exception as e:
+        metrics.error(frame, repr(e))
+        metrics.sessions_failed += 1
+
+
+async def poll_health(args, metrics: Metrics, stop: asyncio.Event):
+    """压测期间轮询 /health 记录连接池占用"""
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=5) as client:
+        while not stop.is_set():
+            try:
+                response = await client.get("/health")
+                pool = response.json().get("db_pool")
+                if pool:
+                    metrics.pool_samples.append(pool)
+            except Exception:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), args.health_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def compare(report: Dict[str, Any], previous: Dict[str, Any]) -> List[str]:
+    """与上一次报告对比 p95 和错误率"""
+    lines = []
+    for frame, current in report["frames"].items():
+        before = previous.get("frames", {}).get(frame)
+        if not before:
+            continue
+        delta = current["p95_ms"] - before["p95_ms"]
+        lines.append(
+            f"  {frame:<22} p95 {before['p95_ms']:>8.1f} -> {current['p95_ms']:>8.1f} ms "
+            f"({delta:+.1f})  错误率 {before['error_rate']:.2%} -> {current['error_rate']:.2%}"
+        )
+    return lines
+
+
+async def run(args) -> Dict[str, Any]:
+    script = DEFAULT_SCRIPT
+    if args.script:
+        script = json.loads(Path(args.script).read_text(encoding="utf-8"))
+    script = script[:args.turns] if args.turns else script
+
+    token = await resolve_token(args)
+    metrics = Metrics()
+    stop = asyncio.Event()
+    poller = asyncio.create_task(poll_health(args, metrics, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        simulate_student(i, args, token, script, metrics) for i in range(args.students)
+    ])
+    duration = time.perf_counter() - started
+
+    stop.set()
+    await poller
+
+    messages = len(metrics.latencies.get("message", []))
+    return {
+        "config": {
+            "base_url": args.base_url,
+            "students": args.students,
+            "case_id": args.case_id,
+            "turns": len(script),
+            "stream": args.stream,
+            "ramp_up": args.ramp_up,
+            "think_time": args.think_time
+        },
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "duration_s": round(duration, 2),
+        "sessions_completed": metrics.sessions_completed,
+        "sessions_failed": metrics.sessions_failed,
+        "messages_per_second": round(messages / duration, 2) if duration else 0.0,
+        "frames": metrics.summary(),
+        "db_pool": metrics.pool_summary(),
+        "error_samples": metrics.error_samples
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket端到端压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--case-id", default="case_001")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--login", help="用户名:密码，通过 /api/auth/login 获取令牌")
+    parser.add_argument("--token", help="直接使用的JWT")
+    parser.add_argument("--script", help="问题列表JSON文件")
+    parser.add_argument("--turns", type=int, default=0, help="只发送前N个问题，0为全部")
+    parser.add_argument("--diagnosis", default="不稳定性心绞痛")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="所有学生在该时间内陆续开始（秒）")
+    parser.add_argument("--think-time", type=float, default=0.0, help="每条消息之间的等待（秒）")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单帧等待回复超时（秒）")
+    parser.add_argument("--health-interval", type=float, default=0.5)
+    parser.add_argument("--output", default="load_test_report.json")
+    parser.add_argument("--compare", help="上一次的报告，用于对比")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print("\n" + "=" * 70)
+    print(f"学生数 {args.students}  完成 {report['sessions_completed']}  失败 {report['sessions_failed']}  "
+          f"耗时 {report['duration_s']}s  消息吞吐 {report['messages_per_second']}/s")
+    print("-" * 70)
+    for frame, stats in report["frames"].items():
+        print(f"  {frame:<22} n={stats['count']:<6} p50={stats['p50_ms']:>8.1f}ms "
+              f"p95={stats['p95_ms']:>8.1f}ms p99={stats['p99_ms']:>8.1f}ms 错误率={stats['error_rate']:.2%}")
+    print(f"  连接池: {report['db_pool']}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        print("-" * 70)
+        print(f"对比 {args.compare}:")
+        for line in compare(report, previous):
+            print(line)
+
+    print("=" * 70)
+    print(f"[OK] 报告已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+数据库迁移脚本 - 评分记录保存百川评估原始分数
+
+评分规则变更后批量重算（scripts/rescore_sessions.py）复用该列，无需再次调用大模型。
+
+运行方式:
+    python scripts/migrate_add_llm_scores.py
+"""
+
+import sys
+import os
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+
+
+def migrate():
+    """执行迁移"""
+    engine = create_engine(settings.DATABASE_URL_SYNC)
+
+    with engine.connect() as conn:
+        with conn.begin():
+            print("为 session_scores 添加 llm_scores 列...")
+            conn.execute(text("ALTER TABLE session_scores ADD COLUMN IF NOT EXISTS llm_scores JSON;"))
+            print("[OK] llm_scores 列添加完成")
+
+    print("\n" + "=" * 50)
+    print("[OK] 迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,58 @@
+"""
+数据库迁移脚本 - 添加评分结果缓存表
+
+运行方式:
+    python scripts/migrate_add_scoring_cache.py
+"""
+
+import sys
+import os
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+
+
+def migrate():
+    """执行迁移"""
+    engine = create_engine(settings.DATABASE_URL_SYNC)
+
+    with engine.connect() as conn:
+        with conn.begin():
+            print("创建评分结果缓存表...")
+
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS scoring_result_cache (
+                    id SERIAL PRIMARY KEY,
+                    cache_key VARCHAR(64) NOT NULL UNIQUE,
+                    result JSON NOT NULL,
+                    hits INTEGER DEFAULT 0,
+
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    last_hit_at TIMESTAMP WITH TIME ZONE
+                );
+            """))
+
+            print("[OK] 评分结果缓存表创建完成")
+
+    print("\n" + "=" * 50)
+    print("[OK] 迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,77 @@
+"""
+数据库迁移脚本 - 添加异步评分任务表
+
+运行方式:
+    python scripts/migrate_add_scoring_jobs.py
+"""
+
+import sys
+import os
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+
+
+def migrate():
+    """执行迁移"""
+    engine = create_engine(settings.DATABASE_URL_SYNC)
+
+    with engine.connect() as conn:
+        with conn.begin():
+            print("创建评分任务表...")
+
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS scoring_jobs (
+                    id SERIAL PRIMARY KEY,
+                    job_id VARCHAR(64) NOT NULL UNIQUE,
+                    session_id INTEGER NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+                    user_id INTEGER NOT NULL REFERENCES users(id),
+
+                    student_diagnosis TEXT,
+                    reasoning TEXT,
+
+                    status VARCHAR(20) DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    locked_until TIMESTAMP WITH TIME ZONE,
+
+                    session_score_id INTEGER REFERENCES session_scores(id),
+                    error TEXT,
+
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    started_at TIMESTAMP WITH TIME ZONE,
+                    finished_at TIMESTAMP WITH TIME ZONE
+                );
+            """))
+
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_scoring_jobs_session_id ON scoring_jobs(session_id);"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_scoring_jobs_status ON scoring_jobs(status);"))
+            # 每个会话最多一个未失败的任务
+            conn.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_scoring_jobs_active_session
+                ON scoring_jobs(session_id) WHERE status <> 'failed';
+            """))
+
+            print("[OK] 评分任务表创建完成")
+
+    print("\n" + "=" * 50)
+    print("[OK] 迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,46 @@
+"""
+数据库迁移脚本 - 会话保存增量评分状态快照
+
+运行方式:
+    python scripts/migrate_add_scoring_state.py
+"""
+
+import sys
+import os
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+
+
+def migrate():
+    """执行迁移"""
+    engine = create_engine(settings.DATABASE_URL_SYNC)
+
+    with engine.connect() as conn:
+        with conn.begin():
+            print("为 chat_sessions 添加 scoring_state 列...")
+            conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS scoring_state JSON;"))
+            print("[OK] scoring_state 列添加完成")
+
+    print("\n" + "=" * 50)
+    print("[OK] 迁移完成！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"\n[ERROR] 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
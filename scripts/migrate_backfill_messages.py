@@ -0,0 +1,131 @@
+"""
+数据库迁移脚本 - 将 chat_sessions.conversation_history 回填到 messages 表
+
+对话历史改为以 messages 表为唯一数据源后，旧会话中只存在于 JSON 列的
+消息需要补写为 Message 记录。已有 Message 记录的会话视为已迁移（旧版本
+两处同时写入，messages 表的数据更完整），不会重复插入。
+
+运行方式:
+    python scripts/migrate_backfill_messages.py [--dry-run] [--clear-json] [--batch-size 500]
+
+    --dry-run     只统计，不写入
+    --clear-json  回填后清空 conversation_history 列，释放存储
+"""
+
+import argparse
+import sys
+import os
+from datetime import datetime
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, select, exists, update, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.database import ChatSession, Message
+
+
+def _parse_timestamp(value):
+    """解析JSON历史中的ISO时间戳"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill(batch_size: int = 500, dry_run: bool = False, clear_json: bool = False):
+    """执行回填"""
+    engine = create_engine(settings.DATABASE_URL_SYNC)
+
+    # 窗口读取所需的组合索引
+    if not dry_run:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_messages_session_id_id ON messages(session_id, id)"
+            ))
+        print("[OK] 索引 idx_messages_session_id_id 已就绪")
+
+    sessions_done = 0
+    messages_done = 0
+    last_id = 0
+
+    with Session(engine) as db:
+        while True:
+            # 按主键分批，只处理JSON中有历史但没有任何Message记录的会话
+            rows = db.execute(
+                select(ChatSession.id, ChatSession.conversation_history, ChatSession.started_at)
+                .where(ChatSession.id > last_id)
+                .where(~exists().where(Message.session_id == ChatSession.id))
+                .order_by(ChatSession.id)
+                .limit(batch_size)
+            ).all()
+
+            if not rows:
+                break
+
+            for session_pk, history, started_at in rows:
+                last_id = session_pk
+                if not history:
+                    continue
+
+                for entry in history:
+                    db.add(Message(
+                        session_id=session_pk,
+                        role=entry.get("role", "system"),
+                        content=entry.get("content", ""),
+                        meta_data=entry.get("metadata") or {},
+                        timestamp=_parse_timestamp(entry.get("timestamp")) or started_at
+                    ))
+                sessions_done += 1
+                messages_done += len(history)
+
+            if dry_run:
+                db.rollback()
+            else:
+                db.commit()
+            print(f"  已处理至会话 id={last_id}，累计回填 {sessions_done} 个会话 / {messages_done} 条消息")
+
+        if clear_json and not dry_run:
+            # 只清空已有Message记录的会话
+            result = db.execute(
+                update(ChatSession)
+                .where(exists().where(Message.session_id == ChatSession.id))
+                .values(conversation_history=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            print(f"[OK] 已清空 {result.rowcount} 个会话的 conversation_history 列")
+
+    print("\n" + "=" * 50)
+    prefix = "[DRY RUN] 将回填" if dry_run else "[OK] 回填完成："
+    print(f"{prefix} {sessions_done} 个会话，{messages_done} 条消息")
+    print("=" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回填 messages 表")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--clear-json", action="store_true")
+    args = parser.parse_args()
+
+    backfill(batch_size=args.batch_size, dry_run=args.dry_run, clear_json=args.clear_json)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"\n[ERROR] 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,319 @@
+"""
+本地模拟大模型服务 - OpenAI 兼容的 chat/completions 接口
+
+用于压测和离线开发：LLMService（智谱）和 BaichuanService（百川）都可以通过
+base URL 指向本服务，整条请求链路无需联网即可运行和压测。
+
+- 可配置的延迟分布（fixed / uniform / normal / lognormal）
+- 流式输出按 tokens-per-second 逐段下发（SSE）
+- 按比例注入错误（HTTP状态码）
+- 根据系统提示词中的患者设定生成与病例相符的回复
+- json_mode 请求（百川评分 evaluate_student_performance）返回确定性的评分JSON
+
+运行方式:
+    python scripts/mock_llm_server.py [--port 9000] [--latency-ms 800] [--latency-jitter-ms 300]
+        [--latency-dist lognormal] [--tokens-per-second 40] [--error-rate 0.02]
+        [--error-status 429,500,503] [--seed 42]
+
+然后在 .env 中设置:
+    ZHIPU_BASE_URL=http://127.0.0.1:9000/v1
+    BAICHUAN_BASE_URL=http://127.0.0.1:9000/v1
+    BAICHUAN_API_KEY=mock
+"""
+
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import sys
+import os
+import time
+import uuid
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.core.context_window import estimate_tokens
+
+
+@dataclass
+class MockConfig:
+    """模拟服务配置"""
+    latency_ms: float = 800.0
+    latency_jitter_ms: float = 300.0
+    # fixed / uniform / normal / lognormal
+    latency_dist: str = "lognormal"
+    tokens_per_second: float = 40.0
+    error_rate: float = 0.0
+    error_status: List[int] = field(default_factory=lambda: [429, 500, 503])
+    seed: Optional[int] = None
+
+
+# 患者设定字段（与 PromptManager.PERSONA_TEMPLATE 一致）
+_PERSONA_FIELDS = {
+    "chief_complaint": "主诉",
+    "location": "部位",
+    "nature": "性质",
+    "duration": "持续时间",
+    "aggravating": "诱发因素",
+    "relieving": "缓解因素",
+    "associated": "伴随症状",
+}
+
+# 问题关键词 -> 回答模板
+_REPLY_RULES = [
+    (("哪里", "部位", "什么地方", "哪儿"), "location", "就是{location}这儿难受，{nature}。"),
+    (("什么样", "性质", "怎么疼", "感觉"), "nature", "是{nature}，{location}这一块。"),
+    (("多久", "多长时间", "什么时候", "持续"), "duration", "{chief_complaint}，每次{duration}。"),
+    (("加重", "诱发", "厉害"), "aggravating", "{aggravating}的时候会更难受。"),
+    (("缓解", "好点", "减轻"), "relieving", "{relieving}以后会好一些。"),
+    (("还有", "其他", "别的", "伴随", "出汗", "恶心"), "associated", "还有点{associated}。"),
+]
+
+
+def parse_persona(system_prompt: str) -> Dict[str, str]:
+    """从系统提示词中解析患者设定"""
+    persona = {}
+    for key, label in _PERSONA_FIELDS.items():
+        match = re.search(rf"{label}：(.+)", system_prompt)
+        value = match.group(1).strip() if match else ""
+        persona[key] = "" if value in ("", "无", "None") else value
+    return persona
+
+
+def patient_reply(messages: List[Dict[str, str]]) -> str:
+    """
+    生成与病例设定相符的患者回复（同一输入结果确定）
+
+    Args:
+        messages: 请求中的消息列表
+
+    Returns:
+        患者回复
+    """
+    system_prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    persona = parse_persona(system_prompt)
+
+    for keywords, required, template in _REPLY_RULES:
+        if any(k in question for k in keywords) and persona.get(required):
+            values = {k: v or "说不太清" for k, v in persona.items()}
+            return template.format(**values)
+
+    if persona.get("chief_complaint"):
+        return f"医生，我{persona['chief_complaint']}，特别难受。"
+    return "医生，我不太舒服，说不清楚。"
+
+
+def evaluation_json(messages: List[Dict[str, str]]) -> str:
+    """
+    生成确定性的评分结果（格式与 BaichuanService.evaluate_student_performance 一致）
+
+    分数由对话轮数和诊断是否与标准诊断一致决定，同一输入结果相同。
+    """
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    doctor_turns = len(re.findall(r"^\d+\. 医生:", prompt, flags=re.MULTILINE))
+
+    standard = re.search(r"标准诊断: (.*)", prompt)
+    diagnosis = re.search(r"【学生给出的诊断】\s*\n(.*)", prompt)
+    standard = standard.group(1).strip() if standard else ""
+    diagnosis = diagnosis.group(1).strip() if diagnosis else ""
+    correct = bool(standard) and (standard in diagnosis or diagnosis in standard) and bool(diagnosis)
+
+    scores = {
+        "inquiry_logic": min(25, 10 + doctor_turns),
+        "info_collection": min(25, 8 + doctor_turns * 2),
+        "diagnosis_reasoning": 22 if correct else 10,
+        "communication": 18
+    }
+    return json.dumps({
+        "scores": scores,
+        "comments": {
+            "inquiry_logic": f"共问诊{doctor_turns}轮。",
+            "info_collection": "关键信息采集基本完整。" if doctor_turns >= 5 else "关键症状询问不足。",
+            "diagnosis_reasoning": "诊断正确。" if correct else "诊断与标准诊断不一致。",
+            "communication": "语言通俗，态度亲切。"
+        },
+        "suggestions": ["系统询问既往史", "注意鉴别诊断", "问诊结束前进行总结"],
+        "overall_comment": f"模拟评分：总分{sum(scores.values())}分。"
+    }, ensure_ascii=False)
+
+
+class MockLLM:
+    """模拟服务状态（随机数、统计）"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.requests = 0
+        self.errors = 0
+        self.streams = 0
+
+    def latency(self) -> float:
+        """按配置的分布采样首段延迟（秒）"""
+        mean = self.config.latency_ms / 1000.0
+        jitter = self.config.latency_jitter_ms / 1000.0
+        dist = self.config.latency_dist
+        if dist == "fixed" or mean <= 0:
+            value = mean
+        elif dist == "uniform":
+            value = self.rng.uniform(mean - jitter, mean + jitter)
+        elif dist == "normal":
+            value = self.rng.gauss(mean, jitter)
+        else:
+            # 对数正态：均值为 mean，长尾更接近真实服务
+            sigma = (jitter / mean) if mean else 0.0
+            value = mean * self.rng.lognormvariate(-sigma * sigma / 2, sigma)
+        return max(0.0, value)
+
+    def injected_error(self) -> Optional[int]:
+        """按错误率返回要注入的状态码"""
+        if self.config.error_rate > 0 and self.rng.random() < self.config.error_rate:
+            return self.rng.choice(self.config.error_status)
+        return None
+
+
+def _usage(messages: List[Dict[str, str]], content: str) -> Dict[str, int]:
+    prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+    completion_tokens = estimate_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+def _chunks(text: str, size: int = 2) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    """创建模拟服务应用"""
+    mock = MockLLM(config or MockConfig())
+    app = FastAPI(title="Mock LLM")
+    app.state.mock = mock
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        model = body.get("model", "mock")
+        mock.requests += 1
+
+        await asyncio.sleep(mock.latency())
+
+        status = mock.injected_error()
+        if status is not None:
+            mock.errors += 1
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"message": f"mock injected error {status}", "type": "mock_error"}}
+            )
+
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        content = evaluation_json(messages) if json_mode else patient_reply(messages)
+
+        completion_id = "chatcmpl-" + hashlib.sha1(
+            json.dumps(messages, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:24]
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": _usage(messages, content)
+            }
+
+        mock.streams += 1
+        delay = 1.0 / mock.config.tokens_per_second if mock.config.tokens_per_second > 0 else 0.0
+
+        async def events():
+            for i, piece in enumerate(_chunks(content)):
+                if i and delay:
+                    await asyncio.sleep(delay * estimate_tokens(piece))
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            done = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # 兼容 base URL 带或不带版本前缀（/v1、/v4）
+    for path in ("/chat/completions", "/v1/chat/completions", "/v4/chat/completions"):
+        app.add_api_route(path, chat_completions, methods=["POST"])
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "requests": mock.requests,
+            "errors": mock.errors,
+            "streams": mock.streams,
+            "config": mock.config.__dict__
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=300.0)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"], default="lognormal")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", default="429,500,503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        latency_dist=args.latency_dist,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=[int(s) for s in args.error_status.split(",") if s.strip()],
+        seed=args.seed
+    )
+
+    import uvicorn
+
+    print(f"模拟大模型服务: http://{args.host}:{args.port}/v1  配置: {config}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
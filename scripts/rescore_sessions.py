@@ -0,0 +1,55 @@
+"""
+评分规则变更后批量重算历史会话评分
+
+复用评分记录中保存的百川评估分数，不调用大模型。
+
+运行方式:
+    python scripts/rescore_sessions.py [--rule-id 3] [--chunk-size 500] [--dry-run]
+
+不指定 --rule-id 时使用当前启用的评分规则。
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import os
+from pathlib import Path
+
+# 设置控制台编码
+if sys.platform == "win32":
+    os.system("chcp 65001 > nul")
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.session import AsyncSessionLocal
+from app.models.database import ScoringRule
+from app.services.batch_rescoring import rescore_sessions
+from app.services.scoring_service import ScoringService
+
+
+async def main(rule_id, chunk_size, dry_run):
+    async with AsyncSessionLocal() as db:
+        if rule_id is not None:
+            rule = await db.get(ScoringRule, rule_id)
+        else:
+            rule = await ScoringService(db).get_active_scoring_rule()
+
+    if rule is None:
+        print("[ERROR] 未找到评分规则")
+        return 1
+
+    print(f"按评分规则重算: {rule.id} {rule.name}{'（试算）' if dry_run else ''}")
+    stats = await rescore_sessions(rule, chunk_size=chunk_size, dry_run=dry_run)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量重算历史会话评分")
+    parser.add_argument("--rule-id", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="只输出统计，不写回数据库")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.rule_id, args.chunk_size, args.dry_run)))
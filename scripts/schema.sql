@@ -107,6 +107,7 @@ CREATE INDEX IF NOT EXISTS idx_sessions_status ON chat_sessions(status);
 CREATE INDEX IF NOT EXISTS idx_sessions_started_at ON chat_sessions(started_at);
 
 CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id);
+CREATE INDEX IF NOT EXISTS idx_messages_session_id_id ON messages(session_id, id);
 CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
 
 -- 插入示例用户
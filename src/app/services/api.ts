@@ -115,6 +115,15 @@ export interface SessionScoreResponse {
   }>;
 }
 
+export interface ScoreJobResponse {
+  job_id: string;
+  session_id: string;
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  attempts?: number;
+  error?: string | null;
+  result?: SessionScoreResponse | null;
+}
+
 // 认证接口
 export const authAPI = {
   login: async (username: string, password: string) => {
@@ -293,17 +302,38 @@ export class AISPApiClient {
     return response.data;
   }
 
-  // 结束会话并提交诊断
+  // 结束会话并提交诊断（后台评分，轮询任务直到完成）
   async endSession(
     sessionId: string,
     diagnosis: string,
-    reasoning?: string
+    reasoning?: string,
+    pollIntervalMs: number = 1500,
+    timeoutMs: number = 180000
   ): Promise<SessionScoreResponse> {
     const response = await this.client.post('/api/chat/end', {
       session_id: sessionId,
       diagnosis: diagnosis,
       reasoning: reasoning
     });
+    const jobId: string = response.data.job_id;
+
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+      const job = await this.getScoreJob(jobId);
+      if (job.status === 'completed' && job.result) {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || '评分失败');
+      }
+      await new Promise((resolve) => setTimeout(resolve, pollIntervalMs));
+    }
+    throw new Error('评分超时');
+  }
+
+  // 查询评分任务
+  async getScoreJob(jobId: string): Promise<ScoreJobResponse> {
+    const response = await this.client.get(`/api/chat/score-jobs/${jobId}`);
     return response.data;
   }
 
@@ -2,9 +2,11 @@
 import { useAuthStore } from '../stores/authStore';
 
 export type WebSocketMessage = {
-  type: 'start' | 'message' | 'end' | 'response' | 'thinking' | 'error' | 'session_started' | 'session_ended';
+  type: 'start' | 'message' | 'end' | 'response' | 'thinking' | 'error' | 'session_started' | 'session_ended' | 'patient_delta' | 'patient_done' | 'score_ready';
   case_id?: string;
   content?: string;
+  stream?: boolean;
+  delta?: string;
   diagnosis?: string;
   message?: string;
   session_id?: string;
@@ -12,6 +14,10 @@ export type WebSocketMessage = {
   turn_count?: number;
   case_info?: any;
   feedback?: any;
+  job_id?: string;
+  status?: string;
+  result?: any;
+  error?: string;
 };
 
 export type MessageHandler = (message: WebSocketMessage) => void;
@@ -92,7 +98,7 @@ export class ChatWebSocketClient {
     }
   }
 
-  send(message: Omit<WebSocketMessage, 'session_id' | 'message' | 'metadata' | 'turn_count' | 'case_info' | 'feedback'>) {
+  send(message: Omit<WebSocketMessage, 'session_id' | 'message' | 'metadata' | 'turn_count' | 'case_info' | 'feedback' | 'delta'>) {
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
       this.ws.send(JSON.stringify(message));
     } else {
@@ -107,10 +113,11 @@ export class ChatWebSocketClient {
     });
   }
 
-  sendMessage(content: string) {
+  sendMessage(content: string, stream = false) {
     this.send({
       type: 'message',
       content: content,
+      stream: stream,
     });
   }
 
@@ -0,0 +1,36 @@
+"""测试公共夹具"""
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+import app.models.database  # noqa: F401  注册所有模型
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    """基于内存SQLite的异步会话工厂（每个测试独立建表，同一测试内共享数据）"""
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        # 所有连接共用同一个内存数据库
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    yield sessionmaker(
+        engine,
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
+
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def db_session(session_factory):
+    """基于内存SQLite的异步数据库会话"""
+    async with session_factory() as session:
+        yield session
@@ -0,0 +1,11 @@
+"""
+应用导入冒烟测试（所有路由模块都能导入、注册）
+"""
+
+
+def test_app_imports():
+    from app.main import app
+
+    paths = {route.path for route in app.routes}
+    assert "/api/chat/end" in paths
+    assert any(path.startswith("/ws") for path in paths)
@@ -0,0 +1,164 @@
+"""
+批量重算评分测试
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.core.scoring_engine import ScoringEngine
+from app.models.database import (
+    User, Case, ChatSession, Message, SessionScore, ScoringRule, SessionStatus
+)
+from app.services.batch_rescoring import (
+    compute_scores, stored_llm_scores, rescore_sessions, LLM_SCORE_KEYS, _FEATURE_KEYS, _to_arrays
+)
+
+
+CASE_DATA = {
+    "standard_diagnosis": "急性心肌梗死",
+    "differential_diagnosis": ["心绞痛", "主动脉夹层"],
+    "key_questions": ["疼痛 部位", "持续 时间", "既往 病史"],
+}
+
+HISTORIES = [
+    [],
+    [{"role": "student", "content": "您好，请问您哪里疼痛？"}],
+    [
+        {"role": "student", "content": "您好，请问您哪里疼痛？"},
+        {"role": "patient", "content": "胸口疼。"},
+        {"role": "student", "content": "持续多长时间了？我理解您很担心"},
+        {"role": "student", "content": "持续多长时间了？我理解您很担心"},
+        {"role": "student", "content": "还有其他不舒服吗，是否与心绞痛有关"},
+    ],
+    [{"role": "student", "content": f"第{i}个问题，麻烦说一下疼痛部位"} for i in range(12)],
+]
+
+DIAGNOSES = ["", "急性心肌梗死", "心肌 梗死 急性 发作", "胃炎"]
+
+LLM_SCORES = [
+    {},
+    {"inquiry_logic": 20, "diagnosis_reasoning": 20, "communication": 22},
+    {"communication": 30},
+    {"diagnosis_reasoning": 15},
+]
+
+RULE = SimpleNamespace(
+    id=7,
+    inquiry_weight=0.5, diagnosis_weight=0.3, communication_weight=0.2,
+    key_question_score=30, symptom_detail_score=30, logic_score=25, etiquette_score=15,
+    diagnosis_correct_score=30, diagnosis_partial_score=20, diagnosis_wrong_score=5,
+    min_turns_for_full_score=8, min_turns_for_pass_score=3
+)
+
+
+@pytest.mark.parametrize("engine", [ScoringEngine(), ScoringEngine.from_rule(RULE)])
+def test_vectorized_matches_engine(engine):
+    cases = [
+        (history, diagnosis, llm)
+        for history in HISTORIES
+        for diagnosis in DIAGNOSES
+        for llm in LLM_SCORES
+    ]
+    features = [engine.rule_features(h, d, CASE_DATA) for h, d, _ in cases]
+    llm = [{key: float(l.get(key, 0)) for key in LLM_SCORE_KEYS} for _, _, l in cases]
+
+    scores = compute_scores(
+        _to_arrays(features, _FEATURE_KEYS), _to_arrays(llm, LLM_SCORE_KEYS),
+        engine.weights, engine.standards
+    )
+
+    for i, (history, diagnosis, llm_scores) in enumerate(cases):
+        expected = engine._build_result(
+            *engine._score_rules(history, diagnosis, CASE_DATA),
+            llm_result={"scores": llm_scores}, case_data=CASE_DATA
+        )
+        assert scores["inquiry_total_score"][i] == pytest.approx(expected.inquiry_total_score)
+        assert scores["diagnosis_total_score"][i] == pytest.approx(expected.diagnosis_total_score)
+        assert scores["communication_total_score"][i] == pytest.approx(expected.communication_total_score)
+        assert scores["final_score"][i] == pytest.approx(expected.final_score)
+        assert scores["grade"][i] == expected.grade
+        assert bool(scores["passed"][i]) == expected.passed
+        assert features[i]["covered"] == expected.covered_questions
+
+
+def test_stored_llm_scores():
+    assert stored_llm_scores({"communication": 20}, None, 10, 4, 18) == {
+        "inquiry_logic": 0.0, "diagnosis_reasoning": 0.0, "communication": 20.0
+    }
+    # 早期记录：评语来自百川时由融合分项反推
+    legacy = stored_llm_scores(None, "整体良好\n\n详细评价：\n沟通: 好", 16, 8, 22)
+    assert legacy == pytest.approx({"inquiry_logic": 20, "diagnosis_reasoning": 20, "communication": 22})
+    # 纯规则评分
+    assert stored_llm_scores(None, "表现合格。", 16, 8, 22) == {key: 0.0 for key in LLM_SCORE_KEYS}
+
+
+@pytest.mark.asyncio
+async def test_rescore_sessions_updates_scores(session_factory):
+    history = HISTORIES[2]
+    llm_scores = {"inquiry_logic": 20, "diagnosis_reasoning": 20, "communication": 22}
+
+    async with session_factory() as db:
+        user = User(username="student_rescore", role="STUDENT")
+        case = Case(
+            case_id="case_rescore", title="胸痛待查", patient_info={}, chief_complaint={},
+            symptoms={}, **CASE_DATA
+        )
+        rule = ScoringRule(name="新规则", **{
+            k: v for k, v in vars(RULE).items() if k != "id"
+        })
+        db.add_all([user, case, rule])
+        await db.flush()
+
+        completed = ChatSession(
+            session_id="s_done", user_id=user.id, case_id=case.id,
+            status=SessionStatus.COMPLETED, student_diagnosis="急性心肌梗死"
+        )
+        active = ChatSession(
+            session_id="s_active", user_id=user.id, case_id=case.id, status=SessionStatus.ACTIVE
+        )
+        db.add_all([completed, active])
+        await db.flush()
+        db.add_all(Message(session_id=completed.id, **m) for m in history)
+
+        old = ScoringEngine()._build_result(
+            *ScoringEngine()._score_rules(history, "急性心肌梗死", CASE_DATA),
+            llm_result={"scores": llm_scores}, case_data=CASE_DATA
+        )
+        db.add_all([
+            SessionScore(
+                session_id=completed.id, final_score=old.final_score, grade=old.grade,
+                passed=old.passed, llm_scores=llm_scores, ai_comments="原评语"
+            ),
+            SessionScore(session_id=active.id, final_score=50, grade="F")
+        ])
+        await db.commit()
+        rule_id = rule.id
+
+    async with session_factory() as db:
+        rule = await db.get(ScoringRule, rule_id)
+    stats = await rescore_sessions(rule, session_factory=session_factory, chunk_size=1)
+
+    engine = ScoringEngine.from_rule(RULE)
+    expected = engine._build_result(
+        *engine._score_rules(history, "急性心肌梗死", CASE_DATA),
+        llm_result={"scores": llm_scores}, case_data=CASE_DATA
+    )
+    assert stats["scored"] == 1
+    assert stats["before_avg"] == pytest.approx(old.final_score)
+    assert stats["after_avg"] == pytest.approx(expected.final_score)
+
+    async with session_factory() as db:
+        scores = {s.session_id: s for s in (await db.execute(
+            SessionScore.__table__.select()
+        )).all()}
+        done = await db.get(ChatSession, completed.id)
+
+    rescored = scores[completed.id]
+    assert float(rescored.final_score) == pytest.approx(expected.final_score)
+    assert rescored.grade == expected.grade
+    assert rescored.scoring_rule_id == rule_id
+    assert rescored.ai_comments == "原评语"
+    assert done.total_score == pytest.approx(expected.final_score)
+    # 未完成的会话不重算
+    assert float(scores[active.id].final_score) == 50
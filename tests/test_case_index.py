@@ -0,0 +1,46 @@
+"""
+病例关键问题索引测试
+"""
+import random
+
+from app.core.case_index import CaseKeywordIndex, extract_keywords, get_case_index
+
+
+def naive_match(questions, key_questions):
+    """逐一子串查找的原始实现"""
+    covered, missed = [], []
+    for question in key_questions:
+        keywords = extract_keywords(question)
+        if any(kw.lower() in q.lower() for q in questions for kw in keywords):
+            covered.append(question)
+        else:
+            missed.append(question)
+    return covered, missed
+
+
+def test_extract_keywords():
+    assert extract_keywords("疼痛 的 部位？") == ["疼痛", "部位"]
+    assert extract_keywords("Pain 和 x") == ["Pain"]
+
+
+def test_matches_naive_implementation():
+    rng = random.Random(0)
+    vocab = ["疼痛", "部位", "持续", "时间", "既往", "病史", "Chest", "pain", "加重", "缓解", "的", "x"]
+    for _ in range(200):
+        key_questions = [
+            " ".join(rng.sample(vocab, rng.randint(1, 3))) + rng.choice(["", "？"])
+            for _ in range(rng.randint(0, 6))
+        ]
+        questions = ["".join(rng.sample(vocab, rng.randint(0, 4))).upper() for _ in range(rng.randint(0, 5))]
+        assert CaseKeywordIndex(key_questions).match(questions) == naive_match(questions, key_questions)
+
+
+def test_keywords_do_not_span_questions():
+    index = CaseKeywordIndex(["疼痛"])
+    assert index.match(["哪里疼", "痛吗"]) == ([], ["疼痛"])
+
+
+def test_index_cached_by_key_questions():
+    first = get_case_index(["疼痛 部位", "既往 病史"])
+    assert get_case_index(["疼痛 部位", "既往 病史"]) is first
+    assert get_case_index(["疼痛 部位"]) is not first
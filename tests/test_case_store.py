@@ -0,0 +1,70 @@
+"""病例缓存测试"""
+import pytest
+
+from app.models.database import Case
+from app.services.case_store import CaseStore
+
+
+async def _add_case(db, case_id="case_001", title="胸痛待查"):
+    case = Case(
+        case_id=case_id,
+        title=title,
+        patient_info={"age": 58},
+        chief_complaint={"text": "胸痛3小时"},
+        symptoms={"location": "胸骨后"},
+        standard_diagnosis="不稳定性心绞痛",
+        key_questions=["疼痛的性质和部位"]
+    )
+    db.add(case)
+    await db.commit()
+    return case
+
+
+class TestCaseStore:
+    """病例缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_db(self, db_session):
+        """测试命中缓存后不再查询数据库"""
+        await _add_case(db_session)
+        store = CaseStore(ttl_seconds=60)
+
+        first = await store.get_case(db_session, "case_001")
+        assert first["title"] == "胸痛待查"
+        assert first["patient_info"] == {"age": 58}
+
+        class NoQuery:
+            async def execute(self, *args, **kwargs):
+                raise AssertionError("缓存命中时不应访问数据库")
+
+        second = await store.get_case(NoQuery(), "case_001")
+        assert second is first
+
+    @pytest.mark.asyncio
+    async def test_missing_case_not_cached(self, db_session):
+        """测试不存在的病例不缓存"""
+        store = CaseStore(ttl_seconds=60)
+        assert await store.get_case(db_session, "case_404") is None
+
+        await _add_case(db_session, case_id="case_404")
+        assert (await store.get_case(db_session, "case_404"))["case_id"] == "case_404"
+
+    @pytest.mark.asyncio
+    async def test_invalidate_and_ttl(self, db_session):
+        """测试失效与过期"""
+        case = await _add_case(db_session)
+        store = CaseStore(ttl_seconds=60)
+        await store.get_case(db_session, "case_001")
+
+        case.title = "胸痛待查（修订）"
+        await db_session.commit()
+        assert (await store.get_case(db_session, "case_001"))["title"] == "胸痛待查"
+
+        store.invalidate("case_001")
+        assert (await store.get_case(db_session, "case_001"))["title"] == "胸痛待查（修订）"
+
+        expired = CaseStore(ttl_seconds=0)
+        await expired.get_case(db_session, "case_001")
+        case.title = "胸痛"
+        await db_session.commit()
+        assert (await expired.get_case(db_session, "case_001"))["title"] == "胸痛"
@@ -84,6 +84,87 @@ class TestSafetyFilter:
         assert is_safe is False
         assert danger_type == "suicide"
 
+    def test_refuse_regex_pattern(self):
+        """测试正则类拒答模式"""
+        should_refuse, response = SafetyFilter.should_refuse_answer("这个药一次吃两粒吗？")
+
+        assert should_refuse is True
+        assert response == SafetyFilter.DENIAL_RESPONSES["dosage"]
+
+    def test_forbidden_categories_single_scan(self):
+        """测试一次扫描返回所有命中类别"""
+        hits = SafetyFilter._forbidden_matcher.categories_in("我得了什么病，需要做手术吗，用多少量")
+
+        assert hits == {"dosage", "diagnosis", "treatment"}
+
+    def test_extract_symptom_keywords(self):
+        """测试症状关键词提取顺序"""
+        keywords = SafetyFilter.extract_symptom_keywords("头晕，胸口痛，有点咳，疼得厉害")
+
+        assert keywords == ["痛", "疼", "咳", "晕"]
+
+    def test_pattern_set_overlapping_categories(self):
+        """测试重叠命中的不同类别都能识别"""
+        from app.core.pattern_matcher import PatternSet
+
+        matcher = PatternSet(SafetyFilter.DANGER_SIGNALS)
+        assert matcher.categories_in("自杀死") == {"suicide", "violence"}
+        assert matcher.first_category("自杀死") == "suicide"
+        assert matcher.categories_in("今天天气不错") == set()
+
+class TestStreamingResponseFilter:
+    """增量回复过滤器测试"""
+
+    @staticmethod
+    def _run(chunks):
+        from app.core.safety_filter import StreamingResponseFilter
+
+        stream_filter = StreamingResponseFilter()
+        emitted = []
+        for chunk in chunks:
+            emitted.append(stream_filter.feed(chunk))
+            if stream_filter.aborted:
+                break
+        emitted.append(stream_filter.finish())
+        return stream_filter, emitted
+
+    def test_hold_back_partial_term(self):
+        """测试只扣留可能组成术语的尾部"""
+        stream_filter, emitted = self._run(["之前做过C", "T，还拍了MR", "I。"])
+
+        assert emitted == ["之前做过", "拍片子，还拍了", "拍片子。", ""]
+        assert stream_filter.text == "之前做过拍片子，还拍了拍片子。"
+
+    def test_matches_full_check(self):
+        """测试逐字流式结果与整段校验一致"""
+        replies = [
+            "我胸口疼得厉害，做过心电图，喘不上气。",
+            "就是压着疼，干活的时候更厉害，歇一会儿能好点。",
+            "以前拍过CT和MRI，别的不记得了。",
+            "我也说不清，就是难受。"
+        ]
+        for reply in replies:
+            stream_filter, emitted = self._run(list(reply))
+            is_valid, expected = SafetyFilter.check_patient_response(reply)
+
+            assert not stream_filter.aborted
+            assert "".join(emitted) == expected == stream_filter.text
+
+    def test_abort_on_diagnosis(self):
+        """测试出现诊断表述时中止"""
+        stream_filter, emitted = self._run(["我这是", "不是心绞", "痛啊", "，好难受"])
+
+        assert stream_filter.aborted is True
+        assert stream_filter.text == SafetyFilter.RESPONSE_VIOLATION_REPLIES["diagnosis"]
+        assert "".join(emitted) == "我这是不是"
+
+    def test_abort_on_role_violation(self):
+        """测试以医生口吻开头时中止"""
+        stream_filter, emitted = self._run(["建", "议您多休息"])
+
+        assert stream_filter.aborted is True
+        assert stream_filter.text == SafetyFilter.ROLE_FALLBACK
+        assert "".join(emitted) == ""
 
 class TestPromptManager:
     """提示词管理器测试"""
@@ -107,6 +188,36 @@ class TestPromptManager:
         assert "58岁" in str(prompt)
         assert "胸骨后" in str(prompt)
 
+    def test_compiled_prompt_cached_per_case_version(self, sample_case_data):
+        """测试同一病例版本只编译一次提示词"""
+        from app.core.prompt_manager import PromptManager
+
+        case_v1 = {**sample_case_data, "case_id": "case_prompt_test", "version": "v1"}
+        first = PromptManager.get_compiled_prompt(case_v1)
+        second = PromptManager.get_compiled_prompt(dict(case_v1))
+
+        assert second is first
+        assert isinstance(first.system_prompt, str)
+        assert "58岁" in first.system_prompt
+        assert first.symptom_info["pain_level"] == "7"
+
+        case_v2 = {**case_v1, "version": "v2", "patient_info": {**case_v1["patient_info"], "age": 60}}
+        third = PromptManager.get_compiled_prompt(case_v2)
+        assert third is not first
+        assert "60岁" in third.system_prompt
+
+    def test_prompt_cache_lru_eviction(self):
+        """测试提示词缓存容量上限"""
+        from app.core.prompt_manager import PromptCache, CompiledPrompt
+
+        cache = PromptCache(maxsize=2)
+        for i in range(3):
+            cache.put((f"case_{i}", "0", "1"), CompiledPrompt(system_prompt=str(i), symptom_info={}))
+
+        assert len(cache) == 2
+        assert cache.get(("case_0", "0", "1")) is None
+        assert cache.get(("case_2", "0", "1")).system_prompt == "2"
+
 
 class TestChatEngine:
     """对话引擎测试"""
@@ -155,6 +266,76 @@ class TestChatEngine:
         emotion2 = engine._infer_emotion("挺好的，没什么")
         assert "平静" in emotion2
 
+    @pytest.mark.asyncio
+    async def test_chat_stream(self, engine, sample_case_data):
+        """测试流式对话事件顺序"""
+        class FakeLLM:
+            async def generate_response_stream(self, messages):
+                for piece in ["我胸口", "特别疼", "，难受。"]:
+                    yield piece
+
+        engine.llm_service = FakeLLM()
+
+        events = [
+            event async for event in engine.chat_stream(
+                session_id="s1",
+                user_message="请问您哪里不舒服？",
+                case_data=sample_case_data,
+                conversation_history=[],
+                turn_count=0
+            )
+        ]
+
+        deltas = [e["content"] for e in events if e["type"] == "delta"]
+        assert deltas == ["我胸口", "特别疼", "，难受。"]
+        assert events[-1]["type"] == "done"
+        assert events[-1]["response"].response == "我胸口特别疼，难受。"
+        assert events[-1]["response"].turn_count == 1
+
+    @pytest.mark.asyncio
+    async def test_chat_stream_refusal(self, engine, sample_case_data):
+        """测试流式对话拒答"""
+        events = [
+            event async for event in engine.chat_stream(
+                session_id="s1",
+                user_message="我得了什么病？",
+                case_data=sample_case_data,
+                conversation_history=[],
+                turn_count=0
+            )
+        ]
+
+        assert [e["type"] for e in events] == ["delta", "done"]
+        assert events[-1]["response"].metadata == {"refusal": True}
+
+
+    @pytest.mark.asyncio
+    async def test_chat_stream_aborts_upstream(self, engine, sample_case_data):
+        """测试流式回复违规时中止上游生成"""
+        consumed = []
+
+        class FakeLLM:
+            async def generate_response_stream(self, messages):
+                for piece in ["我是不是", "得了", "心脏病", "，医生", "您说"]:
+                    consumed.append(piece)
+                    yield piece
+
+        engine.llm_service = FakeLLM()
+
+        events = [
+            event async for event in engine.chat_stream(
+                session_id="s1",
+                user_message="您觉得是什么原因？",
+                case_data=sample_case_data,
+                conversation_history=[],
+                turn_count=0
+            )
+        ]
+
+        done = events[-1]["response"]
+        assert done.metadata["stream_aborted"] is True
+        assert done.response == SafetyFilter.RESPONSE_VIOLATION_REPLIES["diagnosis"]
+        assert consumed == ["我是不是", "得了", "心脏病"]
 
 # 集成测试（需要实际API连接）
 @pytest.mark.integration
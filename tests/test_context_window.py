@@ -0,0 +1,71 @@
+"""对话上下文窗口测试"""
+from app.core.context_window import ContextBuilder, estimate_tokens
+
+
+def _simulate(builder, session_id, turns):
+    """模拟多轮对话：每轮只传入游标之后的消息，返回每轮的上下文"""
+    store = [{"id": 1, "role": "patient", "content": "医生您好，我胸口疼了三个小时。"}]
+    contexts = []
+    for i in range(turns):
+        question = f"第{i}个问题，疼痛有什么变化吗？"
+        store.append({"id": len(store) + 1, "role": "student", "content": question})
+
+        cursor = builder.cursor(session_id)
+        history = [m for m in store if cursor is None or m["id"] > cursor]
+        contexts.append(builder.build(session_id, "系统提示", history, question))
+
+        store.append({"id": len(store) + 1, "role": "patient", "content": f"第{i}次回答，还是压着疼，出汗。"})
+    return contexts
+
+
+class TestContextBuilder:
+    """上下文构建器测试"""
+
+    def test_estimate_tokens(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("胸口疼") == 3
+        assert estimate_tokens("CT abc") == 2
+
+    def test_prompt_tokens_flat_for_long_sessions(self):
+        """测试长会话的提示词长度保持平稳，早期信息进入摘要"""
+        builder = ContextBuilder(history_token_budget=200, summary_token_budget=150, max_window_messages=20)
+        contexts = _simulate(builder, "s1", 200)
+
+        late = [c.prompt_tokens for c in contexts[50:]]
+        assert max(late) <= 200 + 150 + 100
+        assert max(late) - min(late) < 40
+
+        summary = contexts[-1].messages[1]
+        assert summary["role"] == "system"
+        assert "此前对话要点" in summary["content"]
+        # 摘要只增量折叠，游标随对话前移
+        assert builder.cursor("s1") > 300
+
+    def test_opening_fact_kept_in_summary(self):
+        """测试移出窗口的开场信息保留在摘要中"""
+        builder = ContextBuilder(history_token_budget=60, summary_token_budget=400, max_window_messages=4)
+        contexts = _simulate(builder, "s2", 5)
+
+        assert "胸口疼了三个小时" in contexts[-1].messages[1]["content"]
+        assert contexts[-1].window_size <= 4
+
+    def test_current_question_not_duplicated(self):
+        builder = ContextBuilder()
+        history = [
+            {"role": "patient", "content": "我胸口疼。"},
+            {"role": "student", "content": "疼多久了？"},
+        ]
+        context = builder.build("s3", "系统提示", history, "疼多久了？")
+
+        assert [m["content"] for m in context.messages] == ["系统提示", "我胸口疼。", "疼多久了？"]
+
+    def test_history_without_ids_not_cached(self):
+        """测试不带消息ID的历史不会被缓存，避免重复折叠"""
+        builder = ContextBuilder(history_token_budget=10, max_window_messages=1)
+        history = [
+            {"role": "student", "content": "哪里不舒服？"},
+            {"role": "patient", "content": "胸口疼。"},
+        ]
+        builder.build("s4", "系统提示", history, "多久了？")
+
+        assert builder.cursor("s4") is None
@@ -0,0 +1,136 @@
+"""
+增量评分测试
+"""
+import random
+
+import pytest
+
+from app.core import scoring_engine
+from app.core.incremental_scoring import IncrementalScorer, IncrementalScorerCache
+from app.core.scoring_engine import ScoringEngine
+from app.models.database import User, ChatSession
+from app.services.scoring_jobs import ScoringJobQueue
+from app.services.case_store import get_case_store
+from app.services.session_service import SessionService
+
+
+CASE_DATA = {
+    "standard_diagnosis": "急性心肌梗死",
+    "differential_diagnosis": ["心绞痛", "主动脉夹层"],
+    "key_questions": ["疼痛的性质和部位", "持续 时间", "既往心脏病史"],
+}
+
+STUDENT = [
+    "您好，请问您哪里疼痛？", "疼痛持续多长时间了？", "疼痛持续多长时间了？",
+    "我理解您很担心，别急", "以前有没有心脏病？", "会不会是心绞痛", "还有其他不舒服吗",
+    "麻烦说一下疼痛的性质", "谢谢", "",
+]
+PATIENT = ["胸口疼。", "三个小时了。", "医生说过可能是心绞痛", "没有了。"]
+
+
+def random_history(rng):
+    history = [{"role": "patient", "content": rng.choice(PATIENT)}]
+    for _ in range(rng.randint(0, 12)):
+        history.append({"role": "student", "content": rng.choice(STUDENT)})
+        if rng.random() < 0.8:
+            history.append({"role": "patient", "content": rng.choice(PATIENT)})
+    return history
+
+
+def test_incremental_features_match_full_scan():
+    rng = random.Random(0)
+    engine = ScoringEngine()
+    for _ in range(100):
+        history = random_history(rng)
+        diagnosis = rng.choice(["", "急性心肌梗死", "主动脉夹层", "胃炎"])
+
+        scorer = IncrementalScorer(CASE_DATA)
+        for i, msg in enumerate(history):
+            scorer.add_message(msg["role"], msg["content"])
+            # 中途导出/恢复快照，结果不变
+            if i % 3 == 0:
+                scorer = IncrementalScorer.from_state(scorer.to_state(), CASE_DATA)
+
+        features = scorer.features(diagnosis)
+        assert features == engine.rule_features(history, diagnosis, CASE_DATA)
+        assert engine._rule_results(features) == engine._score_rules(history, diagnosis, CASE_DATA)
+
+
+def test_state_rejected_when_case_changes():
+    scorer = IncrementalScorer(CASE_DATA)
+    scorer.add_message("student", "疼痛在哪里？")
+    state = scorer.to_state()
+
+    assert IncrementalScorer.from_state(state, CASE_DATA).covered == scorer.covered
+    changed = {**CASE_DATA, "key_questions": ["吸烟饮酒史"]}
+    assert IncrementalScorer.from_state(state, changed) is None
+    assert IncrementalScorer.from_state(None, CASE_DATA) is None
+
+
+def test_state_size_bounded():
+    scorer = IncrementalScorer(CASE_DATA)
+    scorer.add_message("student", "疼痛持续多长时间了？")
+    size = len(str(scorer.to_state()))
+    for i in range(150):
+        scorer.add_message("student", f"第{i}个问题，还有哪里不舒服？")
+    assert scorer.duplicates == 0
+    assert len(str(scorer.to_state())) <= size + 1100
+
+    scorer.add_message("student", "第7个问题，还有哪里不舒服？")
+    assert scorer.duplicates == 1
+
+
+def test_scorer_cache_reuses_scorer_until_state_diverges():
+    cache = IncrementalScorerCache(maxsize=2)
+    scorer = cache.get(1, None, CASE_DATA)
+    scorer.add_message("student", "疼痛在哪里？")
+    state = scorer.to_state()
+    assert cache.get(1, dict(state), CASE_DATA) is scorer
+
+    # 数据库中的快照与内存不一致（如事务回滚）时以数据库为准
+    scorer.add_message("student", "持续多长时间了？")
+    restored = cache.get(1, state, CASE_DATA)
+    assert restored is not scorer and restored.to_state() == state
+
+    changed = {**CASE_DATA, "key_questions": ["吸烟饮酒史"]}
+    assert cache.get(1, restored.to_state(), changed).messages == 0
+
+
+class FakeBaichuan:
+    async def evaluate_student_performance(self, case_data, conversation_history, student_diagnosis):
+        return {"scores": {}, "comments": {}, "suggestions": [], "overall_comment": ""}
+
+
+@pytest.mark.asyncio
+async def test_scoring_job_uses_snapshot(session_factory, db_session, monkeypatch):
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: FakeBaichuan())
+
+    user = User(username="student_incremental", role="STUDENT")
+    db_session.add(user)
+    await db_session.flush()
+
+    service = SessionService(db_session)
+    session = await service.create_session(user.id, "case_incremental", CASE_DATA)
+    for role, content in [("patient", "胸口疼。"), ("student", "您好，疼痛持续多长时间了？"), ("patient", "三个小时了。")]:
+        await service.add_message(session.session_id, role, content, case_data=CASE_DATA)
+    await db_session.commit()
+    get_case_store().invalidate("case_incremental")
+
+    assert session.scoring_state["messages"] == 3
+    assert session.scoring_state["questions"] == 1
+
+    # 快照完整时结束评分不再全量扫描对话
+    def no_full_scan(*args, **kwargs):
+        raise AssertionError("不应重新扫描对话")
+    monkeypatch.setattr(ScoringEngine, "_score_rules", no_full_scan)
+
+    queue = ScoringJobQueue(workers=1, session_factory=session_factory)
+    job = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死")
+    job_pk = await queue.claim()
+    await queue.run_job(job_pk)
+
+    async with session_factory() as db:
+        stored = await queue.get_job(db, job.job_id)
+        assert stored.status == "completed"
+        chat_session = await db.get(ChatSession, session.id)
+        assert chat_session.total_score is not None
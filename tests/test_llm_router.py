@@ -0,0 +1,128 @@
+"""LLM服务路由测试"""
+import asyncio
+import pytest
+
+from app.services.llm_router import LLMRouter, NoProviderAvailableError
+from app.services.single_flight import SingleFlight
+
+
+class FakeProvider:
+    """可控延迟和失败的模拟服务"""
+
+    def __init__(self, name, reply="胸口疼", delay=0.0, fail=False, available=True):
+        self.name = name
+        self.reply = reply
+        self.delay = delay
+        self.fail = fail
+        self.available = available
+        self.calls = 0
+        self.cancelled = False
+
+    async def complete(self, messages, temperature=None, max_tokens=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        return self.reply
+
+    async def complete_stream(self, messages, temperature=None, max_tokens=None):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        for piece in self.reply:
+            yield piece
+
+
+MESSAGES = [{"role": "user", "content": "哪里不舒服？"}]
+
+
+class TestLLMRouter:
+    """路由器测试"""
+
+    @pytest.mark.asyncio
+    async def test_failover_to_next_provider(self):
+        """测试首选服务失败时切换到下一个服务"""
+        zhipu = FakeProvider("zhipu", fail=True)
+        baichuan = FakeProvider("baichuan", reply="疼了三个小时")
+        router = LLMRouter([zhipu, baichuan])
+
+        text, provider = await router.complete(MESSAGES)
+
+        assert (text, provider) == ("疼了三个小时", "baichuan")
+        assert router.failovers == 1
+        assert router.stats["zhipu"].error_rate > 0
+
+    @pytest.mark.asyncio
+    async def test_routes_to_fastest_healthy_provider(self):
+        """测试按EWMA延迟选路，错误率过高的服务排到最后"""
+        zhipu = FakeProvider("zhipu")
+        baichuan = FakeProvider("baichuan")
+        router = LLMRouter([zhipu, baichuan], error_threshold=0.5, cooldown_seconds=60)
+
+        router.stats["zhipu"].record_success(2.0)
+        router.stats["baichuan"].record_success(0.5)
+        assert [p.name for p in router.ranked()] == ["baichuan", "zhipu"]
+
+        for _ in range(5):
+            router.stats["baichuan"].record_failure(0.1)
+        assert not router.is_healthy("baichuan")
+        assert [p.name for p in router.ranked()] == ["zhipu", "baichuan"]
+
+        # 未配置的服务不参与选路
+        zhipu.available = False
+        baichuan.available = False
+        with pytest.raises(NoProviderAvailableError):
+            await router.complete(MESSAGES)
+
+    @pytest.mark.asyncio
+    async def test_hedged_request(self):
+        """测试首选服务超过对冲延迟未返回时，取备选服务的结果并取消首选请求"""
+        zhipu = FakeProvider("zhipu", reply="慢回复", delay=1.0)
+        baichuan = FakeProvider("baichuan", reply="快回复", delay=0.01)
+        router = LLMRouter([zhipu, baichuan], hedge_enabled=True, hedge_delay=0.05)
+
+        text, provider = await router.complete(MESSAGES)
+        await asyncio.sleep(0)
+
+        assert (text, provider) == ("快回复", "baichuan")
+        assert router.hedged == 1 and router.hedge_wins == 1
+        assert zhipu.cancelled
+        # 被取消的请求不计入统计
+        assert router.stats["zhipu"].requests == 0
+
+    @pytest.mark.asyncio
+    async def test_losing_hedge_cancels_coalesced_upstream(self):
+        """测试落败的对冲请求经过请求合并时，上游调用同样被取消（不再占用限流槽位）"""
+        zhipu = FakeProvider("zhipu", reply="慢回复", delay=1.0)
+        flight = SingleFlight()
+
+        class CoalescedProvider:
+            name = "zhipu"
+            available = True
+
+            async def complete(self, messages, temperature=None, max_tokens=None):
+                return await flight.do("zhipu", "key", lambda: zhipu.complete(messages))
+
+        baichuan = FakeProvider("baichuan", reply="快回复", delay=0.01)
+        router = LLMRouter([CoalescedProvider(), baichuan], hedge_enabled=True, hedge_delay=0.05)
+
+        text, provider = await router.complete(MESSAGES)
+        await asyncio.sleep(0.01)
+
+        assert (text, provider) == ("快回复", "baichuan")
+        assert zhipu.cancelled
+        assert flight.stats()["inflight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_failover_before_first_token(self):
+        """测试流式调用在输出首段前失败时切换服务"""
+        router = LLMRouter([FakeProvider("zhipu", fail=True), FakeProvider("baichuan", reply="胸口疼")])
+
+        pieces = [piece async for piece in router.stream(MESSAGES)]
+
+        assert "".join(pieces) == "胸口疼"
+        assert router.get_stats()["providers"]["zhipu"]["failures"] == 1
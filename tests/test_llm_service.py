@@ -0,0 +1,180 @@
+"""LLM服务测试"""
+import asyncio
+import json
+import httpx
+import pytest
+
+from app.services.single_flight import SingleFlight, request_key
+from app.services.zhipu_client import ZhipuAsyncClient
+
+
+def _make_client(handler) -> ZhipuAsyncClient:
+    """使用 MockTransport 构建客户端"""
+    return ZhipuAsyncClient(
+        api_key="test-key",
+        base_url="https://mock.local/v4/",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+
+class TestZhipuAsyncClient:
+    """智谱AI异步客户端测试"""
+
+    @pytest.mark.asyncio
+    async def test_chat_completion(self):
+        """测试非流式调用"""
+        captured = {}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            captured["url"] = str(request.url)
+            captured["auth"] = request.headers["authorization"]
+            captured["body"] = json.loads(request.content)
+            return httpx.Response(200, json={
+                "choices": [{"message": {"role": "assistant", "content": "胸口疼"}}]
+            })
+
+        client = _make_client(handler)
+        result = await client.chat_completion(
+            model="glm-4.7",
+            messages=[{"role": "user", "content": "哪里不舒服？"}],
+            temperature=0.7,
+            max_tokens=100
+        )
+
+        assert result["choices"][0]["message"]["content"] == "胸口疼"
+        assert captured["url"] == "https://mock.local/v4/chat/completions"
+        assert captured["auth"] == "Bearer test-key"
+        assert captured["body"]["model"] == "glm-4.7"
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_stream_chat_completion(self):
+        """测试SSE流式解析"""
+        def handler(request: httpx.Request) -> httpx.Response:
+            lines = [
+                'data: {"choices": [{"delta": {"content": "胸口"}}]}',
+                "",
+                'data: {"choices": [{"delta": {"content": "疼"}}]}',
+                "",
+                "data: [DONE]",
+                ""
+            ]
+            return httpx.Response(200, content="\n".join(lines).encode("utf-8"))
+
+        client = _make_client(handler)
+        pieces = [
+            piece async for piece in client.stream_chat_completion(
+                model="glm-4.7",
+                messages=[{"role": "user", "content": "哪里不舒服？"}],
+                temperature=0.7,
+                max_tokens=100
+            )
+        ]
+
+        assert pieces == ["胸口", "疼"]
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_http_error_raises(self):
+        """测试非2xx响应抛出异常"""
+        client = _make_client(lambda request: httpx.Response(429, json={"error": "rate limited"}))
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.chat_completion(
+                model="glm-4.7",
+                messages=[],
+                temperature=0.7,
+                max_tokens=100
+            )
+        await client.aclose()
+
+
+class TestSingleFlight:
+    """LLM请求合并测试"""
+
+    @pytest.mark.asyncio
+    async def test_identical_requests_coalesced(self):
+        """测试同时在途的相同请求只调用一次上游"""
+        calls = []
+        release = asyncio.Event()
+
+        async def call():
+            calls.append(1)
+            await release.wait()
+            return "胸口疼"
+
+        flight = SingleFlight()
+        messages = [{"role": "user", "content": "哪里不舒服？"}]
+        key = request_key("zhipu", "glm-4.7", 0.7, 100, messages)
+
+        waiters = [asyncio.create_task(flight.do("zhipu", key, call)) for _ in range(10)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert results == ["胸口疼"] * 10
+        assert len(calls) == 1
+        assert flight.stats()["coalesced"] == {"zhipu": 9}
+        assert flight.stats()["inflight"] == 0
+
+        # 上游调用结束后不再合并
+        assert await flight.do("zhipu", key, call) == "胸口疼"
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_error_shared_and_waiter_cancel_isolated(self):
+        """测试上游异常传给所有等待方，单个等待方取消不影响其他等待方"""
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            raise RuntimeError("upstream")
+
+        flight = SingleFlight()
+        key = request_key("baichuan", "Baichuan4", 0.3, 1000, [], json_mode=True)
+        first = asyncio.create_task(flight.do("baichuan", key, call))
+        second = asyncio.create_task(flight.do("baichuan", key, call))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        release.set()
+
+        with pytest.raises(RuntimeError):
+            await second
+        assert first.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_upstream_cancelled_when_all_waiters_cancel(self):
+        """测试所有等待方都取消后取消上游调用"""
+        started = asyncio.Event()
+        upstream_cancelled = asyncio.Event()
+
+        async def call():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                upstream_cancelled.set()
+                raise
+
+        flight = SingleFlight()
+        key = request_key("zhipu", "glm-4.7", 0.7, 100, [])
+        first = asyncio.create_task(flight.do("zhipu", key, call))
+        second = asyncio.create_task(flight.do("zhipu", key, call))
+        await started.wait()
+
+        # 还有等待方时上游继续
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not upstream_cancelled.is_set()
+
+        second.cancel()
+        await asyncio.wait_for(upstream_cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        assert flight.stats()["inflight"] == 0
+
+    def test_request_key(self):
+        messages = [{"role": "user", "content": "哪里不舒服？"}]
+        assert request_key("zhipu", "m", 0.7, 100, messages) == request_key("zhipu", "m", 0.7, 100, list(messages))
+        assert request_key("zhipu", "m", 0.7, 100, messages) != request_key("zhipu", "m", 0.3, 100, messages)
+        assert request_key("zhipu", "m", 0.7, 100, messages) != request_key("baichuan", "m", 0.7, 100, messages)
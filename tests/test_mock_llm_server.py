@@ -0,0 +1,100 @@
+"""本地模拟大模型服务测试（无需联网）"""
+import importlib.util
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from app.core.prompt_manager import PromptManager
+from app.services.zhipu_client import ZhipuAsyncClient
+
+_spec = importlib.util.spec_from_file_location(
+    "mock_llm_server", Path(__file__).parent.parent / "scripts" / "mock_llm_server.py"
+)
+mock_llm_server = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(mock_llm_server)
+
+
+CASE_DATA = {
+    "case_id": "case_mock",
+    "patient_info": {"age": 58, "gender": "男", "occupation": "建筑工人"},
+    "chief_complaint": {"text": "胸痛3小时"},
+    "symptoms": {
+        "location": "胸骨后",
+        "nature": "压榨性疼痛",
+        "duration": "持续5-10分钟",
+        "associated_symptoms": ["出汗"]
+    },
+    "standard_diagnosis": "不稳定性心绞痛"
+}
+
+
+def _client(**config) -> ZhipuAsyncClient:
+    app = mock_llm_server.create_app(mock_llm_server.MockConfig(latency_ms=0, seed=1, **config))
+    return ZhipuAsyncClient(
+        api_key="mock",
+        base_url="http://mock/v1",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    )
+
+
+def _messages(question: str):
+    system_prompt = PromptManager.get_compiled_prompt(CASE_DATA).system_prompt
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": question}]
+
+
+class TestMockLLMServer:
+    """模拟服务测试"""
+
+    @pytest.mark.asyncio
+    async def test_case_aware_reply(self):
+        """测试回复与病例设定一致，并返回token用量"""
+        client = _client()
+        result = await client.chat_completion("mock", _messages("您哪里不舒服？"), 0.7, 100)
+
+        content = result["choices"][0]["message"]["content"]
+        assert "胸骨后" in content
+        assert result["usage"]["total_tokens"] > 0
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_stream(self):
+        client = _client(tokens_per_second=0)
+        pieces = [p async for p in client.stream_chat_completion("mock", _messages("疼了多久了？"), 0.7, 100)]
+
+        assert len(pieces) > 1
+        assert "胸痛3小时" in "".join(pieces)
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_error_injection(self):
+        client = _client(error_rate=1.0, error_status=[429])
+
+        with pytest.raises(httpx.HTTPStatusError) as exc_info:
+            await client.chat_completion("mock", _messages("哪里不舒服？"), 0.7, 100)
+        assert exc_info.value.response.status_code == 429
+        await client.aclose()
+
+    def test_evaluation_json_deterministic(self):
+        """测试评分JSON确定且格式与百川评分一致"""
+        prompt = (
+            "标准诊断: 不稳定性心绞痛\n"
+            "【学生问诊记录】\n1. 医生: 哪里不舒服？\n2. 患者: 胸口疼。\n"
+            "【学生给出的诊断】\n不稳定性心绞痛\n"
+        )
+        messages = [{"role": "user", "content": prompt}]
+
+        first = mock_llm_server.evaluation_json(messages)
+        result = json.loads(first)
+
+        assert first == mock_llm_server.evaluation_json(messages)
+        assert set(result["scores"]) == {"inquiry_logic", "info_collection", "diagnosis_reasoning", "communication"}
+        assert result["scores"]["diagnosis_reasoning"] == 22
+
+    def test_latency_distribution(self):
+        mock = mock_llm_server.MockLLM(mock_llm_server.MockConfig(latency_ms=100, latency_jitter_ms=50, seed=7))
+        samples = [mock.latency() for _ in range(500)]
+
+        assert min(samples) >= 0
+        assert 0.08 < sum(samples) / len(samples) < 0.12
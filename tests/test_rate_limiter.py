@@ -0,0 +1,97 @@
+"""上游LLM限流测试"""
+import asyncio
+import pytest
+
+from app.services.rate_limiter import (
+    ProviderGovernor, TokenBucket, QueueTimeoutError, PRIORITY_CHAT, PRIORITY_SCORING
+)
+
+
+class TestTokenBucket:
+    """令牌桶测试"""
+
+    def test_wait_time(self):
+        bucket = TokenBucket(600)  # 每秒10个，突发容量100
+        assert bucket.capacity == 100
+        assert bucket.wait_time(1) == 0
+        bucket.consume(100)
+        assert 0.05 < bucket.wait_time(1) <= 0.1
+
+        # 超过容量的请求按容量计，不会永远等待
+        assert bucket.wait_time(10 ** 6) <= 10
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0)
+        bucket.consume(10 ** 6)
+        assert bucket.wait_time(10 ** 6) == 0
+
+
+class TestProviderGovernor:
+    """限流调度器测试"""
+
+    @pytest.mark.asyncio
+    async def test_priority_and_concurrency(self):
+        """测试并发已满时，交互对话优先于评分放行"""
+        governor = ProviderGovernor("zhipu", max_concurrency=1)
+        order = []
+
+        async def call(name, priority):
+            async with await governor.acquire(10, priority):
+                order.append(name)
+
+        holder = await governor.acquire(10)
+        tasks = [
+            asyncio.create_task(call("scoring", PRIORITY_SCORING)),
+            asyncio.create_task(call("chat-1", PRIORITY_CHAT)),
+            asyncio.create_task(call("chat-2", PRIORITY_CHAT)),
+        ]
+        await asyncio.sleep(0)
+
+        stats = governor.get_stats()
+        assert stats["active"] == 1
+        assert stats["queue_depth"] == 3
+        assert stats["queue_depth_by_priority"] == {PRIORITY_CHAT: 2, PRIORITY_SCORING: 1}
+
+        governor.release(holder)
+        await asyncio.gather(*tasks)
+
+        assert order == ["chat-1", "chat-2", "scoring"]
+        assert governor.get_stats()["active"] == 0
+
+    @pytest.mark.asyncio
+    async def test_rpm_limit_delays_requests(self):
+        """测试请求数超过令牌桶容量后按速率放行"""
+        governor = ProviderGovernor("baichuan", rpm=600)
+        loop = asyncio.get_running_loop()
+
+        start = loop.time()
+        for _ in range(102):
+            async with await governor.acquire(1):
+                pass
+        elapsed = loop.time() - start
+
+        assert elapsed >= 0.1
+        assert governor.get_stats()["granted"] == 102
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        """测试排队超时后抛出异常并移出队列"""
+        governor = ProviderGovernor("zhipu", max_concurrency=1, queue_timeout=0.05)
+        holder = await governor.acquire(10)
+
+        with pytest.raises(QueueTimeoutError):
+            await governor.acquire(10)
+
+        stats = governor.get_stats()
+        assert stats["timeouts"] == 1 and stats["queue_depth"] == 0
+        governor.release(holder)
+        assert governor.active == 0
+
+    @pytest.mark.asyncio
+    async def test_tpm_refund(self):
+        """测试按实际用量退还预扣的token"""
+        governor = ProviderGovernor("zhipu", tpm=6000)  # 突发容量1000
+        async with await governor.acquire(800) as slot:
+            slot.used_tokens = 100
+
+        assert governor.tokens.tokens >= 900
@@ -0,0 +1,131 @@
+"""LLM调用容错测试"""
+import asyncio
+import httpx
+import pytest
+
+from app.services.rate_limiter import QueueTimeoutError
+from app.services.resilience import ResiliencePolicy, CircuitOpenError, is_retryable
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://mock.local/chat/completions")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+class TestResiliencePolicy:
+    """容错策略测试"""
+
+    def test_is_retryable(self):
+        assert is_retryable(asyncio.TimeoutError())
+        assert is_retryable(httpx.ConnectError("refused"))
+        assert is_retryable(_status_error(429))
+        assert is_retryable(_status_error(503))
+        assert not is_retryable(_status_error(401))
+        assert not is_retryable(ValueError("bad json"))
+
+    @pytest.mark.asyncio
+    async def test_retry_then_succeed(self):
+        """测试可重试错误按退避重试"""
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise httpx.ConnectError("refused")
+            return "胸口疼"
+
+        policy = ResiliencePolicy("zhipu", max_attempts=3, base_delay=0.001)
+
+        assert await policy.call(call) == "胸口疼"
+        assert len(attempts) == 3
+        assert policy.get_stats()["retries"] == 2
+        assert policy.breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_non_retryable_not_retried(self):
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            raise _status_error(400)
+
+        policy = ResiliencePolicy("zhipu", max_attempts=3, base_delay=0.001)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await policy.call(call)
+        assert len(attempts) == 1
+        assert policy.breaker.consecutive_failures == 0
+
+    @pytest.mark.asyncio
+    async def test_attempt_timeout(self):
+        """测试单次上游调用超时后重试"""
+        policy = ResiliencePolicy("zhipu", max_attempts=2, base_delay=0.001, attempt_timeout=0.02)
+
+        async def call():
+            await policy.upstream(asyncio.sleep(1))
+
+        with pytest.raises(asyncio.TimeoutError):
+            await policy.call(call)
+        assert policy.breaker.consecutive_failures == 2
+
+    @pytest.mark.asyncio
+    async def test_queue_wait_not_counted_in_timeout(self):
+        """测试限流排队时间不计入单次超时，排队超时不计入熔断"""
+        policy = ResiliencePolicy("zhipu", max_attempts=2, base_delay=0.001, attempt_timeout=0.05)
+
+        async def call():
+            await asyncio.sleep(0.08)  # 排队等待槽位
+            return await policy.upstream(asyncio.sleep(0.01, result="胸口疼"))
+
+        assert await policy.call(call) == "胸口疼"
+        assert policy.breaker.consecutive_failures == 0
+
+        async def queue_timeout():
+            raise QueueTimeoutError("zhipu 排队超时")
+
+        with pytest.raises(QueueTimeoutError):
+            await policy.call(queue_timeout)
+        assert policy.breaker.consecutive_failures == 0
+        assert policy.get_stats()["retries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_circuit_breaker_fails_fast_and_recovers(self):
+        """测试连续失败后熔断，冷却后试探成功恢复"""
+        calls = []
+        healthy = False
+
+        async def call():
+            calls.append(1)
+            if not healthy:
+                raise _status_error(502)
+            return "ok"
+
+        policy = ResiliencePolicy(
+            "baichuan", max_attempts=1, failure_threshold=3, recovery_timeout=0.05
+        )
+        for _ in range(3):
+            with pytest.raises(httpx.HTTPStatusError):
+                await policy.call(call)
+
+        with pytest.raises(CircuitOpenError):
+            await policy.call(call)
+        assert len(calls) == 3
+        assert policy.get_stats()["state"] == "open"
+
+        await asyncio.sleep(0.06)
+        healthy = True
+        assert await policy.call(call) == "ok"
+        assert policy.get_stats()["state"] == "closed"
+
+    @pytest.mark.asyncio
+    async def test_stream_rejected_while_open(self):
+        async def open_stream():
+            raise httpx.ConnectError("refused")
+            yield  # pragma: no cover
+
+        policy = ResiliencePolicy("zhipu", failure_threshold=1, recovery_timeout=60)
+        with pytest.raises(httpx.ConnectError):
+            [piece async for piece in policy.stream(open_stream)]
+
+        with pytest.raises(CircuitOpenError):
+            [piece async for piece in policy.stream(open_stream)]
@@ -0,0 +1,123 @@
+"""患者回复缓存测试"""
+import pytest
+
+from app.config import settings, Settings
+from app.core.chat_engine import ChatEngine
+from app.core.response_cache import ResponseCache, normalize_question, is_cache_enabled
+
+
+CASE_KEY = ("case_001", "1", "v1")
+
+
+class TestResponseCache:
+    """回复缓存测试"""
+
+    def test_normalize_question(self):
+        assert normalize_question("医生你好，请问您哪里不舒服？") == normalize_question("哪里不舒服")
+        assert normalize_question("疼了多久了呢？") == "疼了多久了"
+
+    def test_exact_hit_requires_same_state(self):
+        cache = ResponseCache(maxsize=10)
+        cache.put(CASE_KEY, "state-a", "哪里不舒服？", "胸口疼。")
+
+        assert cache.get(CASE_KEY, "state-a", "您哪里不舒服") == "胸口疼。"
+        # 对话状态不同（之前的对话不一样）时不命中
+        assert cache.get(CASE_KEY, "state-b", "哪里不舒服？") is None
+        assert cache.get(("case_002", "1", "v1"), "state-a", "哪里不舒服？") is None
+
+    def test_similar_hit(self):
+        cache = ResponseCache(maxsize=10, similarity_threshold=0.6)
+        cache.put(CASE_KEY, "s", "胸口疼了多长时间了", "三个小时了。")
+
+        assert cache.get(CASE_KEY, "s", "胸口疼了多长时间") == "三个小时了。"
+        assert cache.get(CASE_KEY, "s", "有没有发烧") is None
+        assert cache.stats()["similar_hits"] == 1
+
+    def test_near_miss_not_matched(self):
+        """测试默认只做精确匹配；开启相似匹配时关键字不同的问题也不命中"""
+        near_misses = [
+            ("你父亲以前有没有高血压糖尿病病史", "你母亲以前有没有高血压糖尿病病史"),
+            ("疼痛会不会向左边肩膀和手臂放射", "疼痛会不会向右边肩膀和手臂放射"),
+            ("最近这几天晚上睡觉有出汗的情况", "最近这几天晚上睡觉没出汗的情况"),
+        ]
+        # 相似匹配需显式开启
+        assert Settings.model_fields["RESPONSE_CACHE_SIMILARITY"].default <= 0
+
+        for threshold in (0.0, 0.6):
+            cache = ResponseCache(maxsize=10, similarity_threshold=threshold)
+            for cached, asked in near_misses:
+                cache.put(CASE_KEY, "s", cached, "回复")
+                assert cache.get(CASE_KEY, "s", asked) is None
+            assert cache.stats()["similar_hits"] == 0
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(maxsize=2)
+        cache.put(CASE_KEY, "s", "问题一", "回答一")
+        cache.put(CASE_KEY, "s", "问题二", "回答二")
+        cache.get(CASE_KEY, "s", "问题一")
+        cache.put(CASE_KEY, "s", "问题三", "回答三")
+
+        assert len(cache) == 2
+        assert cache.get(CASE_KEY, "s", "问题二") is None
+        assert cache.get(CASE_KEY, "s", "问题一") == "回答一"
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["exact_hits"] == 2 and stats["misses"] == 1
+
+    def test_case_opt_out(self, monkeypatch):
+        assert is_cache_enabled({"case_id": "case_001"})
+        assert not is_cache_enabled({"case_id": "case_001", "response_cache": False})
+
+        monkeypatch.setattr(settings, "RESPONSE_CACHE_EXCLUDED_CASES", ["case_001"])
+        assert not is_cache_enabled({"case_id": "case_001"})
+
+
+class TestChatEngineResponseCache:
+    """对话引擎接入回复缓存测试"""
+
+    @pytest.fixture
+    def case_data(self):
+        return {
+            "case_id": "case_cache",
+            "patient_info": {"name": "张先生", "age": 45, "gender": "男"},
+            "chief_complaint": {"text": "胸痛3小时"},
+            "symptoms": {"location": "胸骨后", "nature": "压榨性疼痛"},
+            "standard_diagnosis": "急性心肌梗死"
+        }
+
+    @pytest.mark.asyncio
+    async def test_repeated_question_skips_llm(self, case_data):
+        """测试不同学生在相同对话状态下问同一问题时不再调用LLM"""
+        calls = []
+
+        class FakeLLM:
+            async def generate_response(self, messages):
+                calls.append(messages)
+                return "就是胸口这儿，压着疼。"
+
+        engine = ChatEngine()
+        engine.llm_service = FakeLLM()
+        engine.response_cache = ResponseCache(maxsize=10)
+
+        first = await engine.chat("s1", "您哪里不舒服？", case_data, [], 0)
+        second = await engine.chat("s2", "你哪里不舒服", case_data, [], 0)
+
+        assert len(calls) == 1
+        assert second.response == first.response
+        assert second.metadata.get("cached") is True
+        assert "cached" not in first.metadata
+
+    @pytest.mark.asyncio
+    async def test_fallback_reply_not_cached(self, case_data):
+        """测试兜底话术不进入缓存"""
+        class FakeLLM:
+            async def generate_response(self, messages):
+                return "病人正在思考，请稍等..."
+
+        engine = ChatEngine()
+        engine.llm_service = FakeLLM()
+        engine.response_cache = ResponseCache(maxsize=10)
+
+        await engine.chat("s1", "您哪里不舒服？", case_data, [], 0)
+
+        assert len(engine.response_cache) == 0
@@ -0,0 +1,159 @@
+"""
+评分结果缓存测试
+"""
+import asyncio
+import functools
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.core import scoring_engine
+from app.models.database import User, Case, ChatSession, SessionScore, ScoringResultCache
+from app.services import scoring_service
+from app.services.scoring_cache import ScoringCache
+from app.services.scoring_rules import ScoringRuleRegistry
+from app.services.scoring_service import ScoringService
+
+
+CASE_DATA = {
+    "case_id": "case_cache",
+    "version": "2024-01-01T00:00:00",
+    "standard_diagnosis": "急性心肌梗死",
+    "key_questions": ["疼痛 部位"],
+}
+
+HISTORY = [
+    {"role": "patient", "content": "胸口疼。", "timestamp": "2024-01-01T08:00:00"},
+    {"role": "student", "content": "您好，请问哪里疼痛？", "timestamp": "2024-01-01T08:00:05"},
+]
+
+
+class CountingBaichuan:
+    def __init__(self, scores=None):
+        self.calls = 0
+        self.scores = scores if scores is not None else {
+            "inquiry_logic": 20, "info_collection": 18, "diagnosis_reasoning": 22, "communication": 21
+        }
+
+    async def evaluate_student_performance(self, case_data, conversation_history, student_diagnosis):
+        self.calls += 1
+        return {"scores": dict(self.scores), "comments": {}, "suggestions": ["补充既往史"], "overall_comment": "良好"}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ScoringCache(maxsize=10)
+    monkeypatch.setattr(scoring_service, "get_scoring_cache", lambda: cache)
+    registry = ScoringRuleRegistry(ttl_seconds=60)
+    monkeypatch.setattr(scoring_service, "get_scoring_rule_registry", lambda: registry)
+    return cache
+
+
+async def _create_sessions(db, count):
+    user = User(username="student_cache", role="STUDENT")
+    case = Case(case_id="case_cache", title="胸痛待查", patient_info={}, chief_complaint={}, symptoms={})
+    db.add_all([user, case])
+    await db.flush()
+    sessions = [ChatSession(session_id=f"s_cache_{i}", user_id=user.id, case_id=case.id) for i in range(count)]
+    db.add_all(sessions)
+    await db.commit()
+    return sessions
+
+
+@pytest.mark.asyncio
+async def test_identical_input_skips_llm(db_session, cache, monkeypatch):
+    baichuan = CountingBaichuan()
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: baichuan)
+    first_session, second_session, third_session = await _create_sessions(db_session, 3)
+
+    service = ScoringService(db_session)
+    first = await service.score_session(first_session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+
+    # 空白差异、时间戳不同仍视为同一对话
+    retried = [dict(msg, content=f"  {msg['content']} ", timestamp="later") for msg in HISTORY]
+    second = await service.score_session(second_session.id, retried, "急性心肌梗死 ", CASE_DATA)
+    assert baichuan.calls == 1
+    assert float(second.final_score) == pytest.approx(float(first.final_score))
+    assert second.llm_scores == first.llm_scores
+    assert cache.get_stats()["memory_hits"] == 1
+
+    # 诊断不同则重新评分
+    await service.score_session(third_session.id, HISTORY, "心绞痛", CASE_DATA)
+    assert baichuan.calls == 2
+
+    rows = (await db_session.execute(select(ScoringResultCache))).scalars().all()
+    assert len(rows) == 2
+
+
+@pytest.mark.asyncio
+async def test_persisted_table_survives_restart(db_session, cache, monkeypatch):
+    baichuan = CountingBaichuan()
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: baichuan)
+    first_session, second_session = await _create_sessions(db_session, 2)
+
+    await ScoringService(db_session).score_session(first_session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+
+    # 进程内缓存清空后从数据库表命中
+    cache.clear()
+    await ScoringService(db_session).score_session(second_session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+    assert baichuan.calls == 1
+    assert cache.get_stats()["db_hits"] == 1
+
+    row = (await db_session.execute(select(ScoringResultCache))).scalar_one()
+    assert row.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_degraded_llm_result_not_cached(db_session, cache, monkeypatch):
+    baichuan = CountingBaichuan(scores={"inquiry_logic": 0, "diagnosis_reasoning": 0, "communication": 0})
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: baichuan)
+    first_session, second_session = await _create_sessions(db_session, 2)
+
+    service = ScoringService(db_session)
+    await service.score_session(first_session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+    await service.score_session(second_session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+    assert baichuan.calls == 2
+    assert cache.get_stats()["size"] == 0
+
+
+class LateBaichuan(CountingBaichuan):
+    """超过截止时间才返回评估"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def evaluate_student_performance(self, case_data, conversation_history, student_diagnosis):
+        await self.release.wait()
+        return await super().evaluate_student_performance(case_data, conversation_history, student_diagnosis)
+
+
+@pytest.mark.asyncio
+async def test_late_fusion_result_cached(session_factory, db_session, cache, monkeypatch):
+    baichuan = LateBaichuan()
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: baichuan)
+    monkeypatch.setattr(settings, "SCORING_LLM_DEADLINE", 0.05)
+    monkeypatch.setattr(
+        scoring_service, "apply_late_fusion",
+        functools.partial(scoring_service.apply_late_fusion, session_factory=session_factory)
+    )
+    first_session, second_session = await _create_sessions(db_session, 2)
+
+    # 先返回的规则评分不缓存
+    first = await ScoringService(db_session).score_session(first_session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+    assert cache.get_stats()["size"] == 0
+
+    # 融合结果补写后写入缓存，再次评分不再调用百川
+    baichuan.release.set()
+    await asyncio.gather(*scoring_service._pending_fusions)
+    assert cache.get_stats()["size"] == 1
+
+    second = await ScoringService(db_session).score_session(second_session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+    assert baichuan.calls == 1
+    assert second.llm_scores == baichuan.scores
+
+    async with session_factory() as db:
+        fused = await db.get(SessionScore, first.id)
+        assert float(second.final_score) == pytest.approx(float(fused.final_score))
+        assert (await db.execute(select(ScoringResultCache))).scalar_one()
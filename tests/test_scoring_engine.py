@@ -0,0 +1,85 @@
+"""
+评分引擎测试
+"""
+import asyncio
+
+import pytest
+
+from app.core import scoring_engine
+from app.core.scoring_engine import ScoringEngine
+
+
+CASE_DATA = {
+    "case_id": "case_test",
+    "standard_diagnosis": "急性心肌梗死",
+    "differential_diagnosis": ["心绞痛", "主动脉夹层"],
+    "key_questions": ["疼痛 部位", "持续 时间"],
+}
+
+HISTORY = [
+    {"role": "user", "content": "您好，请问您哪里疼痛？"},
+    {"role": "assistant", "content": "胸口疼。"},
+    {"role": "user", "content": "持续多长时间了？"},
+    {"role": "assistant", "content": "三个小时了。"},
+]
+
+LLM_RESULT = {
+    "scores": {"inquiry_logic": 20, "diagnosis_reasoning": 20, "communication": 22},
+    "comments": {"inquiry": "问诊较完整"},
+    "suggestions": ["注意询问既往史"],
+    "overall_comment": "整体表现良好",
+}
+
+
+class FakeBaichuan:
+    """可控延迟的百川服务替身"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def evaluate_student_performance(self, case_data, conversation_history, student_diagnosis):
+        await asyncio.sleep(self.delay)
+        return LLM_RESULT
+
+
+@pytest.fixture
+def fake_baichuan(monkeypatch):
+    def install(delay: float):
+        fake = FakeBaichuan(delay)
+        monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: fake)
+        return fake
+    return install
+
+
+@pytest.mark.asyncio
+async def test_llm_within_deadline_is_fused(fake_baichuan):
+    fake_baichuan(0.01)
+    result = await ScoringEngine().score_session(HISTORY, "急性心肌梗死", CASE_DATA, llm_deadline=5)
+
+    assert not result.llm_pending
+    assert result.llm_fusion is None
+    assert result.communication_total_score == 22
+    assert result.ai_comments.startswith("整体表现良好")
+
+
+@pytest.mark.asyncio
+async def test_late_llm_returns_rules_then_fuses(fake_baichuan):
+    fake_baichuan(0.3)
+    engine = ScoringEngine()
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = await engine.score_session(HISTORY, "急性心肌梗死", CASE_DATA, llm_deadline=0.05)
+    elapsed = loop.time() - started
+
+    # 截止时间内返回仅含规则评分的结果
+    assert elapsed < 0.25
+    assert result.llm_pending
+    assert "整体表现良好" not in result.ai_comments
+
+    # 百川评估返回后得到融合结果，且规则结果未被修改
+    fused = await result.llm_fusion
+    assert not fused.llm_pending
+    assert fused.communication_total_score == 22
+    assert fused.ai_comments.startswith("整体表现良好")
+    assert result.communication_total_score != 22
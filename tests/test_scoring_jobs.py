@@ -0,0 +1,285 @@
+"""评分任务队列测试"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.core import scoring_engine
+from app.models.database import User, ChatSession, ScoringJob, SessionStatus
+from app.services import scoring_jobs
+from app.services.case_store import get_case_store
+from app.services.scoring_jobs import ScoringJobQueue, ScoringJobConflictError
+from app.services.session_service import SessionService
+
+
+CASE_DATA = {
+    "title": "胸痛待查",
+    "category": "内科",
+    "standard_diagnosis": "急性心肌梗死",
+    "key_questions": ["疼痛 部位"],
+}
+
+
+class FakeBaichuan:
+    async def evaluate_student_performance(self, case_data, conversation_history, student_diagnosis):
+        return {"scores": {}, "comments": {}, "suggestions": [], "overall_comment": ""}
+
+
+@pytest.fixture(autouse=True)
+def fake_baichuan(monkeypatch):
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: FakeBaichuan())
+
+
+async def _create_session(db, case_id):
+    user = User(username=f"student_{case_id}", role="STUDENT")
+    db.add(user)
+    await db.flush()
+
+    service = SessionService(db)
+    session = await service.create_session(user.id, case_id, CASE_DATA)
+    await service.add_message(session.session_id, "student", "您好，哪里疼痛？")
+    await service.add_message(session.session_id, "patient", "胸口疼。")
+    await db.commit()
+    get_case_store().invalidate(case_id)
+    return session
+
+
+@pytest.mark.asyncio
+async def test_enqueue_then_worker_completes(session_factory, db_session):
+    session = await _create_session(db_session, "case_job_ok")
+    queue = ScoringJobQueue(workers=1, session_factory=session_factory)
+    pushed = []
+
+    async def listener(session_id, payload):
+        pushed.append((session_id, payload))
+    queue.add_listener(listener)
+
+    job = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死")
+    assert job.status == "pending"
+
+    # 同一会话重复提交返回同一任务
+    again = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死")
+    assert again.job_id == job.job_id
+
+    job_pk = await queue.claim()
+    assert job_pk == job.id
+    assert await queue.claim() is None
+
+    await queue.run_job(job_pk)
+    await _drain(queue)
+
+    async with session_factory() as db:
+        stored = await queue.get_job(db, job.job_id)
+        assert stored.status == "completed"
+        assert stored.session_score_id is not None
+        chat_session = await db.get(ChatSession, session.id)
+        assert chat_session.status == SessionStatus.COMPLETED
+        assert chat_session.total_score is not None
+
+    assert pushed[0][0] == session.session_id
+    assert pushed[0][1]["status"] == "completed"
+    assert pushed[0][1]["result"]["scores"]["diagnosis"]["accuracy"] == "correct"
+
+
+@pytest.mark.asyncio
+async def test_resubmit_with_different_diagnosis_rejected(session_factory, db_session):
+    """首次提交为准：改交不同诊断不会被静默忽略"""
+    session = await _create_session(db_session, "case_job_resubmit")
+    queue = ScoringJobQueue(workers=1, session_factory=session_factory)
+
+    job = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死", "胸痛三小时")
+    again = await queue.enqueue(db_session, session.id, session.user_id, " 急性心肌梗死", "胸痛三小时")
+    assert again.job_id == job.job_id
+
+    with pytest.raises(ScoringJobConflictError) as exc:
+        await queue.enqueue(db_session, session.id, session.user_id, "心绞痛", "胸痛三小时")
+    assert exc.value.job.job_id == job.job_id
+    with pytest.raises(ScoringJobConflictError):
+        await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死", "另一推理")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_enqueue_creates_one_job(session_factory, db_session, monkeypatch):
+    """并发的重复提交都没查到已有任务时，唯一索引只允许一个入队"""
+    session = await _create_session(db_session, "case_job_race")
+    queue = ScoringJobQueue(workers=1, session_factory=session_factory)
+    job = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死")
+
+    # 模拟另一请求在本请求查询之后、插入之前已入队
+    original = queue._active_job
+    misses = []
+
+    async def stale_active_job(db, session_id):
+        if not misses:
+            misses.append(session_id)
+            return None
+        return await original(db, session_id)
+    monkeypatch.setattr(queue, "_active_job", stale_active_job)
+
+    again = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死")
+    assert again.job_id == job.job_id
+
+    misses.clear()
+    with pytest.raises(ScoringJobConflictError):
+        await queue.enqueue(db_session, session.id, session.user_id, "心绞痛")
+
+    async with session_factory() as db:
+        jobs = (await db.execute(select(ScoringJob))).scalars().all()
+        assert [j.job_id for j in jobs] == [job.job_id]
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_reclaimed(session_factory, db_session):
+    """进程崩溃遗留的 running 任务在租约过期后可被重新领取"""
+    session = await _create_session(db_session, "case_job_lease")
+    queue = ScoringJobQueue(workers=1, session_factory=session_factory)
+
+    job = await queue.enqueue(db_session, session.id, session.user_id, "心绞痛")
+    assert await queue.claim() == job.id
+    assert await queue.claim() is None
+
+    async with session_factory() as db:
+        stored = await db.get(ScoringJob, job.id)
+        stored.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        await db.commit()
+
+    assert await queue.claim() == job.id
+
+
+@pytest.mark.asyncio
+async def test_failed_job_retries_then_fails(session_factory, db_session, monkeypatch):
+    session = await _create_session(db_session, "case_job_fail")
+    queue = ScoringJobQueue(workers=1, max_attempts=2, session_factory=session_factory)
+
+    async def broken(db, job):
+        raise RuntimeError("评分服务不可用")
+    monkeypatch.setattr(scoring_jobs, "process_scoring_job", broken)
+
+    job = await queue.enqueue(db_session, session.id, session.user_id, "心绞痛")
+
+    await queue.run_job(await queue.claim())
+    async with session_factory() as db:
+        assert (await db.get(ScoringJob, job.id)).status == "pending"
+
+    await queue.run_job(await queue.claim())
+    async with session_factory() as db:
+        stored = await db.get(ScoringJob, job.id)
+        assert stored.status == "failed"
+        assert stored.error == "评分服务不可用"
+
+
+@pytest.mark.asyncio
+async def test_lease_renewed_while_running(session_factory, db_session, monkeypatch):
+    """评分耗时超过租约时长时续约，任务不会被其他工作者重新领取"""
+    session = await _create_session(db_session, "case_job_heartbeat")
+    queue = ScoringJobQueue(workers=1, lease_seconds=0.3, session_factory=session_factory)
+    claimed_again = []
+
+    async def slow(db, job):
+        await asyncio.sleep(0.5)
+        claimed_again.append(await queue.claim())
+        return {}
+    monkeypatch.setattr(scoring_jobs, "process_scoring_job", slow)
+
+    job = await queue.enqueue(db_session, session.id, session.user_id, "心绞痛")
+    await queue.run_job(await queue.claim())
+
+    assert claimed_again == [None]
+    async with session_factory() as db:
+        assert (await db.get(ScoringJob, job.id)).status == "completed"
+
+
+@pytest.mark.asyncio
+async def test_result_not_written_after_lease_lost(session_factory, db_session, monkeypatch):
+    """租约过期被重新领取后，原执行者不覆盖任务状态、不推送结果"""
+    session = await _create_session(db_session, "case_job_lost")
+    queue = ScoringJobQueue(workers=1, session_factory=session_factory)
+    pushed = []
+
+    async def listener(session_id, payload):
+        pushed.append(payload)
+    queue.add_listener(listener)
+
+    async def reclaimed(db, job):
+        # 模拟租约过期后另一工作者领取了任务
+        job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        await db.commit()
+        assert await queue.claim() == job.id
+        return {}
+    monkeypatch.setattr(scoring_jobs, "process_scoring_job", reclaimed)
+
+    job = await queue.enqueue(db_session, session.id, session.user_id, "心绞痛")
+    await queue.run_job(await queue.claim())
+    await _drain(queue)
+
+    async with session_factory() as db:
+        stored = await db.get(ScoringJob, job.id)
+        assert (stored.status, stored.attempts) == ("running", 2)
+    assert pushed == []
+
+
+async def _drain(queue):
+    """等待通知任务发送完毕"""
+    await asyncio.gather(*queue._notifications)
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_run_job_error(session_factory, db_session, monkeypatch):
+    """run_job 本身的数据库操作出错时，工作协程释放租约并继续运行"""
+    session = await _create_session(db_session, "case_job_crash")
+    queue = ScoringJobQueue(workers=1, poll_interval=0.05, session_factory=session_factory)
+
+    original_load = queue._load
+    calls = []
+
+    async def flaky_load(db, job_pk):
+        calls.append(job_pk)
+        if len(calls) == 1:
+            raise RuntimeError("数据库连接中断")
+        return await original_load(db, job_pk)
+    monkeypatch.setattr(queue, "_load", flaky_load)
+
+    # 测试库所有会话共用一个连接，等待完成通知而不是轮询任务表
+    done = asyncio.Event()
+    pushed = []
+
+    async def listener(session_id, payload):
+        pushed.append(payload)
+        done.set()
+    queue.add_listener(listener)
+
+    job = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死")
+    await queue.start()
+    try:
+        await asyncio.wait_for(done.wait(), timeout=5)
+    finally:
+        await queue.stop()
+
+    # 第一次执行出错后任务被放回队列，同一工作协程再次领取并完成
+    assert pushed[0]["job_id"] == job.job_id
+    assert pushed[0]["status"] == "completed"
+    assert calls == [job.id, job.id]
+
+
+@pytest.mark.asyncio
+async def test_score_job_visible_to_owner_and_teachers_only(session_factory, db_session, monkeypatch):
+    from fastapi import HTTPException
+    from app.api.chat import get_score_job
+
+    session = await _create_session(db_session, "case_job_auth")
+    queue = ScoringJobQueue(workers=1, session_factory=session_factory)
+    monkeypatch.setattr(scoring_jobs, "_scoring_job_queue", queue)
+    job = await queue.enqueue(db_session, session.id, session.user_id, "急性心肌梗死")
+
+    other = User(username="student_other", role="STUDENT")
+    teacher = User(username="teacher_auth", role="TEACHER")
+    db_session.add_all([other, teacher])
+    await db_session.commit()
+    owner = await db_session.get(User, session.user_id)
+
+    assert (await get_score_job(job.job_id, current_user=owner, db=db_session))["job_id"] == job.job_id
+    assert (await get_score_job(job.job_id, current_user=teacher, db=db_session))["status"] == "pending"
+    with pytest.raises(HTTPException) as exc:
+        await get_score_job(job.job_id, current_user=other, db=db_session)
+    assert exc.value.status_code == 403
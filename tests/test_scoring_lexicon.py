@@ -0,0 +1,79 @@
+"""
+评分词表测试
+"""
+import json
+import re
+
+from app.core.incremental_scoring import IncrementalScorer
+from app.core.scoring_engine import ScoringEngine
+from app.core.scoring_lexicon import (
+    ScoringLexicon, LexiconLoader,
+    DEFAULT_ETIQUETTE_PATTERNS, DEFAULT_POLITE_PATTERNS, DEFAULT_EMPATHY_PATTERNS, DEFAULT_SYMPTOM_DIMENSIONS
+)
+
+
+CASE_DATA = {
+    "standard_diagnosis": "急性心肌梗死",
+    "differential_diagnosis": ["心绞痛", "主动脉夹层"],
+    "key_questions": ["疼痛的性质和部位", "持续时间", "既往心脏病史", "吸烟饮酒史"],
+}
+
+STUDENT = [
+    "您好，请问您哪里不舒服？", "疼痛持续多长时间了？", "是什么样的疼痛，压榨样还是刺痛？",
+    "我理解您很担心，别急，慢慢说", "以前有没有心脏病、高血压？", "疼痛有没有向左肩放射",
+    "还有其他不舒服吗，比如出汗、恶心？", "麻烦说一下疼痛的程度，几分？", "平时抽烟喝酒吗",
+    "休息后能缓解吗", "谢谢您的配合", "不好意思，再确认一下，是今天早上开始的吗？",
+]
+PATIENT = ["胸口疼，像压了块石头。", "三个小时了。", "以前医生说过可能是心绞痛", "没有了。", "出了一身冷汗。"]
+
+
+def test_combined_patterns_match_per_pattern_search():
+    lexicon = ScoringLexicon()
+    families = {
+        "etiquette": DEFAULT_ETIQUETTE_PATTERNS,
+        "polite": DEFAULT_POLITE_PATTERNS,
+        "empathy": DEFAULT_EMPATHY_PATTERNS,
+    }
+    for text in STUDENT + PATIENT + ["", "请问"]:
+        for family, patterns in families.items():
+            assert lexicon.matches(family, text) == any(re.search(p, text) for p in patterns)
+
+        expected = {
+            i for i, (_, keywords) in enumerate(DEFAULT_SYMPTOM_DIMENSIONS)
+            if any(kw in text.lower() for kw in keywords)
+        }
+        assert lexicon.symptom_hits([text]) == (expected if text else set())
+
+
+def test_hot_reload(tmp_path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps({"empathy": ["辛苦"]}, ensure_ascii=False), encoding="utf-8")
+    loader = LexiconLoader(str(path), reload_seconds=0)
+
+    lexicon = loader.get()
+    assert lexicon.matches("empathy", "您辛苦了")
+    assert not lexicon.matches("empathy", "我理解")
+    # 未配置的类别使用默认模式
+    assert lexicon.matches("polite", "请问")
+    assert loader.get() is lexicon
+
+    # 文件修改后重新编译
+    path.write_text(json.dumps({"empathy": ["理解"]}, ensure_ascii=False), encoding="utf-8")
+    updated = loader.reload(force=True)
+    assert updated.matches("empathy", "我理解") and updated.version != lexicon.version
+    assert loader.reloads == 2
+
+    # 文件损坏时保留当前词表
+    path.write_text("{bad json", encoding="utf-8")
+    assert loader.reload(force=True) is updated
+
+
+def test_incremental_state_rejected_after_lexicon_change():
+    scorer = IncrementalScorer(CASE_DATA, ScoringEngine(lexicon=ScoringLexicon()))
+    scorer.add_message("student", "我理解您很担心")
+    state = scorer.to_state()
+
+    assert IncrementalScorer.from_state(state, CASE_DATA, ScoringEngine(lexicon=ScoringLexicon())) is not None
+    reloaded = ScoringEngine(lexicon=ScoringLexicon({"empathy": ["辛苦"]}, version="custom"))
+    assert IncrementalScorer.from_state(state, CASE_DATA, reloaded) is None
+
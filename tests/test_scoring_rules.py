@@ -0,0 +1,88 @@
+"""
+评分规则注册表测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core import scoring_engine
+from app.models.database import User, Case, ChatSession, ScoringRule
+from app.services import scoring_service
+from app.services.scoring_rules import ScoringRuleRegistry
+from app.services.scoring_service import ScoringService
+
+
+class FakeBaichuan:
+    async def evaluate_student_performance(self, case_data, conversation_history, student_diagnosis):
+        return {"scores": {}, "comments": {}, "suggestions": [], "overall_comment": ""}
+
+
+@pytest.mark.asyncio
+async def test_default_engine_without_rules(db_session):
+    registry = ScoringRuleRegistry(ttl_seconds=60)
+    engine, rule_id = await registry.get_engine(db_session)
+    assert rule_id is None
+    assert engine is registry.default_engine
+
+
+@pytest.mark.asyncio
+async def test_active_rule_cached_until_refresh(db_session):
+    now = datetime.utcnow()
+    old = ScoringRule(name="旧规则", inquiry_weight=0.4, is_active=True, created_at=now - timedelta(days=1))
+    new = ScoringRule(name="新规则", inquiry_weight=0.6, diagnosis_weight=0.2, is_active=True, created_at=now)
+    disabled = ScoringRule(name="停用规则", is_active=False, created_at=now + timedelta(days=1))
+    db_session.add_all([old, new, disabled])
+    await db_session.commit()
+
+    registry = ScoringRuleRegistry(ttl_seconds=60)
+    engine, rule_id = await registry.get_engine(db_session)
+    assert rule_id == new.id
+    assert engine.weights["inquiry"] == pytest.approx(0.6)
+
+    # 缓存有效期内不再查询数据库
+    again, _ = await registry.get_engine(db_session)
+    assert again is engine
+    old_engine, old_id = await registry.get_engine(db_session, old.id)
+    assert old_id == old.id and old_engine is not engine
+    assert registry.refreshes == 1
+    assert registry.builds == 3
+
+    # 规则修改后刷新：只重建修改过的规则
+    new.inquiry_weight = 0.5
+    new.updated_at = now + timedelta(minutes=1)
+    await db_session.commit()
+    registry.invalidate()
+
+    engine, _ = await registry.get_engine(db_session)
+    assert engine.weights["inquiry"] == pytest.approx(0.5)
+    assert (await registry.get_engine(db_session, old.id))[0] is old_engine
+    assert registry.builds == 4
+
+    # 不存在的规则回退到启用的规则
+    assert (await registry.get_engine(db_session, 999))[1] == new.id
+
+
+@pytest.mark.asyncio
+async def test_scoring_service_uses_active_rule(db_session, monkeypatch):
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: FakeBaichuan())
+    registry = ScoringRuleRegistry(ttl_seconds=60)
+    monkeypatch.setattr(scoring_service, "get_scoring_rule_registry", lambda: registry)
+
+    user = User(username="student_rule", role="STUDENT")
+    case = Case(case_id="case_rule", title="胸痛待查", patient_info={}, chief_complaint={}, symptoms={})
+    rule = ScoringRule(
+        name="只看沟通", inquiry_weight=0, diagnosis_weight=0, communication_weight=1, is_active=True
+    )
+    db_session.add_all([user, case, rule])
+    await db_session.flush()
+    session = ChatSession(session_id="s_rule", user_id=user.id, case_id=case.id)
+    db_session.add(session)
+    await db_session.commit()
+
+    history = [{"role": "student", "content": "您好，请问哪里不舒服？"}]
+    score = await ScoringService(db_session).score_session(
+        session.id, history, "急性心肌梗死", {"standard_diagnosis": "急性心肌梗死"}
+    )
+
+    assert score.scoring_rule_id == rule.id
+    assert float(score.final_score) == pytest.approx(float(score.communication_total_score))
@@ -0,0 +1,102 @@
+"""
+评分服务测试
+"""
+import asyncio
+import functools
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.core import scoring_engine
+from app.models.database import (
+    User, Case, ChatSession, SessionScore, ScoringRule, LearningRecord, KnowledgePoint,
+    StudentKnowledgeMastery
+)
+from app.services import scoring_service
+from app.services.scoring_cache import ScoringCache
+from app.services.scoring_rules import ScoringRuleRegistry
+from app.services.scoring_service import ScoringService
+
+
+CASE_DATA = {
+    "case_id": "case_fusion",
+    "category": "心内科",
+    "standard_diagnosis": "急性心肌梗死",
+    "key_questions": ["疼痛 部位", "持续 时间"],
+}
+
+HISTORY = [
+    {"role": "student", "content": "您好，请问哪里疼痛？"},
+    {"role": "patient", "content": "胸口疼。"},
+    {"role": "student", "content": "持续多长时间了？"},
+    {"role": "patient", "content": "三个小时了。"},
+]
+
+
+class SlowBaichuan:
+    """超过截止时间才返回评估，问诊逻辑给低分"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def evaluate_student_performance(self, case_data, conversation_history, student_diagnosis):
+        await self.release.wait()
+        return {
+            "scores": {"inquiry_logic": 1},
+            "comments": {}, "suggestions": [], "overall_comment": "问诊缺乏条理"
+        }
+
+
+@pytest.mark.asyncio
+async def test_late_fusion_revises_learning_and_mastery(session_factory, db_session, monkeypatch):
+    baichuan = SlowBaichuan()
+    monkeypatch.setattr(scoring_engine, "get_baichuan_service", lambda: baichuan)
+    monkeypatch.setattr(settings, "SCORING_LLM_DEADLINE", 0.05)
+    monkeypatch.setattr(scoring_service, "get_scoring_rule_registry", lambda: ScoringRuleRegistry(ttl_seconds=60))
+    monkeypatch.setattr(scoring_service, "get_scoring_cache", lambda: ScoringCache())
+    monkeypatch.setattr(
+        scoring_service, "apply_late_fusion",
+        functools.partial(scoring_service.apply_late_fusion, session_factory=session_factory)
+    )
+
+    user = User(username="student_fusion", role="STUDENT")
+    case = Case(case_id="case_fusion", title="胸痛待查", patient_info={}, chief_complaint={}, symptoms={})
+    point = KnowledgePoint(code="CARDIO-001", name="急性冠脉综合征")
+    # 只看问诊：规则评分及格，百川的问诊逻辑低分使融合后不及格
+    rule = ScoringRule(
+        name="只看问诊", inquiry_weight=1, diagnosis_weight=0, communication_weight=0, is_active=True
+    )
+    db_session.add_all([user, case, point, rule])
+    await db_session.flush()
+    # 之前做过一次且及格
+    db_session.add(StudentKnowledgeMastery(
+        user_id=user.id, knowledge_point_id=point.id, mastery_rate=100, correct_count=1, total_attempts=1
+    ))
+    session = ChatSession(session_id="s_fusion", user_id=user.id, case_id=case.id)
+    db_session.add(session)
+    await db_session.commit()
+
+    score = await ScoringService(db_session).score_session(session.id, HISTORY, "急性心肌梗死", CASE_DATA)
+    assert score.passed
+
+    # 规则评分与学习记录、掌握度同时写入
+    async with session_factory() as db:
+        record = (await db.execute(select(LearningRecord))).scalar_one()
+        assert record.knowledge_points_mastered == ["心内科"]
+        mastery = (await db.execute(select(StudentKnowledgeMastery))).scalar_one()
+        assert (mastery.correct_count, mastery.total_attempts) == (2, 2)
+
+    baichuan.release.set()
+    await asyncio.gather(*scoring_service._pending_fusions)
+
+    async with session_factory() as db:
+        fused = await db.get(SessionScore, score.id)
+        assert not fused.passed
+        record = (await db.execute(select(LearningRecord))).scalar_one()
+        assert float(record.score) == pytest.approx(float(fused.final_score))
+        assert record.knowledge_points_mastered == []
+        assert record.knowledge_points_weak == ["心内科"]
+        mastery = (await db.execute(select(StudentKnowledgeMastery))).scalar_one()
+        assert (mastery.correct_count, mastery.total_attempts) == (1, 2)
+        assert float(mastery.mastery_rate) == pytest.approx(50)
@@ -0,0 +1,63 @@
+"""
+中文分词测试
+"""
+from app.core.segmenter import (
+    Lexicon, MaxMatchSegmenter, WhitespaceSegmenter, SegmentCache, get_segmenter, segment, get_segment_cache
+)
+
+
+def make_segmenter(*words):
+    return MaxMatchSegmenter(Lexicon(set(words), "test"))
+
+
+def test_bidirectional_max_match():
+    segmenter = make_segmenter("的", "和", "疼痛", "性质", "部位", "既往", "心脏", "心脏病", "病史")
+    assert segmenter.cut("疼痛的性质和部位") == ["疼痛", "的", "性质", "和", "部位"]
+    # 正向: 既往/心脏病/史，逆向: 既往/心脏/病史 -> 单字少的逆向结果
+    assert segmenter.cut("既往心脏病史") == ["既往", "心脏", "病史"]
+
+
+def test_unknown_chars_merged_and_mixed_text():
+    segmenter = make_segmenter("的", "疼痛")
+    assert segmenter.cut("胸闷的疼痛") == ["胸闷", "的", "疼痛"]
+    assert segmenter.cut("CT检查，疼痛 3天") == ["CT", "检查", "疼痛", "3", "天"]
+
+
+def test_lexicon_load(tmp_path):
+    path = tmp_path / "lexicon.txt"
+    path.write_text("# 注释\n疼痛\n\n部位\n", encoding="utf-8")
+    lexicon = Lexicon.load(path)
+    assert lexicon.words == {"疼痛", "部位"}
+    assert lexicon.max_len == 2
+
+    path.write_text("# 注释\n疼痛\n部位\n性质\n", encoding="utf-8")
+    assert Lexicon.load(path).version != lexicon.version
+
+
+def test_segment_cached_per_version():
+    cache = get_segment_cache()
+    first = make_segmenter("疼痛")
+    second = MaxMatchSegmenter(Lexicon({"疼"}, "other"))
+
+    assert segment("疼痛部位", first) == ["疼痛", "部位"]
+    hits = cache.hits
+    assert segment("疼痛部位", first) == ["疼痛", "部位"]
+    assert cache.hits == hits + 1
+    # 词典版本不同，不复用缓存结果
+    assert segment("疼痛部位", second) == ["疼", "痛部位"]
+
+
+def test_segment_cache_lru():
+    cache = SegmentCache(maxsize=2)
+    cache.put(("a", "v"), ("a",))
+    cache.put(("b", "v"), ("b",))
+    cache.get(("a", "v"))
+    cache.put(("c", "v"), ("c",))
+    assert cache.get(("b", "v")) is None
+    assert cache.get(("a", "v")) == ("a",)
+
+
+def test_default_segmenter_uses_medical_lexicon():
+    segmenter = get_segmenter()
+    assert not isinstance(segmenter, WhitespaceSegmenter)
+    assert segmenter.cut("既往高血压糖尿病病史") == ["既往", "高血压", "糖尿病", "病史"]
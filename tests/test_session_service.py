@@ -0,0 +1,95 @@
+"""会话服务测试"""
+import pytest
+from sqlalchemy import event
+
+from app.models.database import User
+from app.services.session_service import SessionService
+
+
+CASE_DATA = {"title": "胸痛待查", "standard_diagnosis": "急性心肌梗死"}
+
+
+async def _create_session(session_factory):
+    async with session_factory() as db:
+        user = User(username="student_session", role="STUDENT")
+        db.add(user)
+        await db.flush()
+
+        session = await SessionService(db).create_session(user.id, "case_session", CASE_DATA)
+        await db.commit()
+        return session.session_id
+
+
+class TestSessionService:
+    """会话服务测试"""
+
+    @pytest.mark.asyncio
+    async def test_turn_loads_session_row_once(self, session_factory):
+        """测试一轮对话只查询一次会话行，对话历史按窗口读取"""
+        session_id = await _create_session(session_factory)
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        async with session_factory() as db:
+            sync_engine = db.bind.sync_engine
+            event.listen(sync_engine, "before_cursor_execute", record)
+            try:
+                service = SessionService(db)
+                session = await service.get_session_by_id(session_id)
+                await service.add_message(session_id, "student", "哪里不舒服？")
+                history = await service.get_conversation_history(session_id, limit=20)
+                await service.add_message(session_id, "patient", "胸口疼。")
+                await service.save_scores(session_id, total_score=80)
+                await db.commit()
+            finally:
+                event.remove(sync_engine, "before_cursor_execute", record)
+
+        selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+        session_selects = [s for s in selects if "FROM chat_sessions" in s]
+        message_selects = [s for s in selects if "FROM messages" in s]
+        assert len(session_selects) == 1
+        assert len(message_selects) == 1 and "LIMIT" in message_selects[0]
+        # 不再改写 conversation_history JSON 列
+        assert not any("conversation_history" in s for s in statements if s.lstrip().upper().startswith("UPDATE"))
+        assert session.case.case_id == "case_session"
+        assert len(history) == 1
+
+    @pytest.mark.asyncio
+    async def test_history_window(self, session_factory):
+        """测试按窗口读取最近的对话历史（正序）"""
+        session_id = await _create_session(session_factory)
+
+        async with session_factory() as db:
+            service = SessionService(db)
+            for i in range(6):
+                await service.add_message(session_id, "student" if i % 2 == 0 else "patient", f"消息{i}")
+            await db.commit()
+
+            window = await service.get_conversation_history(session_id, limit=3)
+            full = await service.get_conversation_history(session_id)
+
+        assert [h["content"] for h in window] == ["消息3", "消息4", "消息5"]
+        assert len(full) == 6
+
+    @pytest.mark.asyncio
+    async def test_history_and_messages_persisted(self, session_factory):
+        """测试对话历史在多轮追加后持久化"""
+        session_id = await _create_session(session_factory)
+
+        for role, content in [("student", "哪里不舒服？"), ("patient", "胸口疼。"), ("student", "多久了？")]:
+            async with session_factory() as db:
+                await SessionService(db).add_message(session_id, role, content)
+                await db.commit()
+
+        async with session_factory() as db:
+            service = SessionService(db)
+            history = await service.get_conversation_history(session_id)
+            messages = await service.get_session_messages(session_id)
+            session = await service.get_session_by_id(session_id)
+
+        assert [h["content"] for h in history] == ["哪里不舒服？", "胸口疼。", "多久了？"]
+        assert [m.content for m in messages] == ["哪里不舒服？", "胸口疼。", "多久了？"]
+        assert session.turn_count == 2
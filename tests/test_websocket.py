@@ -0,0 +1,49 @@
+"""
+WebSocket 消息处理测试
+"""
+import pytest
+
+from app.api import websocket
+from app.models.database import User
+from app.services.session_service import SessionService
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+class MissingCaseStore:
+    """病例已被删除"""
+
+    async def get_case(self, db, case_id):
+        return None
+
+
+class FakeChatEngine:
+    async def end_session(self, session_id, conversation_history, case_data):
+        self.case_data = case_data
+        return {"completeness": {"coverage_rate": 0.5}, "turn_count": 1}
+
+
+@pytest.mark.asyncio
+async def test_end_session_falls_back_when_case_missing(db_session, monkeypatch):
+    user = User(username="student_ws", role="STUDENT")
+    db_session.add(user)
+    await db_session.flush()
+    session = await SessionService(db_session).create_session(user.id, "case_ws_missing", {"title": "胸痛待查"})
+    await db_session.commit()
+
+    engine = FakeChatEngine()
+    monkeypatch.setattr(websocket, "get_case_store", lambda: MissingCaseStore())
+    monkeypatch.setattr(websocket, "get_chat_engine", lambda: engine)
+
+    ws = FakeWebSocket()
+    await websocket.handle_end_session(ws, session.session_id, {"diagnosis": "心绞痛"}, db_session, user)
+
+    assert engine.case_data["case_id"] == "case_ws_missing"
+    assert ws.sent[-1]["type"] == "session_ended"
+    assert ws.sent[-1]["feedback"]["student_diagnosis"] == "心绞痛"